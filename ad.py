@@ -0,0 +1,158 @@
+"""Typed ad record with the display strings parsed once.
+
+Snapshots, reports and history store ads as dicts of display strings
+("132.000 €", "85 m2", "Beograd | Opština Zvezdara | ..."). Ad keeps those
+strings untouched, so Ad.from_dict(d).to_dict() == d including key order,
+and adds the parsed values next to them:
+
+    price_eur      132000            (None if not a plain number)
+    area_m2        85.0
+    price_per_m2   1552.9...         (None without both price and area)
+    municipality   "Opština Zvezdara"
+    published      datetime.date(2026, 5, 11)
+
+An Ad also answers ad["price"], ad.get("plot") and ad["plot"] = ..., so
+code written against the dicts keeps working while it is in flight.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import lru_cache
+import re
+import sys
+import unicodedata
+
+FIELDS = (
+    "title", "location", "kvadratura", "price", "price_by_surface",
+    "publish_date", "advertiser", "id", "url", "plot",
+)
+
+AREA_RX = re.compile(r"[\d.]+")
+
+_key_orders = {}
+
+
+def parse_price(price):
+    """'132.000 €' -> 132000; None unless it is a plain euro amount."""
+    if not price:
+        return None
+    try:
+        return int(price.replace("€", "").replace(".", "").replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def change_pct(price, old_price):
+    """'133.000 €' after '139.000 €' -> -4.3; None unless both are euro amounts."""
+    new, old = parse_price(price), parse_price(old_price)
+    if new is None or not old:
+        return None
+    return round((new - old) * 100 / old, 1)
+
+
+def parse_area(kvadratura):
+    """'85 m2' (as normalized by listing_parser) -> 85.0."""
+    m = AREA_RX.match(kvadratura or "")
+    try:
+        return float(m.group(0)) if m else None
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def municipality(location):
+    """Second ' | ' part of the location, '' if there is none."""
+    parts = [p.strip() for p in location.split('|')] if location else []
+    return sys.intern(parts[1]) if len(parts) >= 2 else ''
+
+
+@lru_cache(maxsize=4096)
+def area_key(name):
+    """'Opština Zvezdara', 'zvezdara' and 'Zvezdara' -> 'zvezdara'."""
+    name = unicodedata.normalize("NFKD", (name or "").replace("đ", "dj").replace("Đ", "Dj"))
+    name = "".join(c for c in name if not unicodedata.combining(c)).lower().strip()
+    for prefix in ("gradska opstina ", "opstina "):
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+@lru_cache(maxsize=4096)
+def parse_publish_date(text):
+    """'11.05.2026.' -> date(2026, 5, 11)."""
+    try:
+        return datetime.strptime((text or "").rstrip("."), "%d.%m.%Y").date()
+    except ValueError:
+        return None
+
+
+@dataclass(slots=True, eq=False)
+class Ad:
+    title: str = None
+    location: str = None
+    kvadratura: str = None
+    price: str = None
+    price_by_surface: str = None
+    publish_date: str = None
+    advertiser: str = None
+    id: str = None
+    url: str = None
+    plot: str = None
+    extra: dict = None
+    keys_: tuple = ()
+    price_eur: int = field(default=None, init=False)
+    area_m2: float = field(default=None, init=False)
+    price_per_m2: float = field(default=None, init=False)
+    municipality: str = field(default='', init=False)
+    published: date = field(default=None, init=False)
+
+    def __post_init__(self):
+        self._derive()
+
+    def _derive(self):
+        self.price_eur = parse_price(self.price)
+        self.area_m2 = parse_area(self.kvadratura)
+        self.price_per_m2 = (
+            self.price_eur / self.area_m2 if self.price_eur and self.area_m2 else None)
+        self.municipality = municipality(self.location)
+        self.published = parse_publish_date(self.publish_date)
+
+    @classmethod
+    def from_dict(cls, d):
+        keys = tuple(d)
+        keys = _key_orders.setdefault(keys, keys)  # share one tuple per key order
+        extra = {k: v for k, v in d.items() if k not in FIELDS} or None
+        # The same titles, locations and prices recur day after day.
+        fields = {k: sys.intern(v) if type(v) is str else v for k, v in d.items() if k in FIELDS}
+        return cls(**fields, extra=extra, keys_=keys)
+
+    def to_dict(self):
+        return {k: self[k] for k in self.keys_}
+
+    @property
+    def key(self):
+        """The id as every comparison in the pipeline uses it."""
+        return str(self.id).strip()
+
+    # --- dict-style access ----------------------------------------------------
+
+    def __getitem__(self, k):
+        if k not in self.keys_:
+            raise KeyError(k)
+        return getattr(self, k) if k in FIELDS else self.extra[k]
+
+    def get(self, k, default=None):
+        return self[k] if k in self.keys_ else default
+
+    def __contains__(self, k):
+        return k in self.keys_
+
+    def __setitem__(self, k, value):
+        if k in FIELDS:
+            setattr(self, k, value)
+        else:
+            self.extra = {**(self.extra or {}), k: value}
+        if k not in self.keys_:
+            keys = self.keys_ + (k,)
+            self.keys_ = _key_orders.setdefault(keys, keys)
+        if k in ("price", "kvadratura", "location", "publish_date"):
+            self._derive()
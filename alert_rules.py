@@ -0,0 +1,219 @@
+"""Alert rules: route the day's new ads and price changes to more chats.
+
+alert-rules.json is a list of rules. Every condition is optional, and a rule
+matches an ad when all of its conditions hold:
+
+    [
+      {"name": "zvezdara-cheap", "chat": "-1001234567890",
+       "municipality": ["Zvezdara", "Voždovac"], "max_price": 150000,
+       "max_price_per_m2": 1500, "min_plot_m2": 300},
+      {"name": "big-cuts", "chat": "-1009876543210", "min_drop_pct": 10},
+      {"name": "novi-sad", "chat": "@novisad_kuce", "search": "novi-sad-stanovi", "on": "added"}
+    ]
+
+- municipality: a name or a list of names, compared the way ad.area_key
+  compares them ("Opština Zvezdara" is "zvezdara");
+- min_price / max_price: euros. max_price_per_m2: euros per m² of house;
+- min_plot_m2: the plot size enrich_plot_sizes put on the ad;
+- min_drop_pct: only price changes, down by at least this much;
+- on: "added" and/or "price_changed" (default both). search: names from
+  searches.json (default all).
+
+The rules are compiled once into a RuleIndex keyed by (municipality, price
+band of PRICE_BAND euros). An ad is checked only against the rules filed
+under its own municipality and band, plus the rules that restrict neither.
+The cost per ad therefore stays about the same as rules are added.
+
+send_telegram sends each chat its matches after the full report. The
+daemon does the same for its alerts.
+"""
+import html
+import itertools
+import json
+import os
+import re
+from collections import defaultdict
+
+from ad import area_key, change_pct, municipality, parse_area, parse_price
+from report_format import render_telegram_blocks
+
+ALERT_RULES_FILE = "alert-rules.json"
+PRICE_BAND = 10000  # euros per index bucket
+MAX_BANDS = 100  # a wider price range is filed as unbounded and checked exactly
+KINDS = ("added", "price_changed")
+CONDITIONS = ("municipality", "min_price", "max_price", "max_price_per_m2",
+              "min_plot_m2", "min_drop_pct", "on", "search")
+NUMBERS = ("min_price", "max_price", "max_price_per_m2", "min_plot_m2", "min_drop_pct")
+
+PLOT_RX = re.compile(r"([\d.,]+)\s*(ar|ha|m²|m2)\b")
+PLOT_UNIT_M2 = {"ar": 100, "ha": 10000}
+
+
+def plot_m2(plot):
+    """format_plot's '8.2 ar (~820 m²)' -> 820.0, '1.200 m²' -> 1200.0, '1 ha' -> 10000.0."""
+    m = PLOT_RX.search(plot or "")
+    if not m:
+        return None
+    value, unit = m.groups()
+    try:
+        if unit in PLOT_UNIT_M2:
+            return round(float(value.replace(",", ".")) * PLOT_UNIT_M2[unit], 2)
+        return float(value.replace(".", "").replace(",", "."))  # m², with thousands dots
+    except ValueError:
+        return None
+
+
+def _names(value):
+    if value is None:
+        return None
+    return frozenset([value] if isinstance(value, str) else value)
+
+
+def _at_least(value, bound):
+    return bound is None or (value is not None and value >= bound)
+
+
+def _at_most(value, bound):
+    return bound is None or (value is not None and value <= bound)
+
+
+class Change:
+    """One added ad or price change, with what the rules look at parsed once."""
+
+    __slots__ = ("kind", "ad", "old_price", "search", "area", "price", "price_per_m2", "plot_m2", "drop_pct")
+
+    def __init__(self, kind, ad, search=None, old_price=None):
+        self.kind = kind
+        self.ad = ad
+        self.old_price = old_price
+        self.search = search
+        self.area = area_key(municipality(ad.get("location")))
+        self.price = parse_price(ad.get("price"))
+        house = parse_area(ad.get("kvadratura"))
+        self.price_per_m2 = self.price / house if self.price and house else None
+        self.plot_m2 = plot_m2(ad.get("plot"))
+        pct = change_pct(ad.get("price"), old_price) if old_price is not None else None
+        self.drop_pct = -pct if pct is not None else None
+
+
+class Rule:
+    def __init__(self, name, chat, municipality=None, min_price=None, max_price=None,
+                 max_price_per_m2=None, min_plot_m2=None, min_drop_pct=None, on=KINDS, search=None):
+        self.name = name
+        self.chat = str(chat)
+        for key, value in zip(NUMBERS, (min_price, max_price, max_price_per_m2, min_plot_m2, min_drop_pct)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"rule {name!r}: {key} must be a number, not {value!r}")
+        names = _names(municipality)
+        self.areas = frozenset(area_key(m) for m in names) if names else None
+        self.min_price = min_price
+        self.max_price = max_price
+        self.max_price_per_m2 = max_price_per_m2
+        self.min_plot_m2 = min_plot_m2
+        self.min_drop_pct = min_drop_pct
+        self.kinds = _names(on) or frozenset(KINDS)
+        if not self.kinds <= set(KINDS):
+            raise ValueError(f"rule {name!r}: 'on' must be among {', '.join(KINDS)}")
+        if min_drop_pct is not None:
+            self.kinds &= {"price_changed"}
+        self.searches = _names(search)
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, chat={self.chat!r})"
+
+    def bands(self):
+        """The price bands this rule can match, or None for all of them."""
+        if self.max_price is None:
+            return None
+        # JSON prices may be floats (150000.0); bands are ints.
+        low, high = int((self.min_price or 0) // PRICE_BAND), int(self.max_price // PRICE_BAND)
+        return range(low, high + 1) if high - low < MAX_BANDS else None
+
+    def matches(self, change):
+        return (change.kind in self.kinds
+                and (self.searches is None or change.search in self.searches)
+                and (self.areas is None or change.area in self.areas)
+                and _at_least(change.price, self.min_price)
+                and _at_most(change.price, self.max_price)
+                and _at_most(change.price_per_m2, self.max_price_per_m2)
+                and _at_least(change.plot_m2, self.min_plot_m2)
+                and _at_least(change.drop_pct, self.min_drop_pct))
+
+
+class RuleIndex:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        # (municipality or None, price band or None) -> rules; every rule is
+        # filed under exactly one of the four keys an ad looks up.
+        self.buckets = defaultdict(list)
+        for rule in self.rules:
+            bands = rule.bands()
+            for area, band in itertools.product(rule.areas or (None,), bands if bands is not None else (None,)):
+                self.buckets[area, band].append(rule)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, change):
+        band = change.price // PRICE_BAND if change.price is not None else None
+        keys = {(change.area, band), (change.area, None), (None, band), (None, None)}
+        return [rule for key in keys for rule in self.buckets.get(key, ())]
+
+    def match(self, changes):
+        """Yield (change, [matching rules]) for every change some rule matches."""
+        for change in changes:
+            rules = [rule for rule in self.candidates(change) if rule.matches(change)]
+            if rules:
+                yield change, rules
+
+    def route(self, added, price_changes, search=None):
+        """{chat: (rule names, added ads, price changes)} for one report.
+
+        `price_changes` is in the price_changes_by_id format, and so are the
+        ones routed to each chat. An ad goes to a chat once however many of
+        its rules match.
+        """
+        changes = itertools.chain(
+            (Change("added", ad, search) for ad in added),
+            (Change("price_changed", c["current"], search, c["previous_price"])
+             for c in price_changes.values()))
+        routed = {}
+        for change, rules in self.match(changes):
+            for chat in dict.fromkeys(rule.chat for rule in rules):
+                names, new_ads, changed = routed.setdefault(chat, ({}, [], {}))
+                names.update(dict.fromkeys(rule.name for rule in rules if rule.chat == chat))
+                if change.kind == "added":
+                    new_ads.append(change.ad)
+                else:
+                    changed[change.ad["id"]] = {"current": change.ad, "previous_price": change.old_price}
+        return {chat: (list(names), new_ads, changed) for chat, (names, new_ads, changed) in routed.items()}
+
+
+def render_alert_blocks(names, added, price_changes, title=None):
+    """The message for one chat: which rules matched, then the matching ads."""
+    header = f"<b>🔔 {html.escape(', '.join(names))}</b>"
+    if title:
+        header += f" · {html.escape(title)}"
+    return itertools.chain([header], render_telegram_blocks(added, price_changes))
+
+
+def load_rules(path=ALERT_RULES_FILE):
+    """The compiled rules in `path`, or None without the file."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    rules = []
+    for spec in config:
+        missing = [k for k in ("name", "chat") if k not in spec]
+        unknown = sorted(set(spec) - {"name", "chat", *CONDITIONS})
+        if missing or unknown:
+            raise ValueError(f"{path}: rule {spec.get('name', len(rules))!r}: "
+                             + "; ".join(filter(None, [missing and f"missing {', '.join(missing)}",
+                                                       unknown and f"unknown {', '.join(unknown)}"])))
+        rules.append(Rule(**spec))
+    names = [r.name for r in rules]
+    duplicates = {n for n in names if names.count(n) > 1}
+    if duplicates:
+        raise ValueError(f"{path}: duplicate rule name(s): {', '.join(sorted(duplicates))}")
+    return RuleIndex(rules)
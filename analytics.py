@@ -0,0 +1,310 @@
+"""Market analytics over the snapshot history, vectorized with NumPy.
+
+    python analytics.py [--window N] [--district NAME]
+
+Every snapshot becomes a few column arrays (ad id, district, price in
+euros, area in m²), one row per unique ad, with the district being the
+municipality the daily sort uses (Ad.municipality). The columns of each day
+are cached in the snapshot store next to the day they came from, so after
+the daily run only the new day is parsed; the rest is read back as-is and
+concatenated into a Market. Price changes come from the price history
+store, which is already indexed.
+
+From there everything is array arithmetic: daily and rolling per-district
+median €/m², time-on-market distributions, price-cut histograms and
+price-cut rates.
+
+NumPy is optional; only this module needs it and the daily run doesn't
+import it.
+"""
+import argparse
+import json
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, see the module docstring
+    np = None
+
+from ad import Ad, area_key
+from daily_diff import unique_by_id
+from price_history import open_history
+from snapshot_store import DATA_DIR, add_missing_columns, open_store
+
+DAY_DTYPE = [("id", "<i8"), ("district", "<i4"), ("price", "<f8"), ("area", "<f8")]
+
+DAYS_LISTED_BINS = (1, 8, 15, 31, 61, 91, 181, 366)
+PRICE_CUT_BINS = (-1.0, -0.2, -0.1, -0.05, -0.02)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_days (
+    date TEXT PRIMARY KEY,
+    ads INTEGER NOT NULL,
+    source_size INTEGER,
+    source_sha1 TEXT,
+    districts TEXT NOT NULL,
+    rows BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def require_numpy():
+    if np is None:
+        raise SystemExit("analytics needs numpy: pip install numpy")
+
+
+# --- per-day columns, cached in the snapshot store ---------------------------
+
+def day_columns(ads):
+    """(district names, structured rows) for one snapshot's ads."""
+    districts = {}
+    rows = []
+    for ad_id, ad in unique_by_id(ads).items():
+        ad = Ad.from_dict(ad)
+        rows.append((
+            int(ad_id) if ad_id.isdigit() else -1,
+            districts.setdefault(ad.municipality, len(districts)),
+            ad.price_eur if ad.price_eur is not None else np.nan,
+            ad.area_m2 if ad.area_m2 is not None else np.nan,
+        ))
+    return list(districts), np.array(rows, dtype=DAY_DTYPE)
+
+
+def cached_columns(store, dates):
+    """{date: (district names, rows)}, computing and caching the days that changed."""
+    store.db.executescript(SCHEMA)
+    add_missing_columns(store.db, "analytics_days", {"source_sha1": "TEXT"})
+    stored = {d: (n, size, sha1) for d, n, size, sha1 in store.db.execute(
+        "SELECT date, ads, source_size, source_sha1 FROM days")}
+    cached = {}
+    for date, n, size, sha1, districts, rows in store.db.execute(
+            "SELECT date, ads, source_size, source_sha1, districts, rows FROM analytics_days"):
+        if stored.get(date) == (n, size, sha1):
+            cached[date] = (json.loads(districts), np.frombuffer(rows, dtype=DAY_DTYPE))
+    missing = [d for d in dates if d not in cached]
+    if missing:
+        with store.db:
+            for date in missing:
+                districts, rows = cached[date] = day_columns(store.day(date))
+                n, size, sha1 = stored[date]
+                store.db.execute(
+                    "INSERT OR REPLACE INTO analytics_days (date, ads, source_size, source_sha1, districts, rows) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (date, n, size, sha1, json.dumps(districts, ensure_ascii=False), rows.tobytes()))
+    return {d: cached[d] for d in dates}
+
+
+class Market:
+    """Every snapshot as flat columns, one row per (day, unique ad), in day order."""
+
+    def __init__(self, dates, districts, day, rows):
+        self.dates = np.array(dates, dtype="datetime64[D]")
+        self.districts = districts
+        self.day = day
+        self.id = rows["id"]
+        self.district = rows["district"]
+        self.price = rows["price"]
+        self.area = rows["area"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.per_m2 = np.where(self.area > 0, self.price / self.area, np.nan)
+
+    def district_index(self, name):
+        """Row of a district, named the way ad.area_key compares names
+        ("Zvezdara" or "Opština Zvezdara")."""
+        try:
+            return [area_key(d) for d in self.districts].index(area_key(name))
+        except ValueError:
+            known = ", ".join(sorted((d for d in self.districts if d), key=area_key))
+            raise ValueError(f"unknown district {name!r}; known districts: {known}") from None
+
+
+def load_market(store=None, start=None, end=None):
+    require_numpy()
+    store = store or open_store(data_dir=DATA_DIR)
+    dates = [d for d in store.dates() if (not start or d >= start) and (not end or d <= end)]
+    names = {}
+    parts, days = [], []
+    for n, (date, (districts, rows)) in enumerate(cached_columns(store, dates).items()):
+        codes = np.array([names.setdefault(d, len(names)) for d in districts], dtype=np.int32)
+        rows = rows.copy()
+        if len(rows):
+            rows["district"] = codes[rows["district"]]
+        parts.append(rows)
+        days.append(np.full(len(rows), n, dtype=np.int32))
+    rows = np.concatenate(parts) if parts else np.empty(0, dtype=DAY_DTYPE)
+    day = np.concatenate(days) if days else np.empty(0, dtype=np.int32)
+    return Market(dates, list(names), day, rows)
+
+
+# --- per-district statistics --------------------------------------------------
+
+def grouped_median(keys, values, size):
+    """Median of `values` per integer key in [0, size); NaN for empty groups."""
+    ok = ~np.isnan(values)
+    keys, values = keys[ok], values[ok]
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, int)
+    counts = np.diff(np.r_[starts, len(keys)])
+    out = np.full(size, np.nan)
+    out[keys[starts]] = (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+    return out
+
+
+def district_counts(market):
+    """[district, day] matrix of listed ads."""
+    shape = (len(market.districts), len(market.dates))
+    counts = np.zeros(shape, dtype=np.int64)
+    np.add.at(counts, (market.district, market.day), 1)
+    return counts
+
+
+def district_medians(market):
+    """[district, day] matrix of median €/m² (NaN where a district had no priced ads)."""
+    n_days = len(market.dates)
+    keys = market.district.astype(np.int64) * n_days + market.day
+    return grouped_median(keys, market.per_m2, len(market.districts) * n_days).reshape(
+        len(market.districts), n_days)
+
+
+def rolling_mean(matrix, window):
+    """Mean over the last `window` snapshots along axis 1, skipping NaN."""
+    filled = np.nan_to_num(matrix, nan=0.0)
+    present = ~np.isnan(matrix)
+    sums = np.cumsum(filled, axis=1)
+    counts = np.cumsum(present, axis=1)
+    sums[:, window:] -= sums[:, :-window].copy()
+    counts[:, window:] -= counts[:, :-window].copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+# --- time on market -----------------------------------------------------------
+
+def days_listed(market):
+    """(ids, district, days, still_listed) per ad, from first to last sighting."""
+    known = market.id >= 0
+    ids, day, district = market.id[known], market.day[known], market.district[known]
+    unique, first = np.unique(ids, return_index=True)
+    _, last_rev = np.unique(ids[::-1], return_index=True)
+    last = len(ids) - 1 - last_rev
+    days = (market.dates[day[last]] - market.dates[day[first]]).astype(np.int64) + 1
+    still_listed = day[last] == len(market.dates) - 1
+    return unique, district[last], days, still_listed
+
+
+def histogram(values, bins):
+    """[(low, high, count)], with the last bin open-ended."""
+    edges = np.r_[bins, np.inf]
+    counts, _ = np.histogram(values, bins=edges)
+    return list(zip(edges[:-1], edges[1:], counts.tolist()))
+
+
+# --- price changes ------------------------------------------------------------
+
+def price_changes(history=None):
+    """(ids, dates, relative change) for every price change in the history."""
+    require_numpy()
+    history = history or open_history()
+    rows = history.db.execute(
+        "SELECT ad_id, date, price_eur FROM prices ORDER BY ad_id, seq").fetchall()
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, "datetime64[D]"), np.empty(0)
+    ad_id, date, price = zip(*rows)
+    ad_id = np.array([int(i) if i.isdigit() else -1 for i in ad_id], dtype=np.int64)
+    date = np.array(date, dtype="datetime64[D]")
+    price = np.array([p if p is not None else np.nan for p in price], dtype=np.float64)
+    same_ad = ad_id[1:] == ad_id[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = price[1:] / price[:-1] - 1
+    ok = same_ad & np.isfinite(change)
+    return ad_id[1:][ok], date[1:][ok], change[ok]
+
+
+def price_cut_rates(market, changes):
+    """[district, day] matrix of the share of listed ads that cut their price that day."""
+    ids, dates, change = changes
+    cut = change < 0
+    ids, dates = ids[cut], dates[cut]
+    day = np.searchsorted(market.dates, dates)
+    on_snapshot = (day < len(market.dates)) & (market.dates[np.minimum(day, len(market.dates) - 1)] == dates)
+    ids, day = ids[on_snapshot], day[on_snapshot]
+    # District of each cut: the row for that ad on that day.
+    keys = market.id * len(market.dates) + market.day
+    order = np.argsort(keys)
+    wanted = ids * len(market.dates) + day
+    pos = np.searchsorted(keys[order], wanted)
+    found = (pos < len(keys)) & (keys[order][np.minimum(pos, len(keys) - 1)] == wanted)
+    rows = order[pos[found]]
+    cuts = np.zeros((len(market.districts), len(market.dates)))
+    np.add.at(cuts, (market.district[rows], market.day[rows]), 1)
+    counts = district_counts(market)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, cuts / counts, np.nan)
+
+
+# --- CLI ----------------------------------------------------------------------
+
+def fmt(value, spec=",.0f"):
+    return "-" if value is None or np.isnan(value) else format(value, spec)
+
+
+def print_summary(market, changes, window):
+    counts = district_counts(market)
+    medians = rolling_mean(district_medians(market), window)
+    cut_rates = rolling_mean(price_cut_rates(market, changes), window)
+    _, district, days, still_listed = days_listed(market)
+    print(f"{len(market.dates)} snapshots, {market.dates[0]} .. {market.dates[-1]}; "
+          f"rolling stats over the last {window}")
+    print(f"{'district':32s} {'ads':>5s} {'€/m²':>8s} {'prev':>8s} {'cuts/day':>8s} {'days':>5s}")
+    for d in np.argsort(-counts[:, -1], kind="stable"):
+        if counts[d, -1] == 0:
+            continue
+        prev = medians[d, -1 - window] if len(market.dates) > window else np.nan
+        gone = (district == d) & ~still_listed
+        print(f"{market.districts[d] or '(none)':32.32s} {counts[d, -1]:5d} "
+              f"{fmt(medians[d, -1]):>8s} {fmt(prev):>8s} {fmt(cut_rates[d, -1], '.1%'):>8s} "
+              f"{fmt(np.median(days[gone]) if gone.any() else np.nan):>5s}")
+
+    print("\nDays listed (ads no longer listed):")
+    for low, high, n in histogram(days[~still_listed], DAYS_LISTED_BINS):
+        print(f"  {int(low):4d}-{'' if np.isinf(high) else int(high) - 1:<4} {n:6d}")
+    print("\nPrice cuts:")
+    _, _, change = changes
+    for low, high, n in histogram(change[change < 0], PRICE_CUT_BINS):
+        print(f"  {low:6.0%} .. {min(high, 0.0):4.0%} {n:6d}")
+
+
+def print_district(market, changes, name, window):
+    d = market.district_index(name)
+    counts = district_counts(market)[d]
+    medians = district_medians(market)[d]
+    rolling = rolling_mean(medians[None, :], window)[0]
+    cut_rates = price_cut_rates(market, changes)[d]
+    print(f"{market.districts[d]}: date, ads, median €/m², rolling, price cuts")
+    for n, date in enumerate(market.dates):
+        print(f"  {date} {counts[n]:5d} {fmt(medians[n]):>8s} {fmt(rolling[n]):>8s} "
+              f"{fmt(cut_rates[n], '.1%'):>6s}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--window", type=int, default=7, help="snapshots per rolling window")
+    parser.add_argument("--from", dest="start", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", help="last date (YYYY-MM-DD)")
+    parser.add_argument("--district", help="print the daily series for one district")
+    args = parser.parse_args()
+    market = load_market(start=args.start, end=args.end)
+    if not len(market.dates):
+        raise SystemExit("No snapshots.")
+    changes = price_changes()
+    if args.district:
+        try:
+            print_district(market, changes, args.district, args.window)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    else:
+        print_summary(market, changes, args.window)
+
+
+if __name__ == "__main__":
+    main()
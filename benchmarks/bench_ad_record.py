@@ -0,0 +1,125 @@
+"""Memory and CPU: ads as dicts of display strings vs Ad records.
+
+    python -m benchmarks.bench_ad_record
+
+Loads every snapshot in data/ both ways, then times the work that used to
+re-parse strings (sorting each day by municipality and price, €/m² per
+municipality over the whole history) against the same work on Ad fields.
+"""
+import gc
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+from ad import Ad
+from snapshot_store import DATA_DIR
+
+
+def timed(label, fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:40s} {best:8.3f}s")
+    return result
+
+
+def load_days(as_records):
+    days = []
+    for fn in sorted(os.listdir(DATA_DIR)):
+        if fn.endswith(".json"):
+            with open(os.path.join(DATA_DIR, fn), encoding="utf-8") as f:
+                ads = json.load(f)
+            days.append([Ad.from_dict(ad) for ad in ads] if as_records else ads)
+    return days
+
+
+def measured(as_records):
+    gc.collect()
+    tracemalloc.start()
+    days = load_days(as_records)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return days, size
+
+
+# --- the dict pipeline, parsing strings where it needs numbers ------------------
+
+def dict_municipality(location):
+    parts = [p.strip() for p in location.split('|')] if location else []
+    return parts[1] if len(parts) >= 2 else ''
+
+
+def dict_price(ad):
+    try:
+        return int((ad.get("price") or "").replace("€", "").replace(".", "").replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def dict_area(ad):
+    try:
+        return float((ad.get("kvadratura") or "").split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def sort_dicts(days):
+    def key(ad):
+        price = dict_price(ad)
+        return dict_municipality(ad.get("location")), price if price is not None else float("inf")
+    return [sorted(ads, key=key) for ads in days]
+
+
+def per_m2_dicts(days):
+    by_place = {}
+    for ads in days:
+        for ad in ads:
+            price, area = dict_price(ad), dict_area(ad)
+            if price and area:
+                by_place.setdefault(dict_municipality(ad.get("location")), []).append(price / area)
+    return {place: statistics.median(v) for place, v in by_place.items()}
+
+
+# --- the same on Ad records -----------------------------------------------------
+
+def sort_records(days):
+    def key(ad):
+        return ad.municipality, ad.price_eur if ad.price_eur is not None else float("inf")
+    return [sorted(ads, key=key) for ads in days]
+
+
+def per_m2_records(days):
+    by_place = {}
+    for ads in days:
+        for ad in ads:
+            if ad.price_per_m2:
+                by_place.setdefault(ad.municipality, []).append(ad.price_per_m2)
+    return {place: statistics.median(v) for place, v in by_place.items()}
+
+
+def main():
+    dict_days, dict_bytes = measured(False)
+    record_days, record_bytes = measured(True)
+    total = sum(len(ads) for ads in dict_days)
+    print(f"{len(dict_days)} snapshots, {total} ads")
+    print(f"  {'memory, dicts':40s} {dict_bytes / 1e6:8.1f} MB")
+    print(f"  {'memory, Ad records':40s} {record_bytes / 1e6:8.1f} MB")
+
+    timed("load, dicts", lambda: load_days(False), repeat=1)
+    timed("load + parse, Ad records", lambda: load_days(True), repeat=1)
+    by_dict = timed("sort every day, dicts", lambda: sort_dicts(dict_days))
+    by_record = timed("sort every day, Ad records", lambda: sort_records(record_days))
+    assert [[a["id"] for a in ads] for ads in by_dict] == [[a.id for a in ads] for ads in by_record]
+    m2_dict = timed("median €/m² by municipality, dicts", lambda: per_m2_dicts(dict_days))
+    m2_record = timed("median €/m² by municipality, Ad records", lambda: per_m2_records(record_days))
+    assert m2_dict == m2_record
+    assert all(Ad.from_dict(ad).to_dict() == ad for ads in dict_days for ad in ads)
+    print("  round trip to the JSON shape: lossless")
+
+
+if __name__ == "__main__":
+    main()
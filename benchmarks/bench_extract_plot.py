@@ -0,0 +1,62 @@
+"""Compare the targeted OtherFields scan with the full CurrentClassified decode.
+
+    python -m benchmarks.bench_extract_plot [saved-detail-page.html ...]
+
+Without arguments a synthetic detail page of realistic size is used.
+"""
+import json
+import sys
+import timeit
+
+from enrich_plot_sizes import _decode_other_fields, _scan_other_fields
+
+
+def synthetic_detail_page():
+    classified = {
+        "Id": 5425646486773,
+        "Title": "Kuća sa pogledom",
+        "TextHtml": "<p>" + "Prodaje se kuća sa dvorištem. " * 400 + "</p>",
+        "ImageURLs": [f"/slike/oglasi/Thumbs/{i}.jpg" for i in range(40)],
+        "Breadcrumbs": [{"Name": f"Level {i}", "Url": f"/l/{i}"} for i in range(6)],
+        "OtherFields": {
+            "cena_d": 39000,
+            "kvadratura_d": 80,
+            "povrsina_placa_d": 12.0,
+            "povrsina_placa_d_unit_s": "ar",
+            "broj_soba_s": "3.0",
+            "grejanje_s": "TA peć",
+        },
+        "AdvertiserInfo": {"DisplayName": "Vlasnik", "Phones": ["011 123 456"]},
+    }
+    filler = "<div class='row'><span>lorem ipsum</span></div>\n" * 4000
+    return (
+        "<html><head><script>var QuidditaEnvironment = {};\n"
+        f"QuidditaEnvironment.CurrentClassified = {json.dumps(classified, ensure_ascii=False)};\n"
+        f"</script></head><body>{filler}</body></html>"
+    )
+
+
+def main(paths):
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_detail_page()]
+
+    for page in pages:
+        scanned = _scan_other_fields(page)
+        decoded = _decode_other_fields(page)
+        if scanned is not None and scanned != decoded:
+            print("WARNING: targeted scan and full decode disagree")
+
+    number = 200
+    for name, fn in (("full decode", _decode_other_fields), ("targeted scan", _scan_other_fields)):
+        secs = timeit.timeit(lambda: [fn(p) for p in pages], number=number)
+        per_page = secs / (number * len(pages)) * 1e6
+        print(f"{name:14s} {per_page:9.1f} µs/page")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,106 @@
+"""Incremental against full crawls over a synthetic market.
+
+    python -m benchmarks.bench_incremental_crawl [--scale 1] [--days 28] [--seed 0]
+
+Every simulated day is served by a fixture server and crawled the way
+main.run would (incremental, with a full crawl every FULL_CRAWL_EVERY_DAYS
+days) and in full. Prints the listing requests of both, and how many of
+the full crawl's new ads and price changes (against the previous day's
+snapshot) the incremental snapshots missed.
+
+That is done twice: once with a price change moving the ad to the top of
+the newest-first listing, and once with listings ordered by first
+publication only. The incremental crawl sweeps the pages past its stop
+point, so it should miss nothing in either case.
+"""
+import argparse
+
+import http_client
+
+http_client.HTTP_CACHE = False  # before the first session is created
+
+import main  # noqa: E402
+from benchmarks.fixture_server import LISTING_PATH, FixtureServer  # noqa: E402
+from benchmarks.synthetic import market_days  # noqa: E402
+from daily_diff import diff_ads, unique_by_id  # noqa: E402
+
+
+def changes(current, previous, seen):
+    """(new ids, price-changed ids) of `current` against `previous`."""
+    added = {ad_id for ad_id in current if ad_id not in seen}
+    _, changed = diff_ads(current, previous)
+    return added, {entry["id"] for entry in changed}
+
+
+def crawl(ads, newest_first, fn):
+    server = FixtureServer(ads, newest_first=newest_first).start()
+    filter_url = server.url + LISTING_PATH + "?" + main.FILTER_URL.split("?", 1)[1]
+    try:
+        return fn(filter_url), server.requests
+    finally:
+        server.stop()
+
+
+def simulate(args, bump_repriced):
+    full_requests = incremental_requests = fallbacks = 0
+    missed_added = missed_changed = total_added = total_changed = 0
+    previous_full = previous_incremental = None
+    seen = set()
+    modified = {}  # id -> (day, id) of the ad's last listing or price change
+    for n, (date, ads) in enumerate(market_days(args.scale, args.days, args.seed)):
+        for ad in ads:
+            ad_id = ad["id"]
+            old = previous_full.get(ad_id) if previous_full else None
+            if ad_id not in modified or (bump_repriced and old and old["price"] != ad["price"]):
+                modified[ad_id] = (n, int(ad_id))
+        newest_first = sorted(ads, key=lambda ad: modified[ad["id"]], reverse=True)
+
+        full, full_crawl_requests = crawl(
+            ads, newest_first, lambda url: main.fetch_current_ads(rate_per_host=0, filter_url=url))
+        full = unique_by_id(ad.to_dict() for ad in full)
+        full_requests += full_crawl_requests
+
+        if previous_incremental is None or n % main.FULL_CRAWL_EVERY_DAYS == 0:
+            incremental, requests = full, full_crawl_requests
+        else:
+            result, requests = crawl(
+                ads, newest_first,
+                lambda url: main.fetch_current_ads_incremental(list(previous_incremental.values()), url))
+            if result is None:
+                fallbacks += 1
+                incremental = full
+                requests += full_crawl_requests
+            else:
+                incremental = unique_by_id(ad.to_dict() for ad in result)
+        incremental_requests += requests
+
+        if previous_full is not None:
+            added, changed = changes(full, previous_full, seen)
+            inc_added, inc_changed = changes(incremental, previous_incremental, seen)
+            total_added += len(added)
+            total_changed += len(changed)
+            missed_added += len(added - inc_added)
+            missed_changed += len(changed - inc_changed)
+        seen.update(full)
+        previous_full, previous_incremental = full, incremental
+
+    print(f"price changes {'move ads to the top' if bump_repriced else 'keep the listing order'} "
+          f"({args.days} days, ~{len(full)} ads/day):")
+    print(f"  listing requests: full {full_requests}, incremental {incremental_requests} "
+          f"({full_requests / max(incremental_requests, 1):.1f}x fewer), {fallbacks} fallback(s)")
+    print(f"  new ads missed: {missed_added} of {total_added}")
+    print(f"  price changes missed or late: {missed_changed} of {total_changed}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    simulate(args, bump_repriced=True)
+    simulate(args, bump_repriced=False)
+
+
+if __name__ == "__main__":
+    main_cli()
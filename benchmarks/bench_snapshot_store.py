@@ -0,0 +1,74 @@
+"""Read/write timings: per-day JSON files vs the SQLite snapshot store.
+
+    python -m benchmarks.bench_snapshot_store
+
+Uses the snapshots in data/ and builds a throwaway store in a temp dir.
+"""
+import json
+import os
+import tempfile
+import time
+
+from snapshot_store import DATA_DIR, SnapshotStore
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f"  {label:32s} {time.perf_counter() - started:8.3f}s")
+    return result
+
+
+def json_day(date):
+    with open(os.path.join(DATA_DIR, f"{date}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def json_all():
+    for fn in sorted(os.listdir(DATA_DIR)):
+        yield fn[:-len(".json")], json_day(fn[:-len(".json")])
+
+
+def main():
+    dates = sorted(fn[:-len(".json")] for fn in os.listdir(DATA_DIR) if fn.endswith(".json"))
+    latest = dates[-1]
+    sample_id = str(json_day(latest)[0]["id"]).strip()
+    json_size = sum(os.path.getsize(os.path.join(DATA_DIR, f"{d}.json")) for d in dates)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SnapshotStore(os.path.join(tmp, "snapshots.db"))
+        print(f"{len(dates)} snapshots, {json_size / 1e6:.1f} MB of JSON")
+
+        print("import")
+        timed("store.sync (all files)", lambda: store.sync(DATA_DIR))
+        store.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"  store size {os.path.getsize(store.path) / 1e6:.1f} MB")
+
+        ads = json_day(latest)
+        print("write one day")
+        timed("json.dump indent=2", lambda: json.dump(
+            ads, open(os.path.join(tmp, "day.json"), "w", encoding="utf-8"), indent=2, ensure_ascii=False))
+        timed("store.add_day", lambda: store.add_day("9999-01-01", ads))
+        store.remove_day("9999-01-01")
+
+        print("read one day")
+        timed("json.load", lambda: json_day(latest))
+        timed("store.day", lambda: store.day(latest))
+
+        print("read every day")
+        timed("json.load x all", lambda: sum(len(a) for _, a in json_all()))
+        timed("store.days", lambda: sum(len(a) for _, a in store.days()))
+
+        print("id -> latest url")
+        timed("json walk", lambda: {str(a["id"]).strip(): a["url"] for _, day in json_all() for a in day})
+        timed("store.url_map", store.url_map)
+
+        print(f"history of ad {sample_id}")
+        timed("json walk", lambda: [(d, a) for d, day in json_all() for a in day
+                                    if str(a["id"]).strip() == sample_id])
+        timed("store.ad_history", lambda: store.ad_history(sample_id))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
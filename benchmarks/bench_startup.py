@@ -0,0 +1,60 @@
+"""Import time of every entry point, and which heavy packages it loads.
+
+    python -m benchmarks.bench_startup [--repeat 5] [--check]
+
+Each module is imported in a fresh interpreter (`python -c "import m"`),
+--repeat times; the best wall time is printed with the third-party
+scraping packages the import pulled in. Nothing should load until a page
+is fetched or parsed, so every entry point should report none. --check
+exits non-zero if one does.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ("report_format", "send_telegram", "replay", "analytics", "compare_ads",
+                "plot_cache", "price_history", "snapshot_store", "enrich_plot_sizes", "main")
+HEAVY = ("curl_cffi", "bs4", "lxml")
+
+PROBE = """
+import json, sys
+import {module}
+print(json.dumps(sorted({{m.split(".")[0] for m in sys.modules}} & set({heavy!r}))))
+"""
+
+
+def probe(module):
+    """(seconds, heavy packages loaded) for one cold import of `module`."""
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return time.perf_counter() - start, json.loads(out)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="fail if an entry point loads a heavy package")
+    args = parser.parse_args()
+
+    baseline = min(probe("os")[0] for _ in range(args.repeat))
+    print(f"{'interpreter':20s} {baseline * 1000:7.1f} ms")
+    offenders = []
+    for module in ENTRY_POINTS:
+        runs = [probe(module) for _ in range(args.repeat)]
+        best = min(seconds for seconds, _ in runs)
+        heavy = runs[0][1]
+        print(f"{module:20s} {best * 1000:7.1f} ms  (+{(best - baseline) * 1000:6.1f})"
+              f"  {', '.join(heavy) or '-'}")
+        if heavy:
+            offenders.append(module)
+    if args.check and offenders:
+        sys.exit(f"heavy imports at startup: {', '.join(offenders)}")
+
+
+if __name__ == "__main__":
+    main_cli()
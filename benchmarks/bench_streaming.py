@@ -0,0 +1,115 @@
+"""Peak memory and time of whole-file against streamed JSON reads.
+
+    python -m benchmarks.bench_streaming [--scale 1] [--days 3650] [--seed 0] [--keep DIR]
+
+Writes a synthetic market (ten years by default) to a temporary directory
+and runs each reader in a fresh interpreter, so the peak RSS it reports
+is that reader's alone (Linux only: read from /proc):
+
+- id -> url over every snapshot: json.load per file, then
+  json_stream.iter_array projected onto ("id", "url");
+- price-history.json: json.load, then json_stream.iter_object;
+- the indexes built from those files: SnapshotStore.sync and
+  PriceHistory.sync_from_json, which stream.
+
+Streamed peaks should stay flat as --days grows; whole-file ones grow
+with the largest file.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import write_market
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READERS = {
+    "urls: json.load": """
+urls = {}
+for fn in sorted(os.listdir("data")):
+    with open(os.path.join("data", fn), encoding="utf-8") as f:
+        for ad in json.load(f):
+            urls[str(ad["id"]).strip()] = ad["url"]
+result = len(urls)
+""",
+    "urls: iter_array": """
+from json_stream import iter_array
+urls = {}
+for fn in sorted(os.listdir("data")):
+    for ad in iter_array(os.path.join("data", fn), fields=("id", "url")):
+        urls[str(ad["id"]).strip()] = ad["url"]
+result = len(urls)
+""",
+    "history: json.load": """
+with open("price-history.json", encoding="utf-8") as f:
+    result = sum(len(entries) for entries in json.load(f).values())
+""",
+    "history: iter_object": """
+from json_stream import iter_object
+result = sum(len(entries) for _, entries in iter_object("price-history.json"))
+""",
+    "snapshot store sync": """
+from snapshot_store import SnapshotStore
+result = SnapshotStore("snapshots.db").sync("data")
+""",
+    "history db import": """
+from price_history import open_history
+result = open_history("price-history.db", "price-history.json").db.execute(
+    "SELECT COUNT(*) FROM prices").fetchone()[0]
+""",
+}
+
+# VmHWM, unlike ru_maxrss, starts afresh at exec instead of inheriting the
+# benchmark process's own peak.
+PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+
+def peak_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+
+base = peak_kb()
+start = time.perf_counter()
+{code}
+print(json.dumps([time.perf_counter() - start, peak_kb(), base, result]))
+"""
+
+
+def measure(code, cwd):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(root=ROOT, code=code)],
+                         cwd=cwd, capture_output=True, text=True, check=True).stdout
+    return json.loads(out)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", metavar="DIR", help="write the market to DIR and keep it")
+    args = parser.parse_args()
+
+    out_dir = args.keep or tempfile.mkdtemp(prefix="bench-streaming-")
+    try:
+        total, ads = write_market(out_dir, args.scale, args.days, args.seed)
+        data = os.path.join(out_dir, "data")
+        largest = max(os.path.getsize(os.path.join(data, fn)) for fn in os.listdir(data))
+        history = os.path.getsize(os.path.join(out_dir, "price-history.json"))
+        print(f"{args.days} days, {total} listings of {ads} ads; largest snapshot "
+              f"{largest / 1e6:.1f} MB, price-history.json {history / 1e6:.1f} MB")
+        for name, code in READERS.items():
+            seconds, peak_kb, base_kb, result = measure(code, out_dir)
+            print(f"  {name:22s} {seconds:7.2f} s  peak RSS {peak_kb / 1024:7.1f} MB "
+                  f"(+{(peak_kb - base_kb) / 1024:6.1f})  -> {result}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(out_dir)
+
+
+if __name__ == "__main__":
+    main_cli()
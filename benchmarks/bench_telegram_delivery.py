@@ -0,0 +1,106 @@
+"""Telegram delivery against a local stand-in Bot API server.
+
+    python -m benchmarks.bench_telegram_delivery
+
+The stand-in speaks HTTP/1.1 keep-alive, answers some requests with a 429
+carrying retry_after, and can fail one chunk outright; tests/test_send_telegram.py
+uses it to check retries, the per-chat rate, resuming and streaming. This
+script times a batch of chunks over one connection against a new
+connection per chunk (what urllib.request.urlopen did).
+"""
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from send_telegram import BotClient, deliver
+
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.messages = []  # (time, chat_id, text)
+        self.connections = 0
+        self.throttle_every = 0  # answer every Nth request with a 429
+        self.fail_text = None  # answer 400 to this text
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1  # headers and body in one write; see handle_one_request's flush
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        params = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            if server.throttle_every and server.requests % server.throttle_every == 0:
+                status, body = 429, {"ok": False, "error_code": 429,
+                                     "parameters": {"retry_after": 1}}
+            elif params["text"] == server.fail_text:
+                status, body = 400, {"ok": False, "error_code": 400, "description": "Bad Request"}
+            else:
+                server.messages.append((time.monotonic(), params["chat_id"], params["text"]))
+                status, body = 200, {"ok": True, "result": {"message_id": len(server.messages)}}
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+def serve():
+    server = StandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def urlopen_send(api, chat_id, text):
+    data = urllib.parse.urlencode({"chat_id": chat_id, "text": text}).encode()
+    with urllib.request.urlopen(f"{api}/botTOKEN/sendMessage", data=data, timeout=30) as r:
+        json.loads(r.read())
+
+
+def main():
+    server = serve()
+    batch = [f"message {i}" for i in range(300)]
+    started = time.perf_counter()
+    for text in batch:
+        urlopen_send(server.url, "1", text)
+    per_chunk = time.perf_counter() - started
+    connections = server.connections
+
+    client = BotClient("TOKEN", api=server.url)
+    started = time.perf_counter()
+    deliver(client, "1", batch, rate=0, sent_file=None)
+    pooled = time.perf_counter() - started
+    print(f"{len(batch)} chunks, rate limit off:")
+    print(f"  new connection per chunk   {per_chunk:6.3f}s  ({connections} connections)")
+    print(f"  one keep-alive connection  {pooled:6.3f}s  ({server.connections - connections} connection)")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
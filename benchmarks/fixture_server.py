@@ -0,0 +1,122 @@
+"""Local stand-in for halooglasi, serving listing and detail page fixtures.
+
+    python -m benchmarks.fixture_server [--port 8765] [--scale 1] [--seed 0]
+
+The listing path serves pages of `ads` (the latest snapshot, or a synthetic
+market of --scale times its size) with benchmarks.fixtures.listing_page;
+any other path ending in an ad id serves that ad's detail page. With a
+`sort` parameter the listing is newest first: highest id first, or the
+order given as `newest_first`. Responses
+carry an ETag and answer If-None-Match with 304, like the real site's CDN.
+
+Point the scrapers at it with HALOOGLASI_URL, preferably from a scratch
+copy of the repo since main.py writes data/ and reports/:
+
+    HALOOGLASI_URL=http://127.0.0.1:8765 python main.py
+"""
+import argparse
+import hashlib
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fixtures import ADS_PER_PAGE, detail_page, listing_page, sample_ads
+from benchmarks.synthetic import market_days
+
+LISTING_PATH = "/nekretnine/prodaja-kuca/beograd"
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, ads, port=0, per_page=ADS_PER_PAGE, newest_first=None):
+        super().__init__(("127.0.0.1", port), FixtureHandler)
+        self.ads = list(ads)
+        self.by_id = {str(ad["id"]): ad for ad in self.ads}
+        self.newest_first = newest_first or sorted(self.ads, key=lambda ad: int(ad["id"]), reverse=True)
+        self.per_page = per_page
+        self.requests = 0
+        self.not_modified = 0
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def page(self, path, query):
+        """(status, body) for a request path; bodies are rendered once."""
+        key = (path, query.get("page", "1"), "sort" in query) if path == LISTING_PATH else (path,)
+        with self._lock:
+            self.requests += 1
+            if key in self._pages:
+                return self._pages[key]
+        if path == LISTING_PATH:
+            ads = self.newest_first if key[2] else self.ads
+            result = 200, listing_page(ads, page=int(key[1]), per_page=self.per_page)
+        else:
+            ad = self.by_id.get(path.rstrip("/").rsplit("/", 1)[-1])
+            result = (200, detail_page(ad)) if ad else (404, "<html>Not found</html>")
+        with self._lock:
+            self._pages[key] = result
+        return result
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        parts = urllib.parse.urlsplit(self.path)
+        status, text = self.server.page(parts.path, dict(urllib.parse.parse_qsl(parts.query)))
+        body = text.encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            with self.server._lock:
+                self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scale", type=float, default=1, help="market size vs the latest snapshot")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.scale == 1:
+        ads = sample_ads()
+    else:
+        ads = next(market_days(args.scale, days=1, seed=args.seed))[1]
+    server = FixtureServer(ads, args.port)
+    print(f"Serving {len(ads)} ads; HALOOGLASI_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""halooglasi listing and detail page fixtures.
+
+    python -m benchmarks.fixtures generate   # rebuild from the latest snapshot
+    python -m benchmarks.fixtures record     # save live pages (needs network)
+
+listing_page() and detail_page() render ads in the markup the parsers
+read (product-item blocks, serverListData, CurrentClassified with
+OtherFields), padded to roughly the size of the real pages. The files in
+benchmarks/fixtures/ are what `generate` wrote; `record` replaces them with
+the pages halooglasi serves today, so the benchmarks can be rerun on the
+real thing.
+"""
+import hashlib
+import html
+import json
+import os
+import sys
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+LISTING_FIXTURE = "listing-page.html"
+DETAIL_FIXTURE = "detail-page.html"
+ADS_PER_PAGE = 20
+
+PAGE_CHROME = "<div class='row'><span class='banner'>lorem ipsum dolor</span></div>\n" * 600
+
+
+def load(name):
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def listing_item(ad):
+    path = ad["url"].split("halooglasi.com", 1)[-1] if "halooglasi.com" in ad["url"] else ad["url"]
+    places = "".join(
+        f"<li>{html.escape(p.strip())}</li>\n " for p in (ad.get("location") or "").split("|"))
+    area = (ad.get("kvadratura") or "").replace(" m2", "").replace(".", ",")
+    price = (ad.get("price") or "").replace(" ", "&nbsp;")
+    return f"""<div class="col-md-12 col-sm-12 col-xs-12 col-lg-12">
+<div class="product-item product-list-item Premium real-estates my-product-placeholder" data-id="{ad['id']}">
+ <div class="my-product-img"><a href="{html.escape(path)}"><img src="/slike/oglasi/Thumbs/{ad['id']}.jpg" alt=""></a></div>
+ <div class="central-feature-wrapper"><span class="central-feature"><span data-value="1"><i>{price}</i></span></span>
+ <div class="price-by-surface"><span>{ad.get('price_by_surface') or ''}</span></div></div>
+ <h3 class="product-title"><a href="{html.escape(path)}">{html.escape(ad.get('title') or '')}</a></h3>
+ <span class="publish-date">{ad.get('publish_date') or ''}</span>
+ <ul class="subtitle-places">
+ {places}</ul>
+ <ul class="product-features ">
+ <li class="col-p-1-3"><div class="value-wrapper">{area}&nbsp;m<sup>2</sup><br><span class="legend">Kvadratura</span></div></li>
+ <li class="col-p-1-3"><div class="value-wrapper">3.0&nbsp;<br><span class="legend">Broj soba</span></div></li>
+ </ul>
+ <div class="basic-info"><span data-field-name="oglasivac_nekretnine_s">{html.escape(ad.get('advertiser') or '')}</span></div>
+</div></div>"""
+
+
+def listing_page(ads, total_count=None, page=1, per_page=ADS_PER_PAGE):
+    """Page `page` of a listing of `ads`; an empty page past the end."""
+    shown = ads[(page - 1) * per_page:page * per_page]
+    total_count = len(ads) if total_count is None else total_count
+    server_data = json.dumps({"TotalCount": total_count, "TotalPages": -(-total_count // per_page)})
+    return (
+        "<!DOCTYPE html><html><head><title>Prodaja kuća - Beograd</title><script>"
+        "var QuidditaEnvironment = {};"
+        f"QuidditaEnvironment.serverListData = {server_data};</script></head><body>"
+        f"{PAGE_CHROME}<div id='ad-list-2'>{''.join(listing_item(ad) for ad in shown)}</div>"
+        f"{PAGE_CHROME}</body></html>"
+    )
+
+
+def plot_for(ad_id):
+    """A deterministic (value, unit) plot size for an ad id; None for some ads."""
+    n = int(hashlib.sha1(str(ad_id).encode()).hexdigest()[:8], 16)
+    if n % 10 == 0:
+        return None, None
+    return (round(2 + n % 2000 / 100, 2), "ar") if n % 4 else (float(300 + n % 1500), "m2")
+
+
+def detail_page(ad):
+    value, unit = plot_for(ad["id"])
+    other = {"cena_d": 39000, "kvadratura_d": 80, "broj_soba_s": "3.0", "grejanje_s": "TA peć"}
+    if value is not None:
+        other.update(povrsina_placa_d=value, povrsina_placa_d_unit_s=unit)
+    classified = {
+        "Id": int(ad["id"]) if str(ad["id"]).isdigit() else ad["id"],
+        "Title": ad.get("title"),
+        "TextHtml": "<p>" + "Prodaje se kuća sa dvorištem. " * 400 + "</p>",
+        "ImageURLs": [f"/slike/oglasi/Thumbs/{i}.jpg" for i in range(40)],
+        "Breadcrumbs": [{"Name": f"Level {i}", "Url": f"/l/{i}"} for i in range(6)],
+        "OtherFields": other,
+        "AdvertiserInfo": {"DisplayName": ad.get("advertiser"), "Phones": ["011 123 456"]},
+    }
+    return (
+        "<html><head><script>var QuidditaEnvironment = {};\n"
+        f"QuidditaEnvironment.CurrentClassified = {json.dumps(classified, ensure_ascii=False)};\n"
+        f"</script></head><body>{PAGE_CHROME * 6}</body></html>"
+    )
+
+
+def sample_ads():
+    from snapshot_store import open_store
+
+    store = open_store()
+    return store.day(store.dates()[-1])
+
+
+def write(name, text):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    with open(os.path.join(FIXTURE_DIR, name), "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"wrote {name} ({len(text) / 1024:.0f} KiB)")
+
+
+def generate():
+    ads = sample_ads()
+    write(LISTING_FIXTURE, listing_page(ads, page=1))
+    write(DETAIL_FIXTURE, detail_page(ads[0]))
+
+
+def record():
+    import main
+    from http_client import thread_session
+
+    listing = main.fetch_page_html(1)
+    write(LISTING_FIXTURE, listing)
+    ads = main.parse_page(listing)
+    response = thread_session().get(ads[0].url, timeout=20)
+    response.raise_for_status()
+    write(DETAIL_FIXTURE, response.text)
+
+
+if __name__ == "__main__":
+    commands = {"generate": generate, "record": record}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        sys.exit("usage: python -m benchmarks.fixtures generate|record")
+    commands[sys.argv[1]]()
@@ -0,0 +1,310 @@
+"""Benchmark suite: parsing, plot extraction, reports, history, chunking and alert rules.
+
+    python -m benchmarks.run [--scale 10] [--days 200] [--only NAME ...]
+                             [--repeat 5] [--compare [RESULTS.json]] [--no-save]
+
+Listing and detail pages come from benchmarks/fixtures/ and, for the
+fetch benchmark, from a local fixture server (the HTTP cache is off so
+every request is a full one). Reports, history and chunking run on a
+synthetic market `--scale` times today's size with `--days` of history,
+inside a temporary directory.
+
+Each benchmark reports the best of --repeat runs. Results are saved to
+benchmarks/results/ with the commit they ran on; --compare prints the
+ratio against an earlier results file (by default the latest one).
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import http_client
+
+http_client.HTTP_CACHE = False  # before the first session is created
+
+import enrich_plot_sizes  # noqa: E402
+import listing_parser  # noqa: E402
+import main  # noqa: E402
+import price_history  # noqa: E402
+from ad import municipality, parse_price  # noqa: E402
+from alert_rules import Change, Rule, RuleIndex  # noqa: E402
+from benchmarks.fixture_server import LISTING_PATH, FixtureServer  # noqa: E402
+from benchmarks.fixtures import DETAIL_FIXTURE, LISTING_FIXTURE, load, sample_ads  # noqa: E402
+from benchmarks.synthetic import format_price, market_days  # noqa: E402
+from daily_diff import StateIndex  # noqa: E402
+from send_telegram import pack_chunks  # noqa: E402
+from snapshot_store import STORE_FILE, _open_stores, open_store  # noqa: E402
+from timeline import open_timeline  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def best_of(fn, repeat, setup=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+# --- benchmarks; each returns {name: seconds} ------------------------------
+
+def bench_parsing(ctx):
+    html = load(LISTING_FIXTURE)
+    return {
+        f"listing_parse_{name}": best_of(lambda: parse(html), ctx.repeat)
+        for name, parse in listing_parser.BACKENDS.items()
+    }
+
+
+def bench_fetch(ctx):
+    server = FixtureServer(ctx.sample).start()
+    old_base = listing_parser.BASE_URL
+    filter_url = server.url + LISTING_PATH + "?" + main.FILTER_URL.split("?", 1)[1]
+    listing_parser.BASE_URL = server.url
+    try:
+        ad = main.fetch_ads_from_page(1, filter_url)[0]
+        return {
+            "fetch_ads_from_page": best_of(lambda: main.fetch_ads_from_page(1, filter_url), ctx.repeat),
+            # Unthrottled: this measures the crawl, not CRAWL_RATE_PER_HOST.
+            "fetch_current_ads": best_of(
+                lambda: main.fetch_current_ads(rate_per_host=0, filter_url=filter_url), ctx.repeat),
+            "fetch_detail_plot": best_of(lambda: enrich_plot_sizes.fetch_one(ad.url), ctx.repeat),
+        }
+    finally:
+        listing_parser.BASE_URL = old_base
+        server.stop()
+
+
+def bench_extract_plot(ctx):
+    html = load(DETAIL_FIXTURE)
+    return {"extract_plot": best_of(lambda: enrich_plot_sizes.extract_plot(html), ctx.repeat * 20)}
+
+
+def bench_report(ctx):
+    """generate_report for the last day of the synthetic market, both diff paths."""
+    days = ctx.days_list
+    date, current = days[-1]
+    base = days[-3][1]
+    # generate_report opens snapshots.db through open_store; make that this
+    # directory's store rather than one opened earlier in the process.
+    _open_stores.pop(STORE_FILE, None)
+    store = open_store(STORE_FILE, data_dir="data")
+    for d, ads in days[-3:-1]:
+        store.add_day(d, ads)
+    shutil.copy("price-history.json", "history-seed.json")
+
+    def fresh_history():
+        for path in glob.glob(main.HISTORY_DB + "*"):
+            os.remove(path)
+        shutil.copy("history-seed.json", main.HISTORY_FILE)
+        price_history.open_history(main.HISTORY_DB, main.HISTORY_FILE).close()
+        # The days before `date` are in the timeline index after yesterday's run.
+        open_timeline(main.DEFAULT_SEARCH, before=date).close()
+
+    def fresh_state():
+        fresh_history()
+        # Rebuild the index for `date` outside the timing, as after yesterday's run.
+        store.db.executescript("DROP TABLE IF EXISTS state_meta")
+        StateIndex(store).diff(date, {})
+
+    try:
+        return {
+            "generate_report_vs_list": best_of(
+                lambda: main.generate_report(current, base, date), ctx.repeat, fresh_history),
+            "generate_report_state_index": best_of(
+                lambda: main.generate_report(current, None, date), ctx.repeat, fresh_state),
+        }
+    finally:
+        _open_stores.pop(STORE_FILE, None)
+        store.close()
+
+
+def bench_history(ctx):
+    with open("price-history.json", encoding="utf-8") as f:
+        history = json.load(f)
+
+    def fresh_db():
+        for path in glob.glob("bench-history.db*"):
+            os.remove(path)
+
+    def load_db():
+        price_history.PriceHistory("bench-history.db", "price-history.json").close()
+
+    def export():
+        h = price_history.PriceHistory("bench-history.db", "price-history.json")
+        h.export_json()
+        h.close()
+
+    return {
+        "history_json_load": best_of(lambda: json.load(open("price-history.json", encoding="utf-8")),
+                                     ctx.repeat),
+        "history_json_save": best_of(lambda: price_history.write_json(history, "out.json"), ctx.repeat),
+        "history_db_import": best_of(load_db, ctx.repeat, fresh_db),
+        "history_db_export": best_of(export, ctx.repeat),
+    }
+
+
+def bench_chunking(ctx):
+    date, ads = ctx.days_list[-1]
+    added = ads[:len(ads) // 10]
+    changed = {ad["id"]: {"current": ad, "previous_price": "1\xa0€"} for ad in ads[-len(ads) // 20:]}
+    return {
+        "message_render_and_chunk": best_of(
+            lambda: list(pack_chunks(main.render_telegram_blocks(added, changed))), ctx.repeat),
+    }
+
+
+def bench_rules(ctx, count=500):
+    """`count` alert rules over a day where every ad is new and 5% are repriced."""
+    date, ads = ctx.days_list[-1]
+    changed = {ad["id"]: {"current": ad, "previous_price": format_price(parse_price(ad["price"]) * 108 // 100)}
+               for ad in ads[-len(ads) // 20:]}
+    rng = random.Random(0)
+    areas = sorted({municipality(ad["location"]) for ad in ads} - {""})
+    rules = []
+    for i in range(count):
+        low = rng.randrange(30, 180) * 1000
+        rules.append(Rule(f"rule-{i}", str(i % 20), municipality=rng.sample(areas, rng.randint(1, 3)),
+                          min_price=low, max_price=low + rng.randrange(10, 60) * 1000,
+                          max_price_per_m2=rng.choice([None, 1000, 1500]),
+                          min_plot_m2=rng.choice([None, 300, 1000]), min_drop_pct=rng.choice([None, None, 5])))
+    index = RuleIndex(rules)
+
+    def every_rule():
+        changes = [Change("added", ad) for ad in ads]
+        changes += [Change("price_changed", c["current"], None, c["previous_price"]) for c in changed.values()]
+        return [(c, [r for r in rules if r.matches(c)]) for c in changes]
+
+    return {
+        "alert_rules_indexed": best_of(lambda: index.route(ads, changed), ctx.repeat),
+        "alert_rules_every_rule": best_of(every_rule, ctx.repeat),
+    }
+
+
+BENCHMARKS = {
+    "parsing": bench_parsing,
+    "fetch": bench_fetch,
+    "extract_plot": bench_extract_plot,
+    "report": bench_report,
+    "history": bench_history,
+    "chunking": bench_chunking,
+    "rules": bench_rules,
+}
+
+
+class Context:
+    def __init__(self, scale, days, repeat):
+        self.sample = sample_ads()
+        self.scale = scale
+        self.days = days
+        self.repeat = repeat
+        self.days_list = []
+
+    def build_market(self):
+        """Keep the last three days and write the price history for all of them."""
+        history = {}
+        for date, ads in market_days(self.scale, self.days, sample=self.sample):
+            for ad in ads:
+                entries = history.setdefault(ad["id"], [])
+                if not entries or entries[-1]["price"] != ad["price"]:
+                    entries.append({"date": date, "price": ad["price"]})
+            self.days_list = (self.days_list + [(date, ads)])[-3:]
+        # The last day is "today": it must not be in the history yet.
+        today, current = self.days_list[-1]
+        for ad in current:
+            entries = history[ad["id"]]
+            if entries[-1]["date"] == today:
+                entries.pop()
+            if not entries:
+                del history[ad["id"]]
+        price_history.write_json(history, "price-history.json")
+        return len(history)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latest_results(exclude=None):
+    files = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    files = [f for f in files if f != exclude]
+    return files[-1] if files else None
+
+
+def compare(results, path):
+    with open(path, encoding="utf-8") as f:
+        before = json.load(f)["results"]
+    print(f"\nvs {os.path.basename(path)}:")
+    for name, secs in results.items():
+        if name in before and before[name]:
+            print(f"  {name:32s} {secs / before[name]:6.2f}x")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scale", type=float, default=10, help="synthetic market size vs today")
+    parser.add_argument("--days", type=int, default=200, help="days of synthetic history")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS))
+    parser.add_argument("--compare", nargs="?", const="latest", metavar="RESULTS")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    ctx = Context(args.scale, args.days, args.repeat)
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            started = time.perf_counter()
+            ads = ctx.build_market()
+            print(f"synthetic market: {len(ctx.days_list[-1][1])} ads/day, {args.days} days, "
+                  f"{ads} ads in history ({time.perf_counter() - started:.1f}s to build)")
+            for name in args.only or BENCHMARKS:
+                for key, secs in BENCHMARKS[name](ctx).items():
+                    results[key] = round(secs, 6)
+                    print(f"  {key:32s} {secs * 1000:10.3f} ms")
+        finally:
+            os.chdir(cwd)
+
+    saved = None
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = git_commit()
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        saved = os.path.join(RESULTS_DIR, f"{stamp}-{commit or 'nogit'}.json")
+        with open(saved, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "commit": commit, "date": stamp, "python": platform.python_version(),
+                    "machine": platform.machine(), "platform": platform.platform(),
+                    "scale": args.scale, "days": args.days, "repeat": args.repeat,
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"saved {os.path.relpath(saved)}")
+    if args.compare:
+        path = latest_results(exclude=saved) if args.compare == "latest" else args.compare
+        if path:
+            compare(results, path)
+        else:
+            print("nothing to compare with")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,132 @@
+"""Synthetic market histories, far larger than the real one.
+
+    python -m benchmarks.synthetic OUT_DIR [--scale 10] [--days 1000] [--seed 0]
+
+market_days() streams (date, ads) for a market `scale` times the size of
+the latest real snapshot, for any number of days. Titles, locations, areas
+and advertisers are sampled from the real snapshots; ads live for a
+geometrically distributed number of days, get listed to keep the market
+size steady, and now and then cut (rarely raise) their price. Everything is
+deterministic for a given seed.
+
+The CLI writes OUT_DIR/data/*.json and OUT_DIR/price-history.json in the
+committed formats, so replay.py, analytics.py or main.generate_report can
+be run against it from inside OUT_DIR.
+"""
+import argparse
+import os
+import random
+from datetime import date, timedelta
+
+from price_history import write_json
+
+START_DATE = date(2020, 1, 1)
+MEAN_LIFETIME_DAYS = 45
+PRICE_CHANGE_PER_DAY = 0.01
+FIRST_ID = 6_000_000_000_000
+
+
+def templates():
+    """Real ads to sample fields from (the latest snapshot)."""
+    from snapshot_store import open_store
+
+    store = open_store()
+    dates = store.dates()
+    return store.day(dates[-1]) if dates else []
+
+
+def format_price(euros):
+    return f"{euros:,}".replace(",", ".") + "\xa0€"
+
+
+class Market:
+    def __init__(self, scale=10, seed=0, sample=None):
+        self.rng = random.Random(seed)
+        self.sample = sample if sample is not None else templates()
+        if not self.sample:
+            raise SystemExit("no snapshots to sample ads from")
+        self.size = max(1, int(len(self.sample) * scale))
+        self.next_id = FIRST_ID
+        self.live = {}
+
+    def new_ad(self, today):
+        template = self.rng.choice(self.sample)
+        ad_id = str(self.next_id)
+        self.next_id += 1
+        area = float((template.get("kvadratura") or "100 m2").split()[0]) or 100.0
+        euros = max(5_000, round(self.rng.lognormvariate(11.4, 0.45), -2))
+        return {
+            "title": template.get("title"),
+            "location": template.get("location"),
+            "kvadratura": template.get("kvadratura"),
+            "price": format_price(int(euros)),
+            "price_by_surface": f"{round(euros / area):,} €/m2".replace(",", "."),
+            "publish_date": today.strftime("%d.%m.%Y."),
+            "advertiser": template.get("advertiser"),
+            "id": ad_id,
+            "url": f"https://www.halooglasi.com/nekretnine/prodaja-kuca/synthetic/{ad_id}?kid=1",
+            "plot": template.get("plot", ""),
+        }
+
+    def reprice(self, ad):
+        euros = int(ad["price"].replace("\xa0€", "").replace(".", ""))
+        factor = self.rng.uniform(0.85, 0.99) if self.rng.random() < 0.9 else self.rng.uniform(1.01, 1.1)
+        return {**ad, "price": format_price(int(round(euros * factor, -2)))}
+
+    def step(self, today):
+        """Advance one day and return the day's ads."""
+        rng = self.rng
+        gone = [ad_id for ad_id in self.live if rng.random() < 1 / MEAN_LIFETIME_DAYS]
+        for ad_id in gone:
+            del self.live[ad_id]
+        for ad_id, ad in self.live.items():
+            if rng.random() < PRICE_CHANGE_PER_DAY:
+                self.live[ad_id] = self.reprice(ad)
+        wanted = self.size + int(rng.gauss(0, self.size ** 0.5)) - len(self.live)
+        for _ in range(max(0, wanted)):
+            ad = self.new_ad(today)
+            self.live[ad["id"]] = ad
+        return list(self.live.values())
+
+
+def market_days(scale=10, days=1000, seed=0, start=START_DATE, sample=None):
+    """Yield (date string, ads) for `days` consecutive days."""
+    market = Market(scale, seed, sample)
+    for n in range(days):
+        today = start + timedelta(days=n)
+        yield today.isoformat(), market.step(today)
+
+
+def write_market(out_dir, scale=10, days=1000, seed=0):
+    """Write data/*.json and price-history.json for a synthetic market."""
+    import json
+
+    data_dir = os.path.join(out_dir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    history = {}
+    total = 0
+    for day, ads in market_days(scale, days, seed):
+        with open(os.path.join(data_dir, f"{day}.json"), "w", encoding="utf-8") as f:
+            json.dump(ads, f, indent=2, ensure_ascii=False)
+        for ad in ads:
+            entries = history.setdefault(ad["id"], [])
+            if not entries or entries[-1]["price"] != ad["price"]:
+                entries.append({"date": day, "price": ad["price"]})
+        total += len(ads)
+    write_json(history, os.path.join(out_dir, "price-history.json"))
+    return total, len(history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--scale", type=float, default=10, help="market size vs the latest snapshot")
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    total, ads = write_market(args.out_dir, args.scale, args.days, args.seed)
+    print(f"Wrote {args.days} day(s), {total} listings of {ads} ads to {args.out_dir}/")
+
+
+if __name__ == "__main__":
+    main()
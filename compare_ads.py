@@ -1,15 +1,16 @@
-import json
 import os
 
-# Load ads from file
-def load_ads(filename):
-    with open(filename, 'r', encoding='utf-8') as f:
-        return json.load(f)
+from json_stream import iter_object
+from snapshot_store import open_store
+
+# Load ads for a snapshot date
+def load_ads(date):
+    return open_store().day(date)
 
 def load_price_history():
+    """{id: [last entry]}: the comparison below only looks at the last price."""
     if os.path.exists("price-history.json"):
-        with open("price-history.json", "r", encoding="utf-8") as f:
-            return json.load(f)
+        return {ad_id: entries[-1:] for ad_id, entries in iter_object("price-history.json")}
     return {}
 
 def remove_duplicates_by_id(ads):
@@ -26,8 +27,8 @@ def remove_duplicates_by_id(ads):
 # Main comparison logic
 if __name__ == "__main__":
     # Load data for 29th and 30th July
-    ads_29 = load_ads('data/2025-07-29.json')
-    ads_30 = load_ads('data/2025-07-30.json')
+    ads_29 = load_ads('2025-07-29')
+    ads_30 = load_ads('2025-07-30')
     
     # Load price history
     history = load_price_history()
@@ -0,0 +1,300 @@
+"""Resident mode: poll the newest listings every few minutes and alert at once.
+
+    python daemon.py [--pages 2] [--interval 300] [--cutoff 13:00] [--no-send] [--once]
+
+The daily run (main.py) only sees a new listing at the next cron, up to a
+day later. The daemon stays up instead and keeps, per search, the last
+known price of every ad in memory (seeded from the price history), an
+open plot cache and the relisting index of the last weeks:
+
+- every poll reads the first POLL_PAGES pages of each search sorted newest
+  first, stopping at the first page with nothing new or repriced;
+- new ads (not in the history and not a relisting) and price drops are
+  sent to Telegram right away, with their plot size;
+- the interval adapts: halved (down to MIN_INTERVAL_SEC) after a poll that
+  found something, half as long again (up to MAX_INTERVAL_SEC) after a
+  quiet one, and doubled per consecutive error;
+- once a day, at DAILY_CUTOFF UTC (the workflow's cron time), main.run writes the usual
+  snapshot and report, the report is sent as send_telegram would, and
+  the in-memory index is reseeded from the updated history.
+
+Alerts matching alert-rules.json also go to the chats of their rules
+(see alert_rules). What was alerted since the last daily run is kept in
+DAEMON_STATE, so a restart doesn't repeat the day's alerts. --no-send
+prints alerts instead.
+"""
+import argparse
+import html
+import itertools
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import main
+from ad import parse_price
+from alert_rules import load_rules, render_alert_blocks
+from daily_diff import ad_key, price_change
+from enrich_plot_sizes import enrich_ads
+from plot_cache import open_plot_cache
+from price_history import open_history
+from ratelimit import HostRateLimiter, TokenBucket
+from relistings import recent_index, split_relisted
+from report_format import render_telegram_blocks
+from run_metrics import metrics, read_run_log
+from searches import load_searches
+from send_telegram import CHAT_RATE_PER_SEC, BotClient, deliver, pack_chunks, send_alerts, send_reports
+from snapshot_store import close_stores, open_store
+
+POLL_PAGES = 2
+INTERVAL_SEC = 300
+MIN_INTERVAL_SEC = 120
+MAX_INTERVAL_SEC = 1800
+MAX_ERROR_BACKOFF_SEC = 3600
+JITTER = 0.1  # each sleep is stretched or shortened by up to this fraction
+DAILY_CUTOFF = "13:00"  # UTC, the workflow's cron hour
+DAEMON_STATE = "daemon-state.json"
+
+
+def load_state(path=DAEMON_STATE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=DAEMON_STATE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def is_drop(new_price, old_price):
+    new, old = parse_price(new_price), parse_price(old_price)
+    return new is not None and old is not None and new < old
+
+
+def last_run_date():
+    """The UTC date of the last run in the run log, or None.
+
+    A record's "date" is main's local date; "started" is UTC, like the cutoff.
+    """
+    dates = [r["started"][:10] for r in read_run_log() if r.get("started")]
+    return max(dates) if dates else None
+
+
+class Watch:
+    """One search's in-memory state between daily runs."""
+
+    def __init__(self, search, today, seen=None):
+        self.search = search
+        history = open_history(search.history_db, search.history_file)
+        self.prices = history.latest_prices()
+        history.close()
+        # Prices alerted on since the last daily run; the history lacks them.
+        self.seen = dict(seen or {})
+        self.prices.update(self.seen)
+        self.pending = {}  # prices seen by the last poll, noted once its alerts are out
+        self.relists = None
+        if main.DETECT_RELISTINGS:
+            self.relists = recent_index(open_store(search.store_file, data_dir=search.data_dir), today)
+
+    def note(self, ad_id, price):
+        self.prices[ad_id] = self.seen[ad_id] = price
+
+    def commit(self):
+        """Note the prices of the last poll; call once its alerts are delivered."""
+        for ad_id, price in self.pending.items():
+            self.note(ad_id, price)
+        self.pending = {}
+
+    def poll(self, pages=POLL_PAGES, limiter=None):
+        """(new ad dicts, [(ad dict, old price)] of price drops) since the last commit.
+
+        Nothing is noted until commit(), so a poll whose alerts fail finds
+        the same ads again next time.
+        """
+        new, drops = [], []
+        polled = set()
+        self.pending = {}
+        for page in range(1, pages + 1):
+            html_page = main.fetch_page_html(page, None, limiter, self.search.url + main.NEWEST_FIRST)
+            ads = main.parse_page(html_page)
+            changed = False
+            for ad in ads:
+                # The first listing of an id counts, as in unique_by_id.
+                if ad.key in polled:
+                    continue
+                polled.add(ad.key)
+                known = self.prices.get(ad.key)
+                if known == ad.price:
+                    continue
+                changed = True
+                if known is None:
+                    new.append(ad.to_dict())
+                elif is_drop(ad.price, known):
+                    drops.append((ad.to_dict(), known))
+                self.pending[ad.key] = ad.price
+            # Newest first: a page without news means the rest has none either.
+            if not changed:
+                break
+        if new and self.relists is not None:
+            matches = self.relists.match(new, active=polled)
+            originals = {ad_id: (ad_key(o), o['price']) for ad_id, o in matches.items()}
+            # A relisted house is only news if it came back cheaper.
+            new, relisted = split_relisted(new, originals)
+            drops += [(e, e["old_price"]) for e in relisted if is_drop(e["price"], e["old_price"])]
+        return new, drops
+
+
+class Daemon:
+    def __init__(self, args):
+        self.args = args
+        self.searches = load_searches(main.FILTER_URL)
+        self.plot_cache = open_plot_cache()
+        self.limiter = HostRateLimiter(main.CRAWL_RATE_PER_HOST)
+        self.client = self.chat_id = None
+        if not args.no_send:
+            self.client = BotClient(os.environ["TELEGRAM_BOT_TOKEN"])
+            self.chat_id = os.environ["TELEGRAM_CHAT_ID"]
+        self.bucket = TokenBucket(CHAT_RATE_PER_SEC)
+        self.buckets = {self.chat_id: self.bucket}
+        self.rules = load_rules()
+        self.interval = args.interval
+        self.errors = 0
+        self.last_daily = last_run_date()
+        self.seed(load_state().get("seen", {}))
+
+    def seed(self, seen=None):
+        today = main.today_str()
+        seen = seen or {}
+        self.watches = [Watch(s, today, seen.get(s.name)) for s in self.searches]
+
+    def save(self):
+        save_state({"seen": {w.search.name: w.seen for w in self.watches}})
+
+    def alert(self, watch, new, drops):
+        enrich_ads(new + [ad for ad, _ in drops], cache=self.plot_cache)
+        changes = {ad_key(ad): {"current": {**ad, **price_change(ad_key(ad), ad, old)}, "previous_price": old}
+                   for ad, old in drops}
+        blocks = render_telegram_blocks(new, changes)
+        title = watch.search.name if len(self.searches) > 1 else None
+        if title:
+            blocks = itertools.chain([f"<b>{html.escape(title)}</b>"], blocks)
+        routed = self.rules.route(new, changes, watch.search.name) if self.rules is not None else {}
+        if self.client is None:
+            print("\n\n".join(blocks))
+            for chat, (names, added, price_changes) in routed.items():
+                print(f"\n-> {chat}\n" + "\n\n".join(render_alert_blocks(names, added, price_changes, title)))
+            return
+        deliver(self.client, self.chat_id, pack_chunks(blocks), sent_file=None, bucket=self.bucket)
+        send_alerts(self.client, routed, buckets=self.buckets, sent_file=None, title=title)
+
+    def poll(self):
+        """Poll every search once and alert; True if anything was found."""
+        found = False
+        try:
+            for watch in self.watches:
+                new, drops = watch.poll(self.args.pages, self.limiter)
+                if new or drops:
+                    found = True
+                    print(f"{datetime.now():%H:%M} {watch.search.name}: {len(new)} new, {len(drops)} price drop(s)")
+                    self.alert(watch, new, drops)
+                watch.commit()
+        finally:
+            self.save()
+        return found
+
+    def cutoff(self, now):
+        hour, minute = map(int, self.args.cutoff.split(":"))
+        return now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    def daily_due(self, now):
+        """True once `now` (UTC) is past the cutoff and today's run hasn't happened."""
+        return now >= self.cutoff(now) and self.last_daily != f"{now:%Y-%m-%d}"
+
+    def daily(self, now):
+        """The usual daily run, then its report, then a fresh in-memory state.
+
+        `now` is the UTC time the run was due; its date is recorded as done.
+        """
+        print(f"{datetime.now():%H:%M} daily run")
+        metrics.reset()
+        try:
+            main.run()
+        except Exception as e:
+            # The next run recovers through the run journal; reopen the
+            # stores it may drop.
+            close_stores()
+            print(f"Daily run failed ({e!r}); retrying after the next poll")
+            return
+        self.last_daily = f"{now:%Y-%m-%d}"
+        if self.client is not None:
+            send_reports(self.client, self.chat_id, self.searches, bucket=self.bucket, rules=self.rules)
+        self.seed()
+        self.save()
+
+    def next_sleep(self, found, failed):
+        if failed:
+            self.errors += 1
+            delay = min(MAX_ERROR_BACKOFF_SEC, self.interval * 2 ** self.errors)
+        else:
+            self.errors = 0
+            if found:
+                self.interval = max(self.args.min_interval, self.interval / 2)
+            else:
+                self.interval = min(self.args.max_interval, self.interval * 1.5)
+            delay = self.interval
+        delay *= 1 + random.uniform(-JITTER, JITTER)
+        # Wake up for the daily run rather than oversleep it.
+        now = datetime.now(timezone.utc)
+        cutoff = self.cutoff(now)
+        if self.last_daily == f"{now:%Y-%m-%d}" or now >= cutoff:
+            cutoff += timedelta(days=1)
+        return max(1.0, min(delay, (cutoff - now).total_seconds()))
+
+    def run(self):
+        while True:
+            now = datetime.now(timezone.utc)
+            if self.daily_due(now):
+                self.daily(now)
+            found = failed = False
+            try:
+                found = self.poll()
+            except Exception as e:
+                failed = True
+                print(f"{datetime.now():%H:%M} poll failed: {e!r}")
+            if self.args.once:
+                return
+            time.sleep(self.next_sleep(found, failed))
+
+    def close(self):
+        self.plot_cache.close()
+        if self.client is not None:
+            self.client.close()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pages", type=int, default=POLL_PAGES, help="newest-first pages per poll")
+    parser.add_argument("--interval", type=float, default=INTERVAL_SEC, help="initial seconds between polls")
+    parser.add_argument("--min-interval", type=float, default=MIN_INTERVAL_SEC)
+    parser.add_argument("--max-interval", type=float, default=MAX_INTERVAL_SEC)
+    parser.add_argument("--cutoff", default=DAILY_CUTOFF, help="UTC time of the daily run (HH:MM)")
+    parser.add_argument("--no-send", action="store_true", help="print alerts instead of sending them")
+    parser.add_argument("--once", action="store_true", help="poll once (and run the daily run if due), then exit")
+    args = parser.parse_args()
+    daemon = Daemon(args)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main_cli()
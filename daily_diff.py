@@ -0,0 +1,179 @@
+"""Day-over-day diff against a persisted state index.
+
+Reports compare today's ads with the second-latest snapshot before today
+(the "base"), not with yesterday's (the "head"). The index keeps the head
+as one row per ad id with a fingerprint of the whole ad, plus an undo log
+holding the base version of every ad that changed between base and head.
+A daily diff is then a streaming pass over today's ads plus work
+proportional to the number of changes; nothing reloads a whole snapshot.
+
+The tables live in the snapshot store. If the index doesn't describe the
+two snapshots before `today` (first run, gap in the store, same-day rerun)
+it is rebuilt from the store.
+"""
+import hashlib
+import json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    ad_id TEXT PRIMARY KEY,
+    fp TEXT NOT NULL,
+    price TEXT,
+    ad TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS state_undo (
+    ad_id TEXT PRIMARY KEY,
+    ad TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS state_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def ad_key(ad):
+    return str(ad['id']).strip()
+
+
+def unique_by_id(ads):
+    """{id: ad} keeping the first occurrence, in list order."""
+    unique = {}
+    for ad in ads:
+        unique.setdefault(ad_key(ad), ad)
+    return unique
+
+
+def encode(ad):
+    """(fingerprint, json) for one ad; any field change changes the fingerprint."""
+    blob = json.dumps(ad, ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest(), blob
+
+
+def price_change(ad_id, current_ad, old_price):
+    return {
+        "id": ad_id,
+        "url": current_ad['url'],
+        "title": current_ad['title'],
+        "location": current_ad['location'],
+        "kvadratura": current_ad['kvadratura'],
+        "plot": current_ad.get('plot', ''),
+        "price": current_ad['price'],
+        "old_price": old_price,
+    }
+
+
+def diff_ads(current, previous):
+    """(removed, price_changed) between two {id: ad} dicts.
+
+    price_changed follows `current` order, removed is sorted by id.
+    """
+    removed = [previous[k] for k in sorted(previous.keys() - current.keys())]
+    price_changed = [
+        price_change(ad_id, ad, previous[ad_id]['price'])
+        for ad_id, ad in current.items()
+        if ad_id in previous and ad['price'] != previous[ad_id]['price']
+    ]
+    return removed, price_changed
+
+
+class StateIndex:
+    def __init__(self, store):
+        self.store = store
+        self.db = store.db
+        self.db.executescript(SCHEMA)
+
+    def _meta(self):
+        return dict(self.db.execute("SELECT key, value FROM state_meta"))
+
+    def _ensure(self, today):
+        """Make the index describe the two stored snapshots before `today`."""
+        before = [d for d in self.store.dates() if d < today]
+        head = before[-1] if before else ""
+        base = before[-2] if len(before) >= 2 else ""
+        meta = self._meta()
+        if meta.get("head") == head and meta.get("base") == base:
+            return
+        head_ads = unique_by_id(self.store.day(head)) if head else {}
+        base_ads = unique_by_id(self.store.day(base)) if base else {}
+        undo = []
+        for ad_id, ad in head_ads.items():
+            if ad_id not in base_ads:
+                undo.append((ad_id, None))
+            elif encode(ad)[0] != encode(base_ads[ad_id])[0]:
+                undo.append((ad_id, encode(base_ads[ad_id])[1]))
+        undo.extend((ad_id, encode(ad)[1]) for ad_id, ad in base_ads.items() if ad_id not in head_ads)
+        rows = [(ad_id, *encode(ad), ad['price']) for ad_id, ad in head_ads.items()]
+        with self.db:
+            self.db.execute("DELETE FROM state")
+            self.db.execute("DELETE FROM state_undo")
+            self.db.executemany("INSERT INTO state (ad_id, fp, ad, price) VALUES (?, ?, ?, ?)", rows)
+            self.db.executemany("INSERT INTO state_undo (ad_id, ad) VALUES (?, ?)", undo)
+            self._set_meta(head, base)
+
+    def _set_meta(self, head, base):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO state_meta (key, value) VALUES (?, ?)",
+            (("head", head), ("base", base)))
+
+    def _head_blobs(self, ad_ids):
+        """{id: stored ad json} for the given ids that are in the head."""
+        ad_ids = list(ad_ids)
+        found = {}
+        for i in range(0, len(ad_ids), 900):
+            chunk = ad_ids[i:i + 900]
+            marks = ",".join("?" * len(chunk))
+            found.update(self.db.execute(
+                f"SELECT ad_id, ad FROM state WHERE ad_id IN ({marks})", chunk))
+        return found
+
+    def diff(self, today, current):
+        """(removed, price_changed) of `current` ({id: ad}) against the base."""
+        self._ensure(today)
+        head = {ad_id: price for ad_id, price in self.db.execute("SELECT ad_id, price FROM state")}
+        undo = {ad_id: json.loads(ad) if ad else None
+                for ad_id, ad in self.db.execute("SELECT ad_id, ad FROM state_undo")}
+
+        def base_price(ad_id):
+            if ad_id in undo:
+                return undo[ad_id]['price'] if undo[ad_id] else None
+            return head[ad_id]
+
+        def in_base(ad_id):
+            return undo[ad_id] is not None if ad_id in undo else ad_id in head
+
+        price_changed = [
+            price_change(ad_id, ad, base_price(ad_id))
+            for ad_id, ad in current.items()
+            if in_base(ad_id) and ad['price'] != base_price(ad_id)
+        ]
+        gone = sorted(ad_id for ad_id in head.keys() | undo.keys()
+                      if ad_id not in current and in_base(ad_id))
+        from_head = self._head_blobs(ad_id for ad_id in gone if ad_id not in undo)
+        removed = [undo[ad_id] if ad_id in undo else json.loads(from_head[ad_id]) for ad_id in gone]
+        return removed, price_changed
+
+    def advance(self, today, current):
+        """Make `current` ({id: ad}) the head; the old head becomes the base."""
+        self._ensure(today)
+        meta = self._meta()
+        head = dict(self.db.execute("SELECT ad_id, fp FROM state"))
+        upserts = []
+        undo_ids = []
+        for ad_id, ad in current.items():
+            fp, blob = encode(ad)
+            if head.get(ad_id) != fp:
+                upserts.append((ad_id, fp, ad['price'], blob))
+                undo_ids.append(ad_id)
+        gone = [ad_id for ad_id in head if ad_id not in current]
+        undo_ids.extend(gone)
+        old = self._head_blobs(undo_ids)
+        with self.db:
+            self.db.execute("DELETE FROM state_undo")
+            self.db.executemany(
+                "INSERT INTO state_undo (ad_id, ad) VALUES (?, ?)",
+                ((ad_id, old.get(ad_id)) for ad_id in undo_ids))
+            self.db.executemany("DELETE FROM state WHERE ad_id = ?", ((ad_id,) for ad_id in gone))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO state (ad_id, fp, price, ad) VALUES (?, ?, ?, ?)", upserts)
+            self._set_meta(today, meta.get("head", ""))
@@ -2,69 +2,111 @@
 
 Reads ad IDs and URLs from every snapshot under data/, then fetches each
 detail page and extracts the plot area from the embedded QuidditaEnvironment
-JSON. Results are cached in plot-sizes.json keyed by ad id, so the script
-is resumable and only fetches IDs not yet in the cache.
+JSON. Results are cached in plot-cache.db keyed by ad id (see plot_cache),
+so the script is resumable and only fetches IDs not yet in the cache.
+
+Detail pages are fetched by a small worker pool sharing one token bucket,
+so the request rate stays the same no matter how many workers run.
 """
-from curl_cffi import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
-import os
+import random
 import re
-import sys
+import threading
 import time
 from datetime import datetime
 
+from http_client import thread_session
+from plot_cache import TIME_FORMAT, is_transient, open_plot_cache
+from ratelimit import TokenBucket
+from run_metrics import count_body, metrics
+from snapshot_store import open_store
+
 DATA_DIR = "data"
-CACHE_FILE = "plot-sizes.json"
 REQUEST_DELAY_SEC = 0.3
+REQUESTS_PER_SEC = 1 / REQUEST_DELAY_SEC
+WORKERS = 4
+MAX_RETRIES = 3
+RETRY_BACKOFF_SEC = 1.0
+MAX_CONSECUTIVE_FAILURES = 5  # across ads; the rest of the run is skipped after that
 SAVE_EVERY = 25
+SAVE_INTERVAL_SEC = 30
+PROGRESS_EVERY = 10
 TIMEOUT = 20
 
-scraper = requests.Session(impersonate="chrome")
-
 CLASSIFIED_RX = re.compile(r'CurrentClassified\s*=\s*(\{.*?\});', re.DOTALL)
+CLASSIFIED_START_RX = re.compile(r'CurrentClassified\s*=\s*\{')
+OTHER_FIELDS_RX = re.compile(r'"OtherFields"\s*:\s*')
+PLOT_FIELDS = ("povrsina_placa_d", "povrsina_placa_d_unit_s")
 
+_decoder = json.JSONDecoder()
 
-def collect_ad_urls():
-    """Walk every snapshot and return a dict id -> most-recent url."""
-    url_map = {}
-    for fn in sorted(os.listdir(DATA_DIR)):
-        with open(os.path.join(DATA_DIR, fn), encoding="utf-8") as f:
-            ads = json.load(f)
-        for a in ads:
-            i = str(a.get("id", "")).strip()
-            u = a.get("url")
-            if i and u:
-                url_map[i] = u  # later snapshots overwrite — fine
-    return url_map
 
+def collect_ad_urls():
+    """Return a dict id -> most-recent url across every snapshot."""
+    return open_store(data_dir=DATA_DIR).url_map()
 
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, encoding="utf-8") as f:
-            return json.load(f)
-    return {}
 
+def _scan_other_fields(html):
+    """Decode just the OtherFields object of the CurrentClassified blob.
 
-def save_cache(cache):
-    tmp = CACHE_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(cache, f, indent=2, ensure_ascii=False)
-    os.replace(tmp, CACHE_FILE)
+    The blob ends at the first '};' after its opening brace, as with
+    CLASSIFIED_RX. Returns None if OtherFields can't be found that way.
+    """
+    m = CLASSIFIED_START_RX.search(html)
+    if not m:
+        return None
+    start = m.end() - 1
+    end = html.find("};", start)
+    if end < 0:
+        return None
+    f = OTHER_FIELDS_RX.search(html, start, end)
+    if not f:
+        return None
+    try:
+        other, stop = _decoder.raw_decode(html, f.end())
+    except json.JSONDecodeError:
+        return None
+    if stop > end + 1 or not (other is None or isinstance(other, dict)):
+        return None
+    return other or {}
 
 
-def extract_plot(html):
-    """Return (plot_value, plot_unit) or (None, None) if not found."""
+def _decode_other_fields(html):
+    """Full decode of the CurrentClassified blob; slow but tolerant."""
     m = CLASSIFIED_RX.search(html)
     if not m:
-        return None, None
+        return None
     try:
         obj = json.loads(m.group(1))
     except json.JSONDecodeError:
+        return None
+    return obj.get("OtherFields") or {}
+
+
+def extract_other_fields(html, keys=PLOT_FIELDS):
+    """Return {key: value} for the requested OtherFields keys, or None.
+
+    Tries the targeted scan first and falls back to decoding the whole
+    blob. Missing keys map to None; keys=None returns all of OtherFields.
+    """
+    other = _scan_other_fields(html)
+    if other is None:
+        other = _decode_other_fields(html)
+        if other is None:
+            return None
+    if keys is None:
+        return other
+    return {k: other.get(k) for k in keys}
+
+
+def extract_plot(html):
+    """Return (plot_value, plot_unit) or (None, None) if not found."""
+    fields = extract_other_fields(html)
+    if not fields:
         return None, None
-    other = obj.get("OtherFields") or {}
-    val = other.get("povrsina_placa_d")
-    unit = other.get("povrsina_placa_d_unit_s")
+    val = fields["povrsina_placa_d"]
+    unit = fields["povrsina_placa_d_unit_s"]
     if val is None:
         return None, None
     try:
@@ -74,12 +116,16 @@ def extract_plot(html):
     return val, unit
 
 
-def fetch_one(url):
+def fetch_one(url, session=None):
     """Return dict with status + extracted fields."""
     try:
-        r = scraper.get(url, timeout=TIMEOUT)
+        with metrics.timed("detail_latency"):
+            r = (session or thread_session()).get(url, timeout=TIMEOUT)
     except Exception as e:
+        metrics.count("detail_errors")
         return {"status": "error", "error": str(e)[:200]}
+    metrics.count("detail_requests")
+    count_body("detail", r)
     if r.status_code != 200:
         return {"status": f"http_{r.status_code}"}
     val, unit = extract_plot(r.text)
@@ -106,72 +152,153 @@ def format_plot(entry):
     return f"{val:g} {unit}"
 
 
-def enrich_ads(ads, *, delay_sec=REQUEST_DELAY_SEC):
+class CircuitBreaker:
+    """Opens after `limit` transient failures in a row, counted across workers.
+
+    While the site is down every ad would otherwise sit through its own
+    backoff; once open, the remaining fetches fail at once and are retried
+    on the next run.
+    """
+
+    def __init__(self, limit=MAX_CONSECUTIVE_FAILURES):
+        self.limit = limit
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    @property
+    def open(self):
+        return self.failures >= self.limit
+
+    def record(self, result):
+        with self.lock:
+            self.failures = self.failures + 1 if is_transient(result) else 0
+            if self.failures == self.limit:
+                print(f"  {self.limit} detail fetches failed in a row; skipping the rest", flush=True)
+
+
+def fetch_with_retry(url, bucket, session=None, retries=MAX_RETRIES, breaker=None):
+    """fetch_one, retrying transient failures with jittered exponential backoff.
+
+    With a `breaker`, nothing is fetched once it is open.
+    """
+    attempt = 0
+    while True:
+        if breaker and breaker.open:
+            metrics.count("detail_skipped")
+            return {"status": "error", "error": "skipped: too many failures in a row"}
+        bucket.acquire()
+        result = fetch_one(url, session)
+        if breaker:
+            breaker.record(result)
+        if not is_transient(result) or attempt >= retries or (breaker and breaker.open):
+            return result
+        delay = RETRY_BACKOFF_SEC * 2 ** attempt
+        time.sleep(delay + random.uniform(0, delay))
+        attempt += 1
+
+
+class Progress:
+    """Prints done/total, ok/failed counts, throughput and ETA."""
+
+    def __init__(self, total, every=PROGRESS_EVERY):
+        self.total = total
+        self.every = every
+        self.done = 0
+        self.ok = 0
+        self.failed = 0
+        self.started = time.time()
+
+    def update(self, result):
+        self.done += 1
+        if result["status"] == "ok":
+            self.ok += 1
+        else:
+            self.failed += 1
+        if self.done % self.every == 0 or self.done == self.total:
+            print(self.line(), flush=True)
+
+    def line(self):
+        elapsed = time.time() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0
+        eta = (self.total - self.done) / rate if rate > 0 else 0
+        return (
+            f"  [{self.done}/{self.total}] ok={self.ok} failed={self.failed} "
+            f"rate={rate:.1f}/s eta={eta:.0f}s"
+        )
+
+
+def fetch_many(todo, cache, *, workers=WORKERS, rate=REQUESTS_PER_SEC, progress=None):
+    """Fetch (id, url) pairs in parallel and store the results in `cache`.
+
+    Results are written to the PlotCache every SAVE_EVERY results or
+    SAVE_INTERVAL_SEC seconds, whichever comes first, and once more at the end.
+    """
+    bucket = TokenBucket(rate, burst=workers)
+    breaker = CircuitBreaker()
+    pending = []
+    last_save = time.time()
+
+    def work(url):
+        return fetch_with_retry(url, bucket, thread_session(), breaker=breaker)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(work, url): aid for aid, url in todo}
+        for future in as_completed(futures):
+            result = future.result()
+            result["fetched_at"] = datetime.now().strftime(TIME_FORMAT)
+            pending.append((futures[future], result))
+            if progress:
+                progress.update(result)
+            if len(pending) >= SAVE_EVERY or time.time() - last_save >= SAVE_INTERVAL_SEC:
+                cache.put_many(pending)
+                pending = []
+                last_save = time.time()
+    if pending:
+        cache.put_many(pending)
+
+
+def enrich_ads(ads, *, workers=WORKERS, rate=REQUESTS_PER_SEC, cache=None):
     """Enrich each ad dict with a 'plot' field (formatted string, may be '').
 
-    Uses the on-disk cache. Fetches detail pages only for ads not yet cached.
-    Persists the cache after each new fetch so partial runs aren't wasted.
+    Looks all ids up in the plot cache at once and fetches detail pages only
+    for ads that aren't cached or whose entry has expired. Returns the number
+    of detail pages fetched. A long-lived caller can pass its own open
+    PlotCache as `cache`.
     """
-    cache = load_cache()
-    new_fetches = 0
+    own_cache = cache is None
+    cache = cache or open_plot_cache()
+    urls = {}
+    for ad in ads:
+        aid = str(ad.get("id", "")).strip()
+        if aid and ad.get("url"):
+            urls.setdefault(aid, ad["url"])
+    entries, todo = cache.due(urls)
+    if todo:
+        fetch_many([(aid, urls[aid]) for aid in todo], cache, workers=workers, rate=rate)
+        entries.update(cache.get_many(todo))
+    if own_cache:
+        cache.close()
     for ad in ads:
         aid = str(ad.get("id", "")).strip()
-        if not aid:
-            ad["plot"] = ""
-            continue
-        if aid not in cache:
-            url = ad.get("url")
-            if not url:
-                ad["plot"] = ""
-                continue
-            result = fetch_one(url)
-            result["fetched_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cache[aid] = result
-            new_fetches += 1
-            save_cache(cache)
-            time.sleep(delay_sec)
-        ad["plot"] = format_plot(cache[aid])
-    return new_fetches
+        ad["plot"] = format_plot(entries.get(aid)) if aid else ""
+    return len(todo)
 
 
 def main():
     url_map = collect_ad_urls()
-    cache = load_cache()
-    todo = [(i, u) for i, u in url_map.items() if i not in cache]
+    cache = open_plot_cache()
+    cached = cache.get_many(url_map)
+    todo = [(i, u) for i, u in url_map.items() if i not in cached]
     print(f"Total ads known:    {len(url_map)}")
-    print(f"Already cached:     {len(cache)}")
+    print(f"Already cached:     {len(cached)}")
     print(f"To fetch:           {len(todo)}")
     if not todo:
         print("Nothing to do.")
         return
 
-    started = time.time()
-    ok = 0
-    failed = 0
-    for n, (aid, url) in enumerate(todo, 1):
-        result = fetch_one(url)
-        result["fetched_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cache[aid] = result
-        if result["status"] == "ok":
-            ok += 1
-        else:
-            failed += 1
-
-        if n % 10 == 0 or n == len(todo):
-            elapsed = time.time() - started
-            rate = n / elapsed if elapsed > 0 else 0
-            eta = (len(todo) - n) / rate if rate > 0 else 0
-            print(
-                f"  [{n}/{len(todo)}] ok={ok} failed={failed} "
-                f"rate={rate:.1f}/s eta={eta:.0f}s",
-                flush=True,
-            )
-        if n % SAVE_EVERY == 0:
-            save_cache(cache)
-        time.sleep(REQUEST_DELAY_SEC)
-
-    save_cache(cache)
-    print(f"\nDone. ok={ok} failed={failed}")
+    progress = Progress(len(todo))
+    fetch_many(todo, cache, progress=progress)
+    print(f"\nDone. ok={progress.ok} failed={progress.failed}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+"""Conditional-request cache for scraper sessions, plus a parsed-block cache.
+
+CachedSession wraps a curl_cffi session. It remembers each URL's ETag and
+Last-Modified, sends If-None-Match / If-Modified-Since on the next request,
+and answers a 304 with the stored body. Bodies are kept zlib-compressed and
+evicted least-recently-used once they pass `max_bytes`.
+
+The block cache maps the SHA-1 of one product-item's HTML (and the base url
+the parsed ads' urls start with) to the ad dicts parsed from it, so listing blocks that are byte-for-byte unchanged since the
+last run skip parsing (see listing_parser.parse_ads_cached).
+
+Everything lives in http-cache.db and is safe to delete.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+CACHE_DB = "http-cache.db"
+MAX_BYTES = 64 * 1024 * 1024
+MAX_BLOCKS = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_use ON responses (used);
+CREATE TABLE IF NOT EXISTS blocks (
+    hash TEXT PRIMARY KEY,
+    ads TEXT NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_by_use ON blocks (used);
+"""
+
+
+class HttpCache:
+    def __init__(self, path=CACHE_DB, max_bytes=MAX_BYTES, max_blocks=MAX_BLOCKS):
+        self.max_bytes = max_bytes
+        self.max_blocks = max_blocks
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = dict.fromkeys(
+            ("requests", "not_modified", "stored", "evicted", "block_hits", "block_misses"), 0)
+
+    def close(self):
+        self.db.close()
+
+    def count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    # --- HTTP responses -----------------------------------------------------
+
+    def validators(self, url):
+        with self.lock:
+            return self.db.execute(
+                "SELECT etag, last_modified FROM responses WHERE url = ?", (url,)).fetchone()
+
+    def body(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT body FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE responses SET used = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def store(self, url, etag, last_modified, text):
+        body = zlib.compress(text.encode("utf-8"))
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, body, size, used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body, len(body), time.time()))
+            self._evict_responses()
+            self.db.commit()
+            self.count("stored")
+
+    def _evict_responses(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self.db.execute(
+                "SELECT url, size FROM responses ORDER BY used").fetchall():
+            self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.count("evicted")
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    # --- parsed listing blocks ----------------------------------------------
+
+    def get_blocks(self, hashes):
+        """{hash: ads} for the hashes that are cached."""
+        hashes = list(hashes)
+        found = {}
+        with self.lock:
+            for i in range(0, len(hashes), 900):
+                chunk = hashes[i:i + 900]
+                marks = ",".join("?" * len(chunk))
+                found.update(self.db.execute(
+                    f"SELECT hash, ads FROM blocks WHERE hash IN ({marks})", chunk))
+            self.db.executemany(
+                "UPDATE blocks SET used = ? WHERE hash = ?", ((time.time(), h) for h in found))
+            self.db.commit()
+            self.count("block_hits", len(found))
+            self.count("block_misses", len(hashes) - len(found))
+        return {h: json.loads(ads) for h, ads in found.items()}
+
+    def put_blocks(self, parsed):
+        """Store {hash: ads} and trim the table to max_blocks."""
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO blocks (hash, ads, used) VALUES (?, ?, ?)",
+                ((h, json.dumps(ads, ensure_ascii=False), now) for h, ads in parsed.items()))
+            excess = self.db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0] - self.max_blocks
+            if excess > 0:
+                self.db.execute(
+                    "DELETE FROM blocks WHERE hash IN "
+                    "(SELECT hash FROM blocks ORDER BY used LIMIT ?)", (excess,))
+            self.db.commit()
+
+    def summary(self):
+        s = self.stats
+        return (
+            f"HTTP cache: {s['requests']} request(s), {s['not_modified']} not modified, "
+            f"{s['stored']} stored, {s['evicted']} evicted; "
+            f"blocks: {s['block_hits']} hit(s), {s['block_misses']} miss(es)"
+        )
+
+
+def block_hash(block, base_url=""):
+    return hashlib.sha1(f"{base_url}\0{block}".encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    """Stand-in for a 304 answered from the cache."""
+
+    status_code = 200
+    from_cache = True
+
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+class CachedSession:
+    """Wraps a session's get() with conditional requests against `cache`."""
+
+    def __init__(self, session, cache):
+        self.session = session
+        self.cache = cache
+
+    def get(self, url, headers=None, **kwargs):
+        headers = dict(headers or {})
+        known = self.cache.validators(url)
+        if known:
+            etag, last_modified = known
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        self.cache.count("requests")
+        response = self.session.get(url, headers=headers, **kwargs)
+        if response.status_code == 304:
+            text = self.cache.body(url)
+            if text is not None:
+                self.cache.count("not_modified")
+                return CachedResponse(url, text)
+            # Lost the body somehow; ask again without validators.
+            return self.session.get(url, **kwargs)
+        if response.status_code == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.cache.store(url, etag, last_modified, response.text)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
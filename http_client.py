@@ -0,0 +1,42 @@
+"""Shared curl_cffi session helpers for the scrapers.
+
+Sessions, and curl_cffi itself, are only created when a scraper first asks
+for one, so modules that merely import the scrapers stay light.
+"""
+import threading
+
+from http_cache import CachedSession, HttpCache
+
+IMPERSONATE = "chrome"
+HTTP_CACHE = True  # conditional requests + parsed-block cache, see http_cache
+
+_thread_local = threading.local()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide HttpCache, or None when HTTP_CACHE is off."""
+    global _cache
+    if not HTTP_CACHE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache()
+    return _cache
+
+
+def new_session():
+    from curl_cffi import requests
+
+    session = requests.Session(impersonate=IMPERSONATE)
+    cache = get_cache()
+    return CachedSession(session, cache) if cache else session
+
+
+def thread_session():
+    """Return this thread's session; curl_cffi sessions are not thread-safe."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = _thread_local.session = new_session()
+    return session
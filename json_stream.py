@@ -0,0 +1,123 @@
+"""Read large JSON files one record at a time.
+
+Snapshots are a top-level array of ads and price-history.json /
+plot-sizes.json a top-level object keyed by ad id. json.load builds the
+whole file in memory; these readers go through it in CHUNK_SIZE pieces and
+yield one element (or member) at a time, so memory is bounded by the
+largest record rather than the file.
+
+    for ad in iter_array("data/2025-08-01.json", fields=("id", "url")):
+        ...
+    for ad_id, entries in iter_object("price-history.json"):
+        ...
+
+Each record is decoded by the C scanner behind json.JSONDecoder and then
+projected onto `fields`; skipping unwanted values in Python would cost more
+than decoding them.
+"""
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+
+_scan = json.JSONDecoder().scan_once  # raw_decode without the Python frame
+_WS = re.compile(r"[ \t\n\r]*")
+_PUNCT = re.compile(r"[ \t\n\r]*([\[\]{},:])[ \t\n\r]*")
+_NUMBER_TAIL = frozenset("0123456789.eE+-") | {""}
+
+
+class _Reader:
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        """Append at least `size` more characters; False at end of file."""
+        data = self.f.read(max(size or 0, self.chunk_size))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """The next non-whitespace character, or "" at end of file."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        m = _PUNCT.match(self.buf, self.pos)  # fast path: all in the buffer
+        if m and m.group(1) in chars:
+            self.pos = m.end()
+            return m.group(1)
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"{getattr(self.f, 'name', 'JSON')}: expected {chars!r} at {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        if self.pos >= len(self.buf) or self.buf[self.pos] in " \t\n\r":
+            self.peek()
+        while True:
+            try:
+                value, end = _scan(self.buf, self.pos)
+            except (StopIteration, json.JSONDecodeError):
+                # Cut off mid-record: read more, doubling so long records
+                # aren't rescanned once per chunk.
+                if self.fill(len(self.buf)):
+                    continue
+                raise ValueError(f"{getattr(self.f, 'name', 'JSON')}: invalid JSON "
+                                 f"at {self.buf[self.pos:self.pos + 40]!r}") from None
+            # A number cut off by the end of the buffer ("1" of "1.5") decodes
+            # fine; only the next character tells.
+            if self.buf[end:end + 1] in _NUMBER_TAIL and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def project(record, fields):
+    """`record` with only `fields` (those it has), or unchanged if `fields` is None."""
+    if fields is None or not isinstance(record, dict):
+        return record
+    return {k: record[k] for k in fields if k in record}
+
+
+def iter_array(path, fields=None, chunk_size=CHUNK_SIZE):
+    """Yield the elements of the top-level array in `path`, projected onto `fields`."""
+    with open(path, encoding="utf-8") as f:
+        reader = _Reader(f, chunk_size)
+        reader.expect("[")
+        if reader.peek() == "]":
+            return
+        while True:
+            yield project(reader.value(), fields)
+            if reader.expect(",]") == "]":
+                return
+
+
+def iter_object(path, fields=None, chunk_size=CHUNK_SIZE):
+    """Yield (key, value) for the members of the top-level object in `path`.
+
+    With `fields`, object values are projected onto them.
+    """
+    with open(path, encoding="utf-8") as f:
+        reader = _Reader(f, chunk_size)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise ValueError(f"{path}: object key {key!r} is not a string")
+            reader.expect(":")
+            yield key, project(reader.value(), fields)
+            if reader.expect(",}") == "}":
+                return
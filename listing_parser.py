@@ -0,0 +1,262 @@
+"""Turn a halooglasi listing page into ad dicts.
+
+Two interchangeable backends produce identical output:
+
+- "lxml": libxml2 parse plus XPath expressions compiled once, on first use.
+- "bs4": the original BeautifulSoup html.parser path, restricted with a
+  SoupStrainer to the product-item nodes. parse_ads_bs4(html, strain=False)
+  still builds the full tree as it originally did; it is the reference the
+  other paths are checked against.
+
+Neither library is imported until a page is parsed, so importing this
+module (and main) stays cheap for code that never scrapes.
+PARSER_BACKEND = "auto" picks lxml when it is installed. parse_ads_cached
+splits a page into product-item blocks and only parses blocks whose hash
+isn't in the block cache (see http_cache). Run this module
+with saved listing pages as arguments to check every path agrees with the
+full-tree parse (tests/test_listing_parser.py does so for the fixtures):
+
+    python listing_parser.py page1.html page2.html
+"""
+import importlib.util
+import os
+import re
+import sys
+from functools import lru_cache
+
+from http_cache import block_hash
+
+# lxml is optional, bs4 is always available
+HAVE_LXML = importlib.util.find_spec("lxml") is not None
+
+PARSER_BACKEND = "auto"
+# HALOOGLASI_URL points the scrapers somewhere else, e.g. benchmarks/fixture_server.py.
+BASE_URL = os.environ.get("HALOOGLASI_URL", "https://www.halooglasi.com")
+
+KVADRATURA_RX = re.compile(r"[\d,.]+")
+PRODUCT_ITEM_START_RX = re.compile(
+    r"""<div\b[^>]*\bclass\s*=\s*["'][^"']*(?<![\w-])product-item(?![\w-])""", re.I)
+
+
+def normalize_kvadratura(text):
+    """'1.234,5 m2' -> '1234.5 m2'. Empty input is returned unchanged."""
+    if not text:
+        return text
+    match = KVADRATURA_RX.search(text)
+    return match.group(0).replace(".", "").replace(",", ".") + " m2" if match else None
+
+
+def build_ad(*, title, location, kvadratura, price, price_by_surface,
+             publish_date, advertiser, ad_id, url):
+    return {
+        'title': title,
+        'location': location,
+        'kvadratura': normalize_kvadratura(kvadratura),
+        'price': price,
+        'price_by_surface': price_by_surface,
+        'publish_date': publish_date,
+        'advertiser': advertiser,
+        'id': ad_id,
+        'url': f"{BASE_URL}{url}",
+    }
+
+
+# --- BeautifulSoup backend -------------------------------------------------
+
+@lru_cache(maxsize=None)
+def product_items():
+    from bs4 import SoupStrainer
+
+    # Match against the raw class attribute: at parse time it is not yet split
+    # into a list, so class_='product-item' would miss multi-class divs.
+    return SoupStrainer('div', class_=re.compile(r'(?:^|\s)product-item(?:\s|$)'))
+
+
+def parse_ads_bs4(html, strain=True):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser', parse_only=product_items() if strain else None)
+    results = []
+
+    for ad in soup.find_all('div', class_='product-item'):
+        title_tag = ad.select_one('h3.product-title a')
+        url = title_tag['href'] if title_tag else None
+        if not url:
+            continue
+        price_tag = ad.select_one('.central-feature i')
+        location_tag = ad.select_one('ul.subtitle-places')
+        location_parts = location_tag.find_all('li') if location_tag else []
+        location_full = " | ".join([li.get_text(strip=True) for li in location_parts]) if location_parts else None
+
+        publish_date_tag = ad.select_one('span.publish-date')
+        advertiser_tag = ad.select_one('span[data-field-name="oglasivac_nekretnine_s"]')
+        price_by_surface_tag = ad.select_one('div.price-by-surface span')
+
+        kvadratura_tag = None
+        for li in ad.select('ul.product-features li'):
+            if 'Kvadratura' in li.get_text():
+                kvadratura_tag = li.select_one('.value-wrapper')
+                break
+
+        results.append(build_ad(
+            title=title_tag.get_text(strip=True),
+            location=location_full,
+            kvadratura=kvadratura_tag.get_text(strip=True) if kvadratura_tag else None,
+            price=price_tag.get_text(strip=True) if price_tag else None,
+            price_by_surface=price_by_surface_tag.get_text(strip=True) if price_by_surface_tag else None,
+            publish_date=publish_date_tag.get_text(strip=True) if publish_date_tag else None,
+            advertiser=advertiser_tag.get_text(strip=True) if advertiser_tag else None,
+            ad_id=ad.get('data-id'),
+            url=url,
+        ))
+
+    return results
+
+
+# --- lxml backend ----------------------------------------------------------
+
+def _cls(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+class XPaths:
+    """The lxml backend's compiled expressions."""
+
+    def __init__(self):
+        from lxml import etree, html as lxml_html
+
+        self.fromstring = lxml_html.fromstring
+        self.product_items = etree.XPath(f"//div[{_cls('product-item')}]")
+        self.title = etree.XPath(f".//h3[{_cls('product-title')}]//a")
+        self.price = etree.XPath(f".//*[{_cls('central-feature')}]//i")
+        self.location = etree.XPath(f".//ul[{_cls('subtitle-places')}]")
+        self.li = etree.XPath(".//li")
+        self.publish_date = etree.XPath(f".//span[{_cls('publish-date')}]")
+        self.advertiser = etree.XPath(".//span[@data-field-name='oglasivac_nekretnine_s']")
+        self.price_by_surface = etree.XPath(f".//div[{_cls('price-by-surface')}]//span")
+        self.features = etree.XPath(f".//ul[{_cls('product-features')}]//li")
+        self.value_wrapper = etree.XPath(f".//*[{_cls('value-wrapper')}]")
+        self.text = etree.XPath(".//text()")
+
+
+@lru_cache(maxsize=None)
+def xpaths():
+    return XPaths()
+
+
+def _first(xpath, el):
+    found = xpath(el)
+    return found[0] if found else None
+
+
+def _text(el, strip=True):
+    """Mirror of bs4's get_text(strip=...)."""
+    if el is None:
+        return None
+    if strip:
+        return "".join(t.strip() for t in xpaths().text(el))
+    return "".join(xpaths().text(el))
+
+
+def parse_ads_lxml(html):
+    if not html.strip():
+        return []
+    x = xpaths()
+    root = x.fromstring(html)
+    results = []
+
+    for ad in x.product_items(root):
+        title_tag = _first(x.title, ad)
+        url = title_tag.get('href') if title_tag is not None else None
+        if not url:
+            continue
+        location_tag = _first(x.location, ad)
+        location_parts = x.li(location_tag) if location_tag is not None else []
+        location_full = " | ".join([_text(li) for li in location_parts]) if location_parts else None
+
+        kvadratura_tag = None
+        for li in x.features(ad):
+            if 'Kvadratura' in _text(li, strip=False):
+                kvadratura_tag = _first(x.value_wrapper, li)
+                break
+
+        results.append(build_ad(
+            title=_text(title_tag),
+            location=location_full,
+            kvadratura=_text(kvadratura_tag),
+            price=_text(_first(x.price, ad)),
+            price_by_surface=_text(_first(x.price_by_surface, ad)),
+            publish_date=_text(_first(x.publish_date, ad)),
+            advertiser=_text(_first(x.advertiser, ad)),
+            ad_id=ad.get('data-id'),
+            url=url,
+        ))
+
+    return results
+
+
+BACKENDS = {"bs4": parse_ads_bs4}
+if HAVE_LXML:
+    BACKENDS["lxml"] = parse_ads_lxml
+
+
+def parse_ads(html, backend=None):
+    backend = backend or PARSER_BACKEND
+    if backend == "auto":
+        backend = "lxml" if "lxml" in BACKENDS else "bs4"
+    return BACKENDS[backend](html)
+
+
+def split_blocks(html):
+    """Cut a page into chunks that each start at a product-item div.
+
+    A chunk runs up to the next product-item (the last one to the end of the
+    page), so parsing it yields exactly that item's ad.
+    """
+    starts = [m.start() for m in PRODUCT_ITEM_START_RX.finditer(html)]
+    return [html[a:b] for a, b in zip(starts, starts[1:] + [len(html)])]
+
+
+def parse_ads_cached(html, cache, backend=None):
+    """parse_ads, reusing the parsed ads of blocks seen before.
+
+    Cached ads carry absolute urls, so BASE_URL is part of the block key.
+    """
+    blocks = split_blocks(html)
+    hashes = [block_hash(b, BASE_URL) for b in blocks]
+    cached = cache.get_blocks(set(hashes))
+    fresh = {h: parse_ads(b, backend) for h, b in zip(hashes, blocks) if h not in cached}
+    if fresh:
+        cache.put_blocks(fresh)
+    return [ad for h in hashes for ad in (cached[h] if h in cached else fresh[h])]
+
+
+def parity_candidates(html):
+    """(name, ads) for every parsing path, to compare with the full-tree parse."""
+    candidates = [(name, parse(html)) for name, parse in BACKENDS.items()]
+    candidates += [(f"per-block {name}", [ad for block in split_blocks(html) for ad in parse(block)])
+                   for name, parse in BACKENDS.items()]
+    return candidates
+
+
+def check_parity(paths):
+    """Parse each file every way and report any differences from the full-tree bs4 parse."""
+    mismatches = 0
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        reference = parse_ads_bs4(html, strain=False)
+        for name, got in parity_candidates(html):
+            if got != reference:
+                mismatches += 1
+                print(f"{path}: {name} differs from full-tree bs4 ({len(got)} vs {len(reference)} ads)")
+                for a, b in zip(got, reference):
+                    if a != b:
+                        print(f"  first difference: {a} != {b}")
+                        break
+        print(f"{path}: {len(reference)} ads")
+    return mismatches
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check_parity(sys.argv[1:]) else 0)
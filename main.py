@@ -1,253 +1,435 @@
-from curl_cffi import requests
-from bs4 import BeautifulSoup
+import argparse
+import cProfile
+import hashlib
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import re
 
+from ad import Ad
+from daily_diff import StateIndex, ad_key, diff_ads, unique_by_id
 from enrich_plot_sizes import enrich_ads
-
-FILTER_URL = "https://www.halooglasi.com/nekretnine/prodaja-kuca/beograd?cena_d_to=180000&cena_d_unit=4"
+from http_client import get_cache, thread_session
+from listing_parser import BASE_URL, parse_ads, parse_ads_cached
+from price_history import open_history
+from ratelimit import HostRateLimiter
+from relistings import add_relisted, load_links, recent_index, save_links, split_relisted
+from report_format import (REPORT_DIR, generate_telegram_message, plot_line,  # noqa: F401
+                           price_changes_by_id, relisted_line, relisted_unchanged, render_new_ad,
+                           render_price_change, render_telegram_blocks, write_report)
+from run_journal import RunJournal, write_text
+from run_metrics import append_run_log, count_body, metrics, ratio, read_run_log
+from searches import Search, load_searches
+from snapshot_store import open_store
+from timeline import open_timeline
+
+FILTER_URL = f"{BASE_URL}/nekretnine/prodaja-kuca/beograd?cena_d_to=180000&cena_d_unit=4"
 DATA_DIR = "data"
-REPORT_DIR = "reports"
 HISTORY_FILE = "price-history.json"
-
-scraper = requests.Session(impersonate="chrome")
-
-def fetch_ads_from_page(page):
-    url = f"{FILTER_URL}&page={page}"
-    response = scraper.get(url, timeout=15)
+HISTORY_DB = "price-history.db"
+HISTORY_JSON_EXPORT = True  # the workflow commits price-history.json
+DETECT_RELISTINGS = True
+TIMELINE_INDEX = True  # per-ad timeline queries, see timeline.py
+
+# The search at the repository root; more can be listed in searches.json.
+DEFAULT_SEARCH = Search("default", FILTER_URL, ".")
+
+# Concurrent crawl settings. CRAWL_CONCURRENCY = 1 selects the sequential crawl.
+CRAWL_CONCURRENCY = 4
+CRAWL_RATE_PER_HOST = 4.0  # requests per second, 0 disables throttling
+
+# Incremental crawl: the listing sorted newest first, read in order until
+# KNOWN_RUN_TO_STOP ads in a row are unchanged since the last snapshot, then
+# the remaining pages concurrently. Nothing is carried over from the last
+# snapshot; a full crawl in the site's own order still runs every
+# FULL_CRAWL_EVERY_DAYS, and whenever the incremental one doesn't add up.
+# Off: the site has no ids-only view, so checking the rest of the list costs
+# as many requests as a full crawl (see benchmarks/bench_incremental_crawl).
+INCREMENTAL_CRAWL = False
+NEWEST_FIRST = "&sort=ValidFromForDisplay,desc"
+KNOWN_RUN_TO_STOP = 20
+FULL_CRAWL_EVERY_DAYS = 7
+
+TOTAL_PAGES_RX = re.compile(r'"TotalPages"\s*:\s*(\d+)')
+TOTAL_COUNT_RX = re.compile(r'"TotalCount"\s*:\s*(\d+)')
+
+def fetch_page_html(page, session=None, limiter=None, filter_url=FILTER_URL):
+    url = f"{filter_url}&page={page}"
+    if limiter:
+        limiter.wait(url)
+    with metrics.timed("listing_latency"):
+        response = (session or thread_session()).get(url, timeout=15)
+    metrics.count("listing_requests")
     response.raise_for_status()
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-    ads = soup.find_all('div', class_='product-item')
-
-    results = []
-
-    for ad in ads:
-        title_tag = ad.select_one('h3.product-title a')
-        price_tag = ad.select_one('.central-feature i')
-        location_tag = ad.select_one('ul.subtitle-places')
-        location_parts = location_tag.find_all('li') if location_tag else []
-        location_full = " | ".join([li.get_text(strip=True) for li in location_parts]) if location_parts else None
-
-        publish_date_tag = ad.select_one('span.publish-date')
-        advertiser_tag = ad.select_one('span[data-field-name="oglasivac_nekretnine_s"]')
-        price_by_surface_tag = ad.select_one('div.price-by-surface span')
-        ad_id = ad.get('data-id')
-
-        kvadratura_tag = None
-        for li in ad.select('ul.product-features li'):
-            if 'Kvadratura' in li.get_text():
-                kvadratura_tag = li.select_one('.value-wrapper')
-                break
-
-        kvadratura = kvadratura_tag.get_text(strip=True) if kvadratura_tag else None
-
-        if kvadratura:
-            match = re.search(r"[\d,.]+", kvadratura)
-            kvadratura = match.group(0).replace(".", "").replace(",", ".") + " m2" if match else None
-
-        url = title_tag['href'] if title_tag else None
-        title = title_tag.get_text(strip=True) if title_tag else None
-        price = price_tag.get_text(strip=True) if price_tag else None
-
-        publish_date = publish_date_tag.get_text(strip=True) if publish_date_tag else None
-        advertiser = advertiser_tag.get_text(strip=True) if advertiser_tag else None
-        price_by_surface = price_by_surface_tag.get_text(strip=True) if price_by_surface_tag else None
-
-        if url:
-            full_url = f"https://www.halooglasi.com{url}"
-            results.append({
-                'title': title,
-                'location': location_full,
-                'kvadratura': kvadratura,
-                'price': price,
-                'price_by_surface': price_by_surface,
-                'publish_date': publish_date,
-                'advertiser': advertiser,
-                'id': ad_id,
-                'url': full_url
-            })
-
-    return results
-
-def fetch_current_ads():
+    count_body("listing", response)
+    return response.text
+
+def parse_total_pages(html, ads_on_page):
+    """Return the total page count advertised by a listing page, or None."""
+    m = TOTAL_PAGES_RX.search(html)
+    if m:
+        return int(m.group(1))
+    m = TOTAL_COUNT_RX.search(html)
+    if m and ads_on_page:
+        return -(-int(m.group(1)) // ads_on_page)
+    return None
+
+def parse_total_count(html):
+    m = TOTAL_COUNT_RX.search(html)
+    return int(m.group(1)) if m else None
+
+def parse_page(html):
+    cache = get_cache()
+    with metrics.timed("page_parse"):
+        ads = parse_ads_cached(html, cache) if cache else parse_ads(html)
+        return [Ad.from_dict(ad) for ad in ads]
+
+def fetch_ads_from_page(page, filter_url=FILTER_URL):
+    return parse_page(fetch_page_html(page, filter_url=filter_url))
+
+def fetch_current_ads_sequential(start_page=1, filter_url=FILTER_URL):
     all_ads = []
-    page = 1
+    page = start_page
     while True:
-        ads = fetch_ads_from_page(page)
+        ads = fetch_ads_from_page(page, filter_url)
         if not ads:
             break
         all_ads.extend(ads)
         page += 1
     return all_ads
 
-def sort_ads_by_location_and_price(ads):
-    def extract_obshchina(location):
-        parts = location.split('|') if location else []
-        parts = [p.strip() for p in parts]
-        return parts[1] if len(parts) >= 2 else ''
+def fetch_current_ads(concurrency=CRAWL_CONCURRENCY, rate_per_host=CRAWL_RATE_PER_HOST,
+                      filter_url=FILTER_URL):
+    """Fetch every listing page and return the ads in page order.
+
+    Page 1 is fetched first to learn the total page count; the remaining
+    pages are then fetched by a pool of `concurrency` workers. If the count
+    can't be read, pages are fetched in windows of `concurrency` until an
+    empty page shows up. Either way the result is identical to the
+    sequential crawl.
+    """
+    if concurrency <= 1:
+        return fetch_current_ads_sequential(filter_url=filter_url)
+    return fetch_all_searches([filter_url], concurrency, rate_per_host)[0]
+
+def fetch_all_searches(filter_urls, concurrency=CRAWL_CONCURRENCY, rate_per_host=CRAWL_RATE_PER_HOST,
+                       limiter=None):
+    """fetch_current_ads for several searches through one pool and rate limiter.
+
+    Returns one ad list per URL. The first pages of all searches are
+    fetched together, then every remaining page of every search is queued
+    on the same pool, so `concurrency` and `rate_per_host` bound the whole
+    crawl rather than each search. Pass `limiter` to share it with other
+    crawls.
+    """
+    limiter = limiter or HostRateLimiter(rate_per_host, burst=concurrency)
+
+    def fetch(job):
+        filter_url, page = job
+        return parse_page(fetch_page_html(page, thread_session(), limiter, filter_url))
+
+    def fetch_html(filter_url):
+        return fetch_page_html(1, thread_session(), limiter, filter_url)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        first_pages = list(pool.map(fetch_html, filter_urls))
+        results, totals = [], []
+        for html in first_pages:
+            ads = parse_page(html)
+            results.append(list(ads))
+            totals.append(parse_total_pages(html, len(ads)) if ads else 0)
+
+        jobs = [(i, page) for i, total in enumerate(totals) if total
+                for page in range(2, total + 1)]
+        done = [False] * len(filter_urls)
+        pages = pool.map(fetch, ((filter_urls[i], page) for i, page in jobs))
+        for (i, page), ads in zip(jobs, pages):
+            if not ads:
+                done[i] = True
+            elif not done[i]:
+                results[i].extend(ads)
+
+        for i, total in enumerate(totals):
+            if done[i] or total == 0:
+                continue
+            if total is not None:
+                # The count is only a hint; keep going until a page comes back empty.
+                next_page = total + 1
+                while ads := fetch((filter_urls[i], next_page)):
+                    results[i].extend(ads)
+                    next_page += 1
+                continue
+            next_page = 2
+            while not done[i]:
+                window = [(filter_urls[i], page) for page in range(next_page, next_page + concurrency)]
+                for ads in pool.map(fetch, window):
+                    if not ads:
+                        done[i] = True
+                        break
+                    results[i].extend(ads)
+                next_page += concurrency
+    return results
 
-    def extract_price(ad):
-        price_str = ad.get("price", "").replace("€", "").replace(".", "").replace(",", "").strip()
-        try:
-            return int(price_str)
-        except ValueError:
-            return float('inf')
+def fetch_current_ads_incremental(known, filter_url=FILTER_URL, stop_after=KNOWN_RUN_TO_STOP,
+                                  concurrency=CRAWL_CONCURRENCY, limiter=None):
+    """Crawl newest first until `stop_after` ads in a row match `known`, then sweep the rest.
+
+    `known` is the last snapshot; an ad matches if its id is there with the
+    same price. The pages past that run are fetched by a pool of
+    `concurrency` workers (unchanged ones are answered from the HTTP and
+    block caches), so every returned ad was seen today. Returns None if the
+    ads don't add up to the listing's total and a full crawl is needed.
+    """
+    known_prices = {ad_key(ad): ad["price"] for ad in known}
+    url = filter_url + NEWEST_FIRST
+
+    def fetch(page):
+        return parse_page(fetch_page_html(page, thread_session(), limiter, url))
+
+    crawled = []
+    total = total_pages = None
+    run = 0
+    page = 1
+    while run < stop_after:
+        html = fetch_page_html(page, thread_session(), limiter, url)
+        ads = parse_page(html)
+        if not ads:
+            return crawled  # read to the end
+        if page == 1:
+            total = parse_total_count(html)
+            total_pages = parse_total_pages(html, len(ads))
+        for ad in ads:
+            unchanged = ad.key in known_prices and known_prices[ad.key] == ad.price
+            run = run + 1 if unchanged else 0
+        crawled.extend(ads)
+        page += 1
+    if total is None or total_pages is None:
+        return None
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ads in pool.map(fetch, range(page, total_pages + 1)):
+            crawled.extend(ads)
+    # The count is only a hint, as in fetch_all_searches.
+    page = max(page, total_pages + 1)
+    while ads := fetch(page):
+        crawled.extend(ads)
+        page += 1
+    if len(crawled) < total:
+        return None
+    return crawled
+
+def last_snapshot(search, today):
+    """The latest stored snapshot before `today`, or []."""
+    store = open_store(search.store_file, data_dir=search.data_dir)
+    before = [d for d in store.dates() if d < today]
+    return store.day(before[-1]) if before else []
+
+def full_crawl_due(search, today, every=FULL_CRAWL_EVERY_DAYS):
+    """True if the run log has no full crawl of `search` in the last `every` days."""
+    last = None
+    for record in read_run_log():
+        if record.get("searches", {}).get(search.name, {}).get("crawl") == "full":
+            last = record["date"]
+    if last is None:
+        return True
+    return (datetime.strptime(today, "%Y-%m-%d") - datetime.strptime(last, "%Y-%m-%d")).days >= every
+
+def fetch_searches(searches, today, full_crawl=False):
+    """Today's ads for each search and whether it was a full crawl.
+
+    Searches that are due a full crawl (or have nothing stored yet) share
+    one fetch_all_searches; the rest are crawled incrementally, falling back
+    to a full crawl when the incremental result doesn't add up.
+    """
+    fetched = [None] * len(searches)
+    limiter = HostRateLimiter(CRAWL_RATE_PER_HOST, burst=CRAWL_CONCURRENCY)
+    if INCREMENTAL_CRAWL and not full_crawl:
+        for i, search in enumerate(searches):
+            known = last_snapshot(search, today)
+            if known and not full_crawl_due(search, today):
+                fetched[i] = fetch_current_ads_incremental(known, search.url, limiter=limiter)
+                if fetched[i] is None:
+                    print(f"Incremental crawl of {search.name} came up short of the listing total; "
+                          "doing a full crawl.")
+    full = [ads is None for ads in fetched]
+    todo = [i for i, ads in enumerate(fetched) if ads is None]
+    for i, ads in zip(todo, fetch_all_searches([searches[i].url for i in todo], limiter=limiter)):
+        fetched[i] = ads
+    return fetched, full
 
+def sort_ads_by_location_and_price(ads):
+    """Sort Ad records by municipality, then price; unpriced ads go last."""
     return sorted(
         ads,
-        key=lambda ad: (extract_obshchina(ad.get("location")), extract_price(ad))
+        key=lambda ad: (ad.municipality, ad.price_eur if ad.price_eur is not None else float('inf'))
     )
 
-def save_daily_snapshot(ads):
-    date_str = datetime.now().strftime("%Y-%m-%d")
-    os.makedirs(DATA_DIR, exist_ok=True)
-    filename = os.path.join(DATA_DIR, f"{date_str}.json")
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(ads, f, indent=2, ensure_ascii=False)
+def today_str():
+    return datetime.now().strftime("%Y-%m-%d")
+
+def save_daily_snapshot(ads, date_str=None, search=DEFAULT_SEARCH, journal=None):
+    date_str = date_str or today_str()
+    os.makedirs(search.data_dir, exist_ok=True)
+    filename = os.path.join(search.data_dir, f"{date_str}.json")
+    text = json.dumps(ads, indent=2, ensure_ascii=False)
+    write_text(filename, text, journal)
+    data = text.encode("utf-8")
+    open_store(search.store_file, data_dir=search.data_dir).add_day(
+        date_str, ads, source_size=len(data), source_sha1=hashlib.sha1(data).hexdigest())
     return filename
 
-def load_previous_snapshot():
-    if not os.path.exists(DATA_DIR):
+def load_previous_snapshot(search=DEFAULT_SEARCH):
+    # Called before today's snapshot is saved, so this is the second-latest
+    # stored day rather than yesterday. Reports have always diffed that way.
+    store = open_store(search.store_file, data_dir=search.data_dir)
+    dates = store.dates()
+    if len(dates) < 2:
         return []
-    files = sorted(os.listdir(DATA_DIR))
-    if len(files) < 2:
-        return []
-    with open(os.path.join(DATA_DIR, files[-2]), "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def load_price_history():
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_price_history(history):
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
-
-def remove_duplicates_by_id(ads):
-    """Remove duplicate ads by id, keeping the first occurrence"""
-    seen_ids = set()
-    unique_ads = []
-    for ad in ads:
-        ad_id = str(ad['id']).strip()
-        if ad_id not in seen_ids:
-            seen_ids.add(ad_id)
-            unique_ads.append(ad)
-    return unique_ads
-
-def generate_report(current_ads, previous_ads):
-    # Remove duplicates before comparison
-    current_ads_unique = remove_duplicates_by_id(current_ads)
-    previous_ads_unique = remove_duplicates_by_id(previous_ads)
-    
-    # Always use string id and strip spaces for robust comparison
-    current_dict = {str(ad['id']).strip(): ad for ad in current_ads_unique}
-    previous_dict = {str(ad['id']).strip(): ad for ad in previous_ads_unique}
+    return store.day(dates[-2])
+
+def generate_report(current_ads, previous_ads=None, date_str=None, search=DEFAULT_SEARCH, journal=None):
+    """Diff today's ads against the baseline, update history, write the report.
+
+    Without `previous_ads` the baseline comes from the persisted state index
+    (see daily_diff); passing a snapshot list diffs against it directly.
+    `date_str` defaults to today. Everything is read from and written to
+    `search`'s files, through `journal` when one is given.
+    """
+    date_str = date_str or today_str()
+
+    # Remove duplicates before comparison; ids are compared as stripped strings
+    current_dict = unique_by_id(current_ads)
 
     # Load price history to determine truly new ads
-    history = load_price_history()
+    history = open_history(search.history_db, search.history_file)
+    last_prices = history.last_prices(current_dict)
     
     # Find ads that are truly new (not in history at all)
     truly_new_ads = []
     for ad_id, ad in current_dict.items():
-        if ad_id not in history:
+        if ad_id not in last_prices:
             truly_new_ads.append(ad)
+
+    # New ids that are a house listed lately are relistings, not new ads
+    relisted = []
+    if truly_new_ads and DETECT_RELISTINGS:
+        store = open_store(search.store_file, data_dir=search.data_dir)
+        matches = recent_index(store, date_str).match(truly_new_ads, active=current_dict)
+        if matches:
+            truly_new_ads, relisted = split_relisted(truly_new_ads, {
+                ad_id: (ad_key(original), original['price']) for ad_id, original in matches.items()})
+            links = load_links(search.relistings_file)
+            links.update((e["id"], {"original": e["relisted_from"], "date": date_str}) for e in relisted)
+            save_links(links, search.relistings_file, journal)
     
-    # Find ads that were in previous day but not in current day
-    removed = [previous_dict[k] for k in previous_dict.keys() - current_dict.keys()]
-    
-    # Find ads with price changes
-    price_changed = []
-    date_str = datetime.now().strftime("%Y-%m-%d")
-
-    # Compare with previous day for price changes
-    for ad_id in current_dict.keys() & previous_dict.keys():
-        current_ad = current_dict[ad_id]
-        previous_ad = previous_dict[ad_id]
-        
-        if current_ad['price'] != previous_ad['price']:
-            price_changed.append({
-                "id": ad_id,
-                "url": current_ad['url'],
-                "title": current_ad['title'],
-                "location": current_ad['location'],
-                "kvadratura": current_ad['kvadratura'],
-                "plot": current_ad.get('plot', ''),
-                "price": current_ad['price'],
-                "old_price": previous_ad['price']
-            })
+    # Find removed ads and price changes against the baseline
+    state = None
+    if previous_ads is None:
+        state = StateIndex(open_store(search.store_file, data_dir=search.data_dir))
+        removed, price_changed = state.diff(date_str, current_dict)
+    else:
+        removed, price_changed = diff_ads(current_dict, unique_by_id(previous_ads))
 
     # Update history for all current ads
-    for ad_id, current_ad in current_dict.items():
-        if ad_id not in history:
-            history[ad_id] = []
-        if not history[ad_id] or history[ad_id][-1]['price'] != current_ad['price']:
-            history[ad_id].append({"date": date_str, "price": current_ad['price']})
-
-    save_price_history(history)
-
-    report = {
+    current_prices = {ad_id: ad['price'] for ad_id, ad in current_dict.items()}
+    if history.record(date_str, current_prices, last=last_prices) and HISTORY_JSON_EXPORT:
+        history.export_json(journal)
+    history.close()
+    if state:
+        state.advance(date_str, current_dict)
+
+    report = add_relisted({
         "total_ads": len(current_ads),
         "added": truly_new_ads,  # Only truly new ads
         "removed": removed,
         "price_changed": price_changed
-    }
-
-    os.makedirs(REPORT_DIR, exist_ok=True)
-    report_file = os.path.join(REPORT_DIR, f"{date_str}-changes.json")
-    with open(report_file, "w", encoding="utf-8") as f:
-        json.dump(report, f, indent=2, ensure_ascii=False)
-
-    return report_file, report
-
-def generate_telegram_message(new_ads, price_changes):
-    lines = []
-
-    def plot_line(ad):
-        plot = ad.get('plot') or ''
-        return f"\n🌳 {plot}" if plot else ''
-
-    if new_ads:
-        lines.append("<b>🆕 New ads:</b>")
-        for ad in new_ads:
-            lines.append(f"🏠 <b>{ad['title']}</b>\n📍 {ad['location']}\n📏 {ad.get('kvadratura', '')}{plot_line(ad)}\n💶 {ad['price']}\n🔗 <a href='{ad['url']}'>Open</a>\n")
-
-    if price_changes:
-        lines.append("<b>💰 Price changes:</b>")
-        for ad_id, changes in price_changes.items():
-            current = changes['current']
-            old_price = changes['previous_price']
-            lines.append(f"🏠 <b>{current['title']}</b>\n📍 {current['location']}\n📏 {current.get('kvadratura', '')}{plot_line(current)}\n💶 <s>{old_price}</s> → <b>{current['price']}</b>\n🔗 <a href='{current['url']}'>Open</a>\n")
-
-    if not new_ads and not price_changes:
-        lines.append("No new ads or price changes today.")
-
-    return "\n".join(lines)
+    }, relisted)
+    if TIMELINE_INDEX:
+        timeline = open_timeline(search, before=date_str)
+        timeline.apply(date_str, current_dict, report)
+        timeline.close()
+    return write_report(report, date_str, search.report_dir, journal), report
+
+def cache_stats(cache):
+    stats = dict(cache.stats)
+    stats["not_modified_rate"] = ratio(stats["not_modified"], stats["requests"])
+    stats["block_hit_rate"] = ratio(stats["block_hits"], stats["block_hits"] + stats["block_misses"])
+    return stats
+
+def run(full_crawl=False):
+    searches = load_searches(FILTER_URL)
+    today = today_str()
+    # Every file of the run is staged and published at once at the end; an
+    # interrupted run is finished or undone here first (see run_journal).
+    journal = RunJournal()
+    recovered = journal.begin()
+    if recovered:
+        print(f"Interrupted run {recovered}.")
+    with metrics.stage("fetch"):
+        fetched, full = fetch_searches(searches, today, full_crawl)
+    with metrics.stage("sort"):
+        fetched = [sort_ads_by_location_and_price(ads) for ads in fetched]
+    # One pass over every search's ads: an ad listed by several searches
+    # has its detail page fetched once.
+    with metrics.stage("enrich"):
+        new_plot_fetches = enrich_ads([ad for ads in fetched for ad in ads])
+    if new_plot_fetches:
+        print(f"Fetched plot size for {new_plot_fetches} ad(s).")
+
+    summary = {}
+    for search, ads, full_crawled in zip(searches, fetched, full):
+        ads = [ad.to_dict() for ad in ads]
+        suffix = f":{search.name}" if len(searches) > 1 else ""
+        # Without the JSON export the history database is the only copy, so
+        # it can't be dropped and rebuilt.
+        journal.guard(search.store_file, *([search.timeline_db] if TIMELINE_INDEX else []),
+                      *([search.history_db] if HISTORY_JSON_EXPORT else []))
+        with metrics.stage("save_snapshot" + suffix):
+            save_daily_snapshot(ads, today, search, journal)
+        with metrics.stage("report" + suffix):
+            report_file, report_data = generate_report(ads, date_str=today, search=search, journal=journal)
+
+        # Telegram message generation
+        with metrics.stage("message" + suffix):
+            new_ads = report_data.get("added", [])
+            telegram_message = generate_telegram_message(
+                new_ads, price_changes_by_id(report_data), relisted_unchanged(report_data))
+            write_text(search.message_file, telegram_message, journal)
+
+        print(f"Report saved: {report_file}")
+        summary[search.name] = {
+            "crawl": "full" if full_crawled else "incremental",
+            "ads": len(ads),
+            "added": len(new_ads),
+            "removed": len(report_data.get("removed", [])),
+            "price_changed": len(report_data.get("price_changed", [])),
+        }
+    with metrics.stage("commit"):
+        committed = journal.commit()
+    print(f"Telegram message generated; {committed} file(s) committed.")
+    cache = get_cache()
+    if cache:
+        print(cache.summary())
+    append_run_log(metrics.record(
+        date=today,
+        **{key: sum(s[key] for s in summary.values()) for key in ("ads", "added", "removed", "price_changed")},
+        searches=summary,
+        plot_fetches=new_plot_fetches,
+        http_cache=cache_stats(cache) if cache else None,
+    ))
 
 if __name__ == "__main__":
-    current_ads = fetch_current_ads()
-    current_ads_sorted = sort_ads_by_location_and_price(current_ads)
-    new_plot_fetches = enrich_ads(current_ads_sorted)
-    if new_plot_fetches:
-        print(f"Fetched plot size for {new_plot_fetches} new ad(s).")
-    previous_ads = load_previous_snapshot()
-    save_daily_snapshot(current_ads_sorted)
-    report_file, report_data = generate_report(current_ads_sorted, previous_ads)
-
-    # Telegram message generation
-    new_ads = report_data.get("added", [])
-    price_changes = {
-        entry["id"]: {"current": entry, "previous_price": entry["old_price"]}
-        for entry in report_data.get("price_changed", [])
-    }
-    telegram_message = generate_telegram_message(new_ads, price_changes)
-
-    with open("telegram-message.txt", "w", encoding="utf-8") as f:
-        f.write(telegram_message)
-
-    print(f"Report saved: {report_file}")
-    print("Telegram message generated.")
+    parser = argparse.ArgumentParser(description="Scrape listings and write today's snapshot and report.")
+    parser.add_argument("--profile", metavar="FILE", help="write a cProfile dump of the run to FILE")
+    parser.add_argument("--full-crawl", action="store_true",
+                        help="crawl every listing page even if an incremental crawl would do")
+    args = parser.parse_args()
+    if args.profile:
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(run, args.full_crawl)
+        finally:
+            profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile} (python -m pstats {args.profile})")
+    else:
+        run(args.full_crawl)
@@ -0,0 +1,239 @@
+"""Detail-page results (plot sizes) keyed by ad id, with per-status expiry.
+
+One row per ad in plot-cache.db: the status fetch_one returned, the plot
+value and unit when there is one, and when it was fetched. A row is trusted
+for TTL[status] and then fetched again: transient failures are retried on
+the next run after a few hours, "no plot field" is re-checked monthly and
+a known plot size only twice a year. A refresh that fails transiently
+keeps the value it was meant to replace.
+
+plot-sizes.json, the cache's old home, seeds the database: whenever the
+file differs from the one last imported, its entries are merged in, keeping
+whichever copy of each id was fetched last. The database can therefore be
+deleted at any time. `export` writes the current cache back to the JSON.
+
+    python plot_cache.py stats
+    python plot_cache.py compact [--days 90]
+    python plot_cache.py export
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+from json_stream import iter_object
+
+PLOT_DB = "plot-cache.db"
+PLOT_JSON = "plot-sizes.json"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+TTL = {
+    "ok": timedelta(days=180),
+    "no_plot_field": timedelta(days=30),
+    "error": timedelta(hours=6),
+}
+HTTP_5XX_TTL = timedelta(hours=6)
+HTTP_OTHER_TTL = timedelta(days=7)
+COMPACT_AFTER_DAYS = 90
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plots (
+    ad_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    plot_value REAL,
+    plot_unit TEXT,
+    error TEXT,
+    fetched_at TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ("status", "plot_value", "plot_unit", "error", "fetched_at")
+
+UPSERT = f"""
+INSERT INTO plots (ad_id, {", ".join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (ad_id) DO UPDATE SET {", ".join(f"{c} = excluded.{c}" for c in COLUMNS)}
+"""
+
+
+def ttl(status):
+    if status in TTL:
+        return TTL[status]
+    return HTTP_5XX_TTL if status.startswith("http_5") else HTTP_OTHER_TTL
+
+
+def is_transient(entry):
+    status = entry["status"]
+    return status == "error" or status.startswith("http_5")
+
+
+def expired(entry, now=None):
+    """True if `entry` is older than its status's TTL."""
+    fetched = datetime.strptime(entry["fetched_at"], TIME_FORMAT)
+    return fetched + ttl(entry["status"]) <= (now or datetime.now())
+
+
+def _row(ad_id, entry):
+    return (ad_id, *(entry.get(c) for c in COLUMNS))
+
+
+def _entry(row):
+    return {c: v for c, v in zip(COLUMNS, row) if v is not None}
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PlotCache:
+    def __init__(self, db_path=PLOT_DB, json_path=PLOT_JSON):
+        self.json_path = json_path
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+        self.sync_from_json()
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM plots").fetchone()[0]
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def sync_from_json(self):
+        """Merge the JSON file in if it isn't the one we last saw."""
+        if not self.json_path or not os.path.exists(self.json_path):
+            return False
+        digest = _file_hash(self.json_path)
+        if digest == self._meta("json_sha1"):
+            return False
+        with self.db:
+            self.db.executemany(
+                UPSERT + " WHERE excluded.fetched_at > plots.fetched_at",
+                (_row(ad_id, e) for ad_id, e in iter_object(self.json_path) if e.get("fetched_at")))
+            self._set_meta("json_sha1", digest)
+        return True
+
+    def get_many(self, ad_ids):
+        """{ad_id: entry} for the given ids that are cached."""
+        ad_ids = list(ad_ids)
+        found = {}
+        for i in range(0, len(ad_ids), 900):
+            chunk = ad_ids[i:i + 900]
+            marks = ",".join("?" * len(chunk))
+            for ad_id, *row in self.db.execute(
+                    f"SELECT ad_id, {', '.join(COLUMNS)} FROM plots WHERE ad_id IN ({marks})", chunk):
+                found[ad_id] = _entry(row)
+        return found
+
+    def due(self, ad_ids, now=None):
+        """(cached entries, ids to fetch): the ids missing or expired."""
+        entries = self.get_many(ad_ids)
+        now = now or datetime.now()
+        return entries, [ad_id for ad_id in ad_ids
+                         if ad_id not in entries or expired(entries[ad_id], now)]
+
+    def put_many(self, results):
+        """Store (ad_id, entry) pairs.
+
+        A transient failure doesn't replace an entry that has a plot size;
+        that entry stays expired and is retried on a later run.
+        """
+        results = list(results)
+        keep = {ad_id for ad_id, e in self.get_many(
+            ad_id for ad_id, entry in results if is_transient(entry)).items() if e["status"] == "ok"}
+        with self.db:
+            self.db.executemany(
+                UPSERT, (_row(ad_id, entry) for ad_id, entry in results if ad_id not in keep))
+
+    def compact(self, live_ids):
+        """Drop the entries of ads not in `live_ids`; returns how many."""
+        with self.db:
+            self.db.execute("CREATE TEMP TABLE IF NOT EXISTS live (ad_id TEXT PRIMARY KEY)")
+            self.db.execute("DELETE FROM live")
+            self.db.executemany("INSERT OR IGNORE INTO live VALUES (?)", ((i,) for i in live_ids))
+            removed = self.db.execute(
+                "DELETE FROM plots WHERE ad_id NOT IN (SELECT ad_id FROM live)").rowcount
+            self.db.execute("DROP TABLE live")
+        self.db.execute("VACUUM")
+        return removed
+
+    def as_dict(self):
+        """The whole cache in the plot-sizes.json shape."""
+        return {ad_id: _entry(row) for ad_id, *row in self.db.execute(
+            f"SELECT ad_id, {', '.join(COLUMNS)} FROM plots ORDER BY fetched_at, ad_id")}
+
+    def export_json(self):
+        tmp = self.json_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.json_path)
+        with self.db:
+            self._set_meta("json_sha1", _file_hash(self.json_path))
+
+    def stats(self, now=None):
+        """{status: (entries, expired)}."""
+        now = now or datetime.now()
+        counts = {}
+        for status, fetched_at in self.db.execute("SELECT status, fetched_at FROM plots"):
+            total, stale = counts.get(status, (0, 0))
+            counts[status] = (total + 1, stale + expired(
+                {"status": status, "fetched_at": fetched_at}, now))
+        return counts
+
+
+def open_plot_cache(db_path=PLOT_DB, json_path=PLOT_JSON):
+    return PlotCache(db_path, json_path)
+
+
+def live_ad_ids(days=COMPACT_AFTER_DAYS):
+    """Ids listed by any search in the last `days` days of snapshots."""
+    from searches import load_searches
+    from snapshot_store import open_store
+
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    ids = set()
+    for search in load_searches(None):
+        ids |= open_store(search.store_file, data_dir=search.data_dir).ids_since(since)
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="entries and expired entries per status")
+    compact = sub.add_parser("compact", help="drop ads no search has listed lately")
+    compact.add_argument("--days", type=int, default=COMPACT_AFTER_DAYS)
+    sub.add_parser("export", help=f"write the cache to {PLOT_JSON}")
+    args = parser.parse_args()
+
+    cache = open_plot_cache()
+    if args.command == "stats":
+        for status, (total, stale) in sorted(cache.stats().items()):
+            print(f"{status:16s} {total:6d} entries, {stale:6d} expired (ttl {ttl(status)})")
+    elif args.command == "compact":
+        removed = cache.compact(live_ad_ids(args.days))
+        print(f"Removed {removed} entries; {len(cache)} left")
+    else:
+        cache.export_json()
+        print(f"Wrote {len(cache)} entries to {PLOT_JSON}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
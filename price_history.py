@@ -0,0 +1,183 @@
+"""Indexed price history: one row per (ad id, price change).
+
+The working copy lives in price-history.db, keyed by (ad_id, seq), so "last
+price for id" and "has this id ever been seen" are B-tree lookups and a run
+only appends the rows that changed. Prices are parsed to whole euros once,
+on insert.
+
+price-history.json remains the committed, human-readable copy. The store
+remembers the hash of the JSON it last imported or exported and re-imports
+it whenever the file on disk differs (fresh checkout, manual edit), so the
+database itself is disposable.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+
+from ad import parse_price
+from json_stream import iter_object
+from run_journal import write_text
+
+HISTORY_FILE = "price-history.json"
+HISTORY_DB = "price-history.db"
+IMPORT_BATCH = 2000  # ads per executemany while importing the JSON
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ads (
+    ad_id TEXT PRIMARY KEY,
+    ord INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prices (
+    ad_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    price TEXT,
+    price_eur INTEGER,
+    PRIMARY KEY (ad_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def write_json(history, path=HISTORY_FILE, journal=None):
+    """Write a history dict in the price-history.json format, atomically.
+
+    Returns the sha1 of what was written.
+    """
+    data = json.dumps(history, indent=2, ensure_ascii=False)
+    write_text(path, data, journal)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PriceHistory:
+    def __init__(self, db_path=HISTORY_DB, json_path=HISTORY_FILE):
+        self.json_path = json_path
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+        self.sync_from_json()
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def sync_from_json(self):
+        """Reload from the JSON file if it isn't the one we last saw."""
+        if not os.path.exists(self.json_path):
+            return False
+        digest = _file_hash(self.json_path)
+        if digest == self._meta("json_sha1"):
+            return False
+        with self.db:
+            self.db.execute("DELETE FROM ads")
+            self.db.execute("DELETE FROM prices")
+            # Streamed in batches: the file is never in memory as a whole.
+            batch, imported = [], 0
+            for member in iter_object(self.json_path):
+                batch.append(member)
+                if len(batch) == IMPORT_BATCH:
+                    self._import(imported, batch)
+                    imported += len(batch)
+                    batch = []
+            self._import(imported, batch)
+            self._set_meta("json_sha1", digest)
+        return True
+
+    def _import(self, first_ord, members):
+        self.db.executemany(
+            "INSERT INTO ads (ad_id, ord) VALUES (?, ?)",
+            ((ad_id, first_ord + i) for i, (ad_id, _) in enumerate(members)))
+        self.db.executemany(
+            "INSERT INTO prices (ad_id, seq, date, price, price_eur) VALUES (?, ?, ?, ?, ?)",
+            ((ad_id, seq, e["date"], e["price"], parse_price(e["price"]))
+             for ad_id, entries in members for seq, e in enumerate(entries)))
+
+    def seen(self, ad_id):
+        return self.db.execute("SELECT 1 FROM ads WHERE ad_id = ?", (ad_id,)).fetchone() is not None
+
+    def last_price(self, ad_id):
+        """(date, price, price_eur) of the latest entry, or None."""
+        return self.db.execute(
+            "SELECT date, price, price_eur FROM prices WHERE ad_id = ? ORDER BY seq DESC LIMIT 1",
+            (ad_id,)).fetchone()
+
+    def last_prices(self, ad_ids):
+        """{ad_id: (seq, price)} for the ids that have history."""
+        found = {}
+        for ad_id in ad_ids:
+            row = self.db.execute(
+                "SELECT seq, price FROM prices WHERE ad_id = ? ORDER BY seq DESC LIMIT 1",
+                (ad_id,)).fetchone()
+            if row:
+                found[ad_id] = row
+        return found
+
+    def latest_prices(self):
+        """{ad_id: price} of every ad's latest entry."""
+        return dict(self.db.execute(
+            "SELECT ad_id, price FROM prices JOIN "
+            "(SELECT ad_id, MAX(seq) AS seq FROM prices GROUP BY ad_id) USING (ad_id, seq)"))
+
+    def timeline(self, ad_id):
+        return [
+            {"date": d, "price": p}
+            for d, p in self.db.execute(
+                "SELECT date, price FROM prices WHERE ad_id = ? ORDER BY seq", (ad_id,))
+        ]
+
+    def record(self, date, prices, last=None):
+        """Append (date, price) for every id whose price differs from its last one.
+
+        `prices` maps ad id -> price string; `last` may pass in an earlier
+        last_prices() result for the same ids. Returns the number of rows added.
+        """
+        if last is None:
+            last = self.last_prices(prices)
+        next_ord = self.db.execute("SELECT COALESCE(MAX(ord) + 1, 0) FROM ads").fetchone()[0]
+        new_ads = []
+        rows = []
+        for ad_id, price in prices.items():
+            if ad_id not in last:
+                new_ads.append((ad_id, next_ord + len(new_ads)))
+                rows.append((ad_id, 0, date, price, parse_price(price)))
+            elif last[ad_id][1] != price:
+                rows.append((ad_id, last[ad_id][0] + 1, date, price, parse_price(price)))
+        with self.db:
+            self.db.executemany("INSERT INTO ads (ad_id, ord) VALUES (?, ?)", new_ads)
+            self.db.executemany(
+                "INSERT INTO prices (ad_id, seq, date, price, price_eur) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def as_dict(self):
+        """The whole history in the price-history.json shape."""
+        history = {ad_id: [] for (ad_id,) in self.db.execute("SELECT ad_id FROM ads ORDER BY ord")}
+        for ad_id, date, price in self.db.execute(
+                "SELECT ad_id, date, price FROM prices ORDER BY ad_id, seq"):
+            history[ad_id].append({"date": date, "price": price})
+        return history
+
+    def export_json(self, journal=None):
+        digest = write_json(self.as_dict(), self.json_path, journal)
+        with self.db:
+            self._set_meta("json_sha1", digest)
+
+
+def open_history(db_path=HISTORY_DB, json_path=HISTORY_FILE):
+    return PriceHistory(db_path, json_path)
@@ -0,0 +1,196 @@
+"""Relisting detection: new ads that are an already known house.
+
+Agencies relist a house under a new id, or several advertisers post the
+same one. RelistIndex holds the ads listed in the last RELIST_WINDOW_DAYS,
+blocked on (municipality, area bucket); a new ad is compared only with the
+ads in its own and the neighbouring area buckets, so matching a day's new
+ads costs a few comparisons each instead of one per known ad.
+
+Two ads match when they are in the same municipality, their areas differ by
+at most AREA_TOLERANCE, their plot sizes (when both are known) are equal,
+their prices are within PRICE_TOLERANCE, and their titles and locations are
+similar enough (see similarity). Only known ads that are no longer listed
+are candidates, and each is matched at most once.
+
+Links are kept in relistings.json as {new id: {"original": id, "date": d}},
+committed with the rest of the history, so the timeline of a relisted house
+can be followed back through its earlier ids.
+"""
+import json
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+from ad import municipality, parse_area, parse_price
+from daily_diff import ad_key, price_change
+from run_journal import write_text
+
+RELISTINGS_FILE = "relistings.json"
+RELIST_WINDOW_DAYS = 60
+AREA_BUCKET_M2 = 10
+AREA_TOLERANCE = 0.03  # relative; at least 2 m2
+PRICE_TOLERANCE = 0.3  # relative
+MIN_SIMILARITY = 0.55
+
+WORD_RX = re.compile(r"\w+")
+# Words every title uses; they say nothing about which house it is.
+STOPWORDS = frozenset("""
+    kuca kuce kucu prodaja prodajem prodaje se na u i sa za od do m2 m ar
+    beograd hitno odlicna lepa nova novo dvoriste plac placem uknjizena
+""".split())
+
+
+def words(text):
+    """Lower-case words without diacritics or stopwords."""
+    text = (text or "").lower().replace("đ", "dj")
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return frozenset(w for w in WORD_RX.findall(text) if w not in STOPWORDS)
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class Listing:
+    """The fields of an ad that matching compares, parsed once."""
+
+    __slots__ = ("ad", "id", "municipality", "area", "price", "plot", "title", "place", "street")
+
+    def __init__(self, ad):
+        self.ad = ad
+        self.id = str(ad["id"]).strip()
+        self.municipality = municipality(ad.get("location"))
+        self.area = parse_area(ad.get("kvadratura"))
+        self.price = parse_price(ad.get("price"))
+        self.plot = ad.get("plot") or ""
+        self.title = words(ad.get("title"))
+        # Below the municipality: settlement, then (often empty) street.
+        parts = [p.strip() for p in (ad.get("location") or "").split("|")[2:]]
+        self.place = words(" ".join(parts))
+        self.street = len(parts) > 1 and bool(parts[1])
+
+    def bucket(self):
+        return int(self.area // AREA_BUCKET_M2)
+
+
+def similarity(new, old):
+    """0..1 for two Listings in the same block; 0 if they can't be the same house.
+
+    Agencies rewrite titles freely, so the location below the municipality
+    weighs most (half as much when a street is missing), then the title,
+    then how close area and price are.
+    """
+    area_diff = abs(new.area - old.area)
+    if area_diff > max(2.0, AREA_TOLERANCE * old.area):
+        return 0.0
+    if new.plot and old.plot and new.plot != old.plot:
+        return 0.0
+    if new.price is None or old.price is None or old.price <= 0:
+        return 0.0
+    price_diff = abs(new.price - old.price) / old.price
+    if price_diff > PRICE_TOLERANCE:
+        return 0.0
+    place = jaccard(new.place, old.place) * (1.0 if new.street and old.street else 0.5)
+    return (0.35 * place + 0.3 * jaccard(new.title, old.title)
+            + 0.2 * (1.0 if area_diff <= 1 else 0.5) + 0.15 * (1 - price_diff / PRICE_TOLERANCE))
+
+
+class RelistIndex:
+    def __init__(self, ads=()):
+        self.blocks = {}
+        for ad in ads:
+            self.add(ad)
+
+    def add(self, ad):
+        listing = Listing(ad)
+        if listing.area is not None and listing.municipality:
+            key = (listing.municipality, listing.bucket())
+            self.blocks.setdefault(key, []).append(listing)
+
+    def candidates(self, listing):
+        bucket = listing.bucket()
+        for b in (bucket - 1, bucket, bucket + 1):
+            yield from self.blocks.get((listing.municipality, b), ())
+
+    def match(self, new_ads, active=()):
+        """{new id: known ad} for the new ads that relist a known one.
+
+        Known ads whose id is in `active` (still listed) are not candidates:
+        a relisting replaces an ad that is gone. Pairs are taken best first,
+        each known ad at most once.
+        """
+        active = set(active)
+        pairs = []
+        for ad in new_ads:
+            listing = Listing(ad)
+            if listing.area is None or not listing.municipality:
+                continue
+            for old in self.candidates(listing):
+                if old.id == listing.id or old.id in active:
+                    continue
+                score = similarity(listing, old)
+                if score >= MIN_SIMILARITY:
+                    pairs.append((score, listing.id, old.id, old.ad))
+        pairs.sort(key=lambda p: p[0], reverse=True)
+        matched, used = {}, set()
+        for score, new_id, old_id, old_ad in pairs:
+            if new_id not in matched and old_id not in used:
+                matched[new_id] = old_ad
+                used.add(old_id)
+        return matched
+
+
+def recent_index(store, today, days=RELIST_WINDOW_DAYS):
+    """A RelistIndex of the ads `store` lists in the `days` before `today`."""
+    since = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=days)).strftime("%Y-%m-%d")
+    return RelistIndex(store.latest_since(since, today))
+
+
+def split_relisted(added, originals):
+    """(still new, relisted) for a report's added ads.
+
+    `originals` maps a new id to (original id, the original's last price).
+    Relisted ads become price_changed-style entries against that price,
+    with the original id in "relisted_from".
+    """
+    new, relisted = [], []
+    for ad in added:
+        key = ad_key(ad)
+        if key in originals:
+            original, old_price = originals[key]
+            relisted.append({**price_change(key, ad, old_price), "relisted_from": original})
+        else:
+            new.append(ad)
+    return new, relisted
+
+
+def add_relisted(report, relisted):
+    """Put relisted ads in `report`: all under "relisted", repriced ones also
+    under "price_changed" (see report_format.relisted_unchanged for the
+    rest). Reports without relistings keep their old shape."""
+    if relisted:
+        report["price_changed"] = report["price_changed"] + [
+            e for e in relisted if e["price"] != e["old_price"]]
+        report["relisted"] = relisted
+    return report
+
+
+def load_links(path=RELISTINGS_FILE):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_links(links, path=RELISTINGS_FILE, journal=None):
+    write_text(path, json.dumps(links, indent=2, ensure_ascii=False), journal)
+
+
+def original_id(ad_id, links):
+    """The first id of a house that has been relisted, possibly several times."""
+    seen = set()
+    while ad_id in links and ad_id not in seen:
+        seen.add(ad_id)
+        ad_id = links[ad_id]["original"]
+    return ad_id
@@ -0,0 +1,146 @@
+"""Regenerate reports/ and the price history from the snapshots in data/.
+
+    python replay.py [--from DATE] [--to DATE] [--workers N] [--out DIR]
+                     [--history FILE] [--verify [--ignore FIELD]]
+
+Snapshots are streamed from the snapshot store in date order. The parts of
+a report that depend on everything seen so far ("added" and the price
+history) are computed in that single sequential pass. The day-pair diffs
+(removed, price_changed) only need a day and its baseline, so they are
+handed to a process pool together with the report writing.
+
+Each day is diffed against the second-latest snapshot before it, exactly as
+the daily run does. Days before --from are still streamed so history is
+correct, but produce no reports. The price history is written only when the
+replay runs to the latest snapshot, unless --history names a file.
+Relistings are not detected again: the ones recorded in relistings.json
+are applied to the days they were found on.
+
+--verify writes nothing and compares the regenerated reports with the ones
+in reports/ (ignoring the order of removed and price_changed). Fields added
+to the report format later, such as "plot", can be left out of the
+comparison with --ignore plot.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from daily_diff import diff_ads, unique_by_id
+from price_history import HISTORY_FILE, write_json
+from relistings import RELISTINGS_FILE, add_relisted, load_links, split_relisted
+from report_format import REPORT_DIR, write_report
+from snapshot_store import DATA_DIR, open_store
+
+
+def stream_days(store, history, start=None, end=None, links=None):
+    """Yield (date, ads, base_ads, added, originals) for every date in [start, end].
+
+    `history` is filled in as days go by and holds the price history
+    through `end` once the generator is exhausted. `originals` are the
+    relistings recorded in `links` for that date, as split_relisted takes
+    them.
+    """
+    by_date = {}
+    for ad_id, link in (links or {}).items():
+        by_date.setdefault(link["date"], {})[ad_id] = link["original"]
+    dates = [d for d in store.dates() if not end or d <= end]
+    recent = []  # the last two snapshots, oldest first
+    for date in dates:
+        ads = store.day(date)
+        current = unique_by_id(ads)
+        added = [ad for ad_id, ad in current.items() if ad_id not in history]
+        originals = {
+            ad_id: (original, history[original][-1]["price"])
+            for ad_id, original in by_date.get(date, {}).items() if original in history
+        }
+        for ad_id, ad in current.items():
+            entries = history.setdefault(ad_id, [])
+            if not entries or entries[-1]["price"] != ad["price"]:
+                entries.append({"date": date, "price": ad["price"]})
+        if not start or date >= start:
+            base = recent[0] if len(recent) == 2 else []
+            yield date, ads, base, added, originals
+        recent = (recent + [ads])[-2:]
+
+
+def report_for(job):
+    """Diff one day against its baseline and build (and maybe write) its report."""
+    date, ads, base, added, originals, out_dir = job
+    removed, price_changed = diff_ads(unique_by_id(ads), unique_by_id(base))
+    added, relisted = split_relisted(added, originals)
+    report = add_relisted({
+        "total_ads": len(ads),
+        "added": added,
+        "removed": removed,
+        "price_changed": price_changed,
+    }, relisted)
+    if out_dir:
+        write_report(report, date, out_dir)
+    return date, report
+
+
+def _normalized(report, ignore=()):
+    report = dict(report)
+    for key in ("added", "removed", "price_changed"):
+        entries = [{k: v for k, v in e.items() if k not in ignore} for e in report.get(key, [])]
+        if key != "added":
+            entries.sort(key=lambda e: json.dumps(e, sort_keys=True))
+        report[key] = entries
+    return report
+
+
+def replay(start=None, end=None, workers=None, out_dir=REPORT_DIR, history_file=None,
+           verify=False, ignore=()):
+    store = open_store(data_dir=DATA_DIR)
+    history = {}
+    jobs = (
+        (date, ads, base, added, originals, None if verify else out_dir)
+        for date, ads, base, added, originals in stream_days(
+            store, history, start, end, load_links(RELISTINGS_FILE))
+    )
+    mismatched = []
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for date, report in pool.map(report_for, jobs, chunksize=8):
+            count += 1
+            if verify:
+                path = os.path.join(REPORT_DIR, f"{date}-changes.json")
+                if not os.path.exists(path):
+                    mismatched.append((date, "missing"))
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    if _normalized(json.load(f), ignore) != _normalized(report, ignore):
+                        mismatched.append((date, "differs"))
+
+    if verify:
+        for date, why in mismatched:
+            print(f"  {date}: {why}")
+        print(f"Verified {count} report(s), {len(mismatched)} mismatch(es).")
+        return mismatched
+
+    latest = store.dates()[-1] if store.dates() else None
+    if history_file or not end or end == latest:
+        write_json(history, history_file or HISTORY_FILE)
+    print(f"Replayed {count} day(s) into {out_dir}/.")
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--from", dest="start", help="first report date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", help="last report date (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--out", default=REPORT_DIR, help="report directory")
+    parser.add_argument("--history", help="price history output file")
+    parser.add_argument("--verify", action="store_true", help="compare with reports/ instead of writing")
+    parser.add_argument("--ignore", action="append", default=[], metavar="FIELD",
+                        help="ad field to leave out of --verify comparisons (repeatable)")
+    args = parser.parse_args()
+    mismatched = replay(args.start, args.end, args.workers, args.out, args.history,
+                        args.verify, args.ignore)
+    raise SystemExit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
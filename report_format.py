@@ -0,0 +1,80 @@
+"""Daily report files and their Telegram rendering.
+
+Only the standard library is imported here, so sending or replaying
+reports doesn't load the scraping stack (curl_cffi, bs4, lxml). main
+re-exports these names for older callers.
+"""
+import json
+import os
+
+from run_journal import write_text
+
+REPORT_DIR = "reports"
+
+
+def write_report(report, date_str, report_dir=REPORT_DIR, journal=None):
+    """Write the report, staged in `journal` if given (see run_journal)."""
+    os.makedirs(report_dir, exist_ok=True)
+    report_file = os.path.join(report_dir, f"{date_str}-changes.json")
+    write_text(report_file, json.dumps(report, indent=2, ensure_ascii=False), journal)
+    return report_file
+
+
+def price_changes_by_id(report):
+    return {
+        entry["id"]: {"current": entry, "previous_price": entry["old_price"]}
+        for entry in report.get("price_changed", [])
+    }
+
+
+def plot_line(ad):
+    plot = ad.get('plot') or ''
+    return f"\n🌳 {plot}" if plot else ''
+
+
+def render_new_ad(ad):
+    return f"🏠 <b>{ad['title']}</b>\n📍 {ad['location']}\n📏 {ad.get('kvadratura', '')}{plot_line(ad)}\n💶 {ad['price']}\n🔗 <a href='{ad['url']}'>Open</a>"
+
+
+def relisted_unchanged(report):
+    """Relisted ads back at their old price; the others are in price_changed."""
+    return [e for e in report.get("relisted", []) if e["price"] == e["old_price"]]
+
+
+def relisted_line(current):
+    return "\n♻️ Relisted under a new id" if current.get('relisted_from') else ''
+
+
+def render_relisted(ad):
+    return f"🏠 <b>{ad['title']}</b>\n📍 {ad['location']}\n📏 {ad.get('kvadratura', '')}{plot_line(ad)}\n💶 {ad['price']}{relisted_line(ad)}\n🔗 <a href='{ad['url']}'>Open</a>"
+
+
+def render_price_change(current, old_price):
+    return f"🏠 <b>{current['title']}</b>\n📍 {current['location']}\n📏 {current.get('kvadratura', '')}{plot_line(current)}\n💶 <s>{old_price}</s> → <b>{current['price']}</b>{relisted_line(current)}\n🔗 <a href='{current['url']}'>Open</a>"
+
+
+def render_telegram_blocks(new_ads, price_changes, relisted=()):
+    """Yield the message one block at a time, in order.
+
+    A block is one ad; a section header is attached to its first ad so it
+    never ends up alone at the end of a chunk. Blocks are separated by a
+    blank line in the full message. `relisted` are relistings at their old
+    price (see relisted_unchanged); repriced ones are among `price_changes`.
+    """
+    sections = (
+        ("<b>🆕 New ads:</b>", (render_new_ad(ad) for ad in new_ads)),
+        ("<b>♻️ Relisted:</b>", (render_relisted(ad) for ad in relisted)),
+        ("<b>💰 Price changes:</b>", (
+            render_price_change(changes['current'], changes['previous_price'])
+            for changes in price_changes.values())),
+    )
+    for header, blocks in sections:
+        for i, block in enumerate(blocks):
+            yield f"{header}\n{block}" if i == 0 else block
+    if not new_ads and not price_changes and not relisted:
+        yield "No new ads or price changes today."
+
+
+def generate_telegram_message(new_ads, price_changes, relisted=()):
+    message = "\n\n".join(render_telegram_blocks(new_ads, price_changes, relisted))
+    return message + "\n" if new_ads or price_changes or relisted else message
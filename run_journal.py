@@ -0,0 +1,146 @@
+"""Crash-safe commit of the files one daily run writes.
+
+A run stages every file it produces (snapshots, reports, price-history.json,
+relistings.json, Telegram messages) in JOURNAL_DIR instead of writing them
+in place. Each staged file is fsynced. `commit()` then writes the manifest,
+which lists staged file -> target, and marks it committed with an atomic
+rename. That rename is the commit point. Only after it are the files moved
+into place, each with another atomic rename.
+
+The local indexes a run updates as it goes (snapshots.db, price-history.db,
+timeline.db) are registered with `guard()` before they are touched.
+`recover()` runs at the start of the next run:
+
+- committed manifest: the remaining renames are finished (roll forward);
+- no or pending manifest: the staged files are dropped, and so are the
+  guarded indexes, which are rebuilt from the committed files when next
+  opened (roll back).
+
+Either way the committed JSON and its indexes describe the same days.
+
+    python run_journal.py      # recover an interrupted run, if any
+"""
+import json
+import os
+import shutil
+
+JOURNAL_DIR = ".run-journal"
+MANIFEST = "manifest.json"
+INDEX_SUFFIXES = ("", "-wal", "-shm", "-journal")
+
+
+def _fsync_dir(path):
+    if not hasattr(os, "O_DIRECTORY"):  # Windows: directories can't be opened
+        return
+    fd = os.open(path or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_synced(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def replace_synced(src, dst):
+    """os.replace, then fsync the target directory so the rename is durable."""
+    directory = os.path.dirname(dst)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    os.replace(src, dst)
+    _fsync_dir(directory)
+
+
+def write_text(path, text, journal=None):
+    """Write `text` to `path` through `journal`, or right away via a temp file."""
+    data = text.encode("utf-8")
+    if journal is not None:
+        journal.stage(path, data)
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class RunJournal:
+    def __init__(self, path=JOURNAL_DIR):
+        self.path = path
+        self.files = {}  # target -> staged file
+        self.indexes = []
+
+    def _manifest(self, state):
+        tmp = os.path.join(self.path, MANIFEST + ".tmp")
+        manifest = {"state": state, "files": sorted(self.files.items()), "indexes": self.indexes}
+        _write_synced(tmp, json.dumps(manifest, indent=2).encode("utf-8"))
+        replace_synced(tmp, os.path.join(self.path, MANIFEST))
+
+    def begin(self):
+        """Recover whatever an earlier run left behind and open a new journal.
+
+        Returns what recover() did.
+        """
+        recovered = recover(self.path)
+        os.makedirs(self.path)
+        self._manifest("pending")
+        return recovered
+
+    def guard(self, *index_paths):
+        """Have these index databases dropped if the run doesn't commit."""
+        new = [p for p in index_paths if p not in self.indexes]
+        if new:
+            self.indexes.extend(new)
+            self._manifest("pending")
+
+    def stage(self, target, data):
+        target = os.path.normpath(target)
+        staged = self.files.get(target) or os.path.join(self.path, f"{len(self.files):04d}")
+        _write_synced(staged, data)
+        self.files[target] = staged
+
+    def commit(self):
+        """Atomically publish every staged file; returns how many."""
+        self._manifest("committed")
+        _apply(self.files.items())
+        shutil.rmtree(self.path)
+        return len(self.files)
+
+
+def _apply(files):
+    for target, staged in files:
+        if os.path.exists(staged):  # already moved by an earlier attempt otherwise
+            replace_synced(staged, target)
+
+
+def _drop_index(path):
+    for suffix in INDEX_SUFFIXES:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def recover(path=JOURNAL_DIR):
+    """Finish or undo an interrupted run: "rolled forward", "rolled back" or None."""
+    if not os.path.isdir(path):
+        return None
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {"state": "pending", "files": [], "indexes": []}
+    if manifest["state"] == "committed":
+        _apply(manifest["files"])
+        outcome = "rolled forward"
+    else:
+        for index in manifest["indexes"]:
+            _drop_index(index)
+        outcome = "rolled back"
+    shutil.rmtree(path)
+    return outcome
+
+
+if __name__ == "__main__":
+    print(f"Interrupted run {recover()}." if os.path.isdir(JOURNAL_DIR) else "Nothing to recover.")
@@ -0,0 +1,134 @@
+"""Per-run metrics for the daily pipeline, appended to a JSON-lines run log.
+
+    with metrics.stage("fetch"):
+        ...
+    metrics.observe("listing_latency", seconds)
+    metrics.count("listing_requests")
+    count_body("listing", response)  # listing_bytes, or listing_cached_bytes after a 304
+
+`metrics` is process-wide and thread-safe. At the end of a run
+`append_run_log` writes one line to RUN_LOG with, per stage, wall and CPU
+seconds; every counter; count/mean/p50/p90/p99/max for every observed
+series; any extra fields passed in (ads, HTTP cache stats); and peak RSS.
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+RUN_LOG = "run-log.jsonl"
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def ratio(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+class RunMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = datetime.now(timezone.utc)
+        self.stages = {}
+        self.counters = {}
+        self.series = {}
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                "wall": round(time.perf_counter() - wall, 4),
+                "cpu": round(time.process_time() - cpu, 4),
+            }
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, key, value):
+        with self.lock:
+            self.series.setdefault(key, []).append(value)
+
+    @contextmanager
+    def timed(self, key):
+        """Observe the wall time of the block under `key`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(key, time.perf_counter() - started)
+
+    def summary(self, key):
+        values = sorted(self.series.get(key, ()))
+        if not values:
+            return {"n": 0}
+        return {
+            "n": len(values),
+            "mean": round(sum(values) / len(values), 4),
+            **{f"p{q}": round(percentile(values, q), 4) for q in (50, 90, 99)},
+            "max": round(values[-1], 4),
+        }
+
+    def record(self, **extra):
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "stages": self.stages,
+            "counters": dict(sorted(self.counters.items())),
+            "series": {key: self.summary(key) for key in sorted(self.series)},
+            **extra,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+metrics = RunMetrics()
+
+
+def count_body(prefix, response):
+    """Count a response body as `<prefix>_bytes`, or as `<prefix>_cached_bytes`
+    when http_cache answered a 304 with the stored body (nothing downloaded)."""
+    key = f"{prefix}_cached_bytes" if getattr(response, "from_cache", False) else f"{prefix}_bytes"
+    metrics.count(key, len(response.text.encode("utf-8")))
+
+
+def append_run_log(record, path=RUN_LOG):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return path
+
+
+def read_run_log(path=RUN_LOG):
+    """The records in the run log, oldest first; none if there is no log yet."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    return [json.loads(line) for line in lines if line.strip()]
@@ -0,0 +1,83 @@
+"""Named searches: which listing URLs are tracked and where their files live.
+
+searches.json is a list of searches:
+
+    [
+      {"name": "beograd-kuce", "url": "https://www.halooglasi.com/...", "dir": "."},
+      {"name": "novi-sad-stanovi", "url": "https://www.halooglasi.com/..."}
+    ]
+
+Every search gets the layout the repository root has always had, under its
+own `dir` (default searches/<name>): data/, reports/, price-history.json,
+relistings.json, telegram-message.txt and the local snapshots.db /
+price-history.db / timeline.db. The search whose dir is "." therefore keeps using the
+files at the root.
+
+Without searches.json there is one search, "default", for the caller's
+default URL, rooted at ".".
+"""
+import json
+import os
+
+SEARCHES_FILE = "searches.json"
+SEARCH_ROOT = "searches"
+
+
+class Search:
+    def __init__(self, name, url, dir=None):
+        self.name = name
+        self.url = url
+        self.dir = dir if dir is not None else os.path.join(SEARCH_ROOT, name)
+
+    def __repr__(self):
+        return f"Search({self.name!r}, dir={self.dir!r})"
+
+    def path(self, *parts):
+        return os.path.normpath(os.path.join(self.dir, *parts))
+
+    @property
+    def data_dir(self):
+        return self.path("data")
+
+    @property
+    def report_dir(self):
+        return self.path("reports")
+
+    @property
+    def history_file(self):
+        return self.path("price-history.json")
+
+    @property
+    def history_db(self):
+        return self.path("price-history.db")
+
+    @property
+    def store_file(self):
+        return self.path("snapshots.db")
+
+    @property
+    def timeline_db(self):
+        return self.path("timeline.db")
+
+    @property
+    def relistings_file(self):
+        return self.path("relistings.json")
+
+    @property
+    def message_file(self):
+        return self.path("telegram-message.txt")
+
+
+def load_searches(default_url, path=SEARCHES_FILE):
+    """The configured searches, or a single root search for `default_url`."""
+    if not os.path.exists(path):
+        return [Search("default", default_url, ".")]
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    searches = [Search(s["name"], s["url"], s.get("dir")) for s in config]
+    for attr in ("name", "dir"):
+        values = [os.path.normpath(getattr(s, attr)) for s in searches]
+        duplicates = {v for v in values if values.count(v) > 1}
+        if duplicates:
+            raise ValueError(f"{path}: duplicate search {attr}(s): {', '.join(sorted(duplicates))}")
+    return searches
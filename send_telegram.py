@@ -1,80 +1,335 @@
+"""Send the latest report of every search to Telegram.
+
+    python send_telegram.py [--resend]
+
+All chunks go over one keep-alive connection to the Bot API, no faster
+than CHAT_RATE_PER_SEC per chat. A 429 is retried after the `retry_after`
+Telegram asks for; 5xx and network errors are retried with backoff.
+
+The message is rendered block by block and packed into chunks lazily, so
+the first chunk goes out before the rest of the report is formatted.
+
+Delivery is resumable: after every chunk its hash is recorded in SENT_FILE
+under the chat and report name, so rerunning after a failure sends only
+what is missing. --resend ignores that record.
+With several searches (see searches.py) each report is preceded by the
+search's name; all of them share the per-chat rate.
+With alert-rules.json (see alert_rules.py) every chat named by a rule also
+gets the report's ads that its rules match, after the full report.
+TELEGRAM_API points the client elsewhere, e.g. at a local stand-in server.
+"""
+import argparse
 import glob
+import hashlib
+import html
+import http.client
+import itertools
 import json
 import os
-import urllib.error
+import re
+import time
 import urllib.parse
-import urllib.request
 
-from main import generate_telegram_message
+from alert_rules import load_rules, render_alert_blocks
+from ratelimit import TokenBucket
+from report_format import price_changes_by_id, relisted_unchanged, render_telegram_blocks
+from searches import load_searches
 
 CHUNK_LIMIT = 3800
+TELEGRAM_API = os.environ.get("TELEGRAM_API", "https://api.telegram.org")
+CHAT_RATE_PER_SEC = 1.0  # Telegram asks for at most about one message per second per chat
+MAX_RETRIES = 5
+RETRY_BACKOFF_SEC = 1.0
+SENT_FILE = "telegram-sent.json"
+SENT_KEEP = 100  # reports remembered in SENT_FILE
+
+
+TOKEN_RX = re.compile(r"<[^>]*>|&#?\w+;|[^<&]+|[<&]")
+TAG_RX = re.compile(r"<(/?)(\w+)")
+ENTITY_MAX = 10  # room a piece keeps for an entity, which can't be cut
+
+
+def _pack(pieces, limit, sep):
+    """Join pieces with `sep` into strings of at most `limit` chars, in one pass."""
+    parts, size = [], 0
+    for piece in pieces:
+        if parts and size + len(sep) + len(piece) > limit:
+            yield sep.join(parts)
+            parts, size = [], 0
+        size += len(piece) + (len(sep) if parts else 0)
+        parts.append(piece)
+    if parts:
+        yield sep.join(parts)
+
+
+def cut_line(line, limit):
+    """Split one over-long line of HTML between tags and entities.
+
+    Tags open at a cut are closed at the end of the piece and reopened at the
+    start of the next, so every piece is valid on its own. A tag that could
+    not fit in any piece (a link with a very long href) is dropped and its
+    text kept, so no piece is longer than `limit`.
+    """
+    pieces, stack, current = [], [], ""
+
+    def closing():
+        return "".join(f"</{name}>" for name, tag in reversed(stack) if tag)
+
+    for token in TOKEN_RX.findall(line):
+        m = TAG_RX.match(token)
+        opens = m and not m.group(1) and not token.endswith("/>")
+        reopened = "".join(tag for _, tag in stack)
+        if opens and len(reopened) + len(token) + len(closing()) + len(m.group(2)) + 3 + ENTITY_MAX > limit:
+            stack.append((m.group(2), ""))
+            continue
+        # An opening tag must leave room for its own closing tag.
+        while len(current) + len(token) + len(closing()) + (len(m.group(2)) + 3 if opens else 0) > limit:
+            room = limit - len(current) - len(closing())
+            if token[0] not in "<&" and room > 0:
+                current, token = current + token[:room], token[room:]
+            elif current == reopened:
+                break  # an entity longer than ENTITY_MAX; nothing else to do
+            pieces.append(current + closing())
+            current = reopened
+        if opens:
+            stack.append((m.group(2), token))
+        elif m:
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == m.group(2):
+                    if not stack[i][1]:
+                        token = ""  # the closing tag of a dropped tag
+                    del stack[i:]
+                    break
+        current += token
+    pieces.append(current)
+    return pieces
+
+
+def split_block(block, limit=CHUNK_LIMIT):
+    """Pieces of a block that is longer than `limit`: whole lines where possible."""
+    lines = []
+    for line in block.split("\n"):
+        lines.extend(cut_line(line, limit) if len(line) > limit else (line,))
+    return list(_pack(lines, limit, "\n"))
+
+
+def pack_chunks(blocks, limit=CHUNK_LIMIT):
+    """Pack message blocks into chunks of at most `limit` chars.
+
+    Blocks (see report_format.render_telegram_blocks) are consumed lazily and never
+    split unless one is longer than `limit` on its own. Chunks are yielded
+    as soon as they are full.
+    """
+    def pieces():
+        for block in blocks:
+            if len(block) > limit:
+                yield from split_block(block, limit)
+            else:
+                yield block
+
+    return _pack(pieces(), limit, "\n\n")
 
 
 def split_for_telegram(text, limit=CHUNK_LIMIT):
-    paragraphs = text.split("\n\n")
-    chunks = []
-    current = ""
-    for p in paragraphs:
-        candidate = (current + "\n\n" + p) if current else p
-        if len(candidate) <= limit:
-            current = candidate
+    return list(pack_chunks(text.split("\n\n"), limit))
+
+
+class BotClient:
+    """Bot API calls over a single keep-alive HTTP connection."""
+
+    def __init__(self, token, api=TELEGRAM_API, timeout=30):
+        parts = urllib.parse.urlsplit(api)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection)
+        self.host = parts.netloc
+        self.prefix = f"{parts.path.rstrip('/')}/bot{token}/"
+        self.timeout = timeout
+        self.conn = None
+        self.connects = 0
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def call(self, method, params):
+        """POST one API call and return (HTTP status, decoded body)."""
+        data = urllib.parse.urlencode(params).encode()
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = self.connection_class(self.host, timeout=self.timeout)
+                self.connects += 1
+            try:
+                self.conn.request("POST", self.prefix + method, body=data, headers=headers)
+                response = self.conn.getresponse()
+                raw = response.read()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The server dropped the idle connection before reading the request.
+                self.close()
+                if attempt:
+                    raise
+            except (OSError, http.client.HTTPException):
+                self.close()
+                raise
+        if response.will_close:
+            self.close()
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            body = {"ok": False, "description": raw[:200].decode("utf-8", "replace")}
+        return response.status, body
+
+
+def send_chunk(client, chat_id, text, bucket=None, retries=MAX_RETRIES):
+    params = {
+        "chat_id": chat_id,
+        "parse_mode": "HTML",
+        "text": text,
+        "disable_web_page_preview": "true",
+    }
+    for attempt in range(retries + 1):
+        if bucket:
+            bucket.acquire()
+        try:
+            status, body = client.call("sendMessage", params)
+        except (OSError, http.client.HTTPException) as e:
+            if attempt == retries:
+                raise
+            print(f"  network error ({e}), retrying")
+            time.sleep(RETRY_BACKOFF_SEC * 2 ** attempt)
+            continue
+        if body.get("ok"):
+            return body
+        retry_after = (body.get("parameters") or {}).get("retry_after")
+        if status == 429 and retry_after is not None and attempt < retries:
+            print(f"  rate limited, retrying in {retry_after}s")
+            time.sleep(retry_after)
             continue
-        if current:
-            chunks.append(current)
-        while len(p) > limit:
-            chunks.append(p[:limit])
-            p = p[limit:]
-        current = p
-    if current:
-        chunks.append(current)
-    return chunks
-
-
-def send_chunk(token, chat_id, text):
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    data = urllib.parse.urlencode(
-        {
-            "chat_id": chat_id,
-            "parse_mode": "HTML",
-            "text": text,
-            "disable_web_page_preview": "true",
-        }
-    ).encode()
+        if status >= 500 and attempt < retries:
+            time.sleep(RETRY_BACKOFF_SEC * 2 ** attempt)
+            continue
+        raise RuntimeError(f"Telegram API HTTP {status}: {body}")
+
+
+def chunk_hash(chunk):
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+
+def load_sent(key, path=SENT_FILE):
+    """Hashes of the chunks already delivered for `key`, in order."""
     try:
-        with urllib.request.urlopen(url, data=data, timeout=30) as r:
-            body = json.loads(r.read())
-    except urllib.error.HTTPError as e:
-        body = json.loads(e.read())
-        raise RuntimeError(f"Telegram API HTTP {e.code}: {body}")
-    if not body.get("ok"):
-        raise RuntimeError(f"Telegram API error: {body}")
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return state.get(key, [])
 
 
-def main():
-    token = os.environ["TELEGRAM_BOT_TOKEN"]
-    chat_id = os.environ["TELEGRAM_CHAT_ID"]
+def save_sent(key, sent, path=SENT_FILE, keep=SENT_KEEP):
+    """Record `sent` for `key`, keeping the `keep` most recently written keys."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.pop(key, None)
+    state[key] = sent
+    state = dict(list(state.items())[-keep:])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
 
-    reports = sorted(glob.glob("reports/*-changes.json"))
-    if not reports:
-        print("No reports found, nothing to send")
-        return
 
-    with open(reports[-1]) as f:
-        report = json.load(f)
+def deliver(client, chat_id, chunks, rate=CHAT_RATE_PER_SEC, sent_file=SENT_FILE, resend=False,
+            key="", bucket=None):
+    """Send the chunks not yet delivered, in order; returns (sent, skipped).
+
+    `chunks` may be a generator; each chunk is sent as soon as it is
+    produced. Chunk i is skipped if the record for (chat_id, key) says the
+    same text already went out as chunk i. Pass the same `bucket` to
+    consecutive calls for one chat so they share its rate.
+    """
+    key = f"{chat_id}:{key}"
+    sent = [] if resend or not sent_file else load_sent(key, sent_file)
+    bucket = bucket or TokenBucket(rate)
+    count = skipped = 0
+    for i, chunk in enumerate(chunks):
+        digest = chunk_hash(chunk)
+        if i < len(sent) and sent[i] == digest:
+            skipped += 1
+            print(f"  chunk {i + 1} already sent, skipping")
+            continue
+        send_chunk(client, chat_id, chunk, bucket)
+        sent = sent[:i] + [digest]
+        count += 1
+        if sent_file:
+            save_sent(key, sent, sent_file)
+        print(f"  chunk {i + 1} ({len(chunk)} chars) sent")
+    return count, skipped
 
-    new_ads = report.get("added", [])
-    price_changes = {
-        e["id"]: {"current": e, "previous_price": e["old_price"]}
-        for e in report.get("price_changed", [])
-    }
-    message = generate_telegram_message(new_ads, price_changes)
 
-    chunks = split_for_telegram(message)
-    print(f"Sending {len(chunks)} chunk(s), total {len(message)} chars")
-    for i, chunk in enumerate(chunks, 1):
-        send_chunk(token, chat_id, chunk)
-        print(f"  chunk {i}/{len(chunks)} ({len(chunk)} chars) sent")
+def send_alerts(client, routed, key="", resend=False, buckets=None, sent_file=SENT_FILE, title=None):
+    """Send each chat its matches from RuleIndex.route.
 
+    `buckets` maps chats to their TokenBucket and is filled in for new ones.
+    """
+    buckets = {} if buckets is None else buckets
+    for chat, (names, added, price_changes) in routed.items():
+        print(f"Sending {len(added) + len(price_changes)} alert(s) to {chat} ({', '.join(names)})")
+        blocks = render_alert_blocks(names, added, price_changes, title)
+        bucket = buckets.setdefault(chat, TokenBucket(CHAT_RATE_PER_SEC))
+        deliver(client, chat, pack_chunks(blocks), sent_file=sent_file, resend=resend,
+                key=f"{key}:alerts", bucket=bucket)
+
+
+def send_reports(client, chat_id, searches, resend=False, bucket=None, rules=None):
+    """Send the latest report of each search, skipping what already went out.
+
+    With `rules` (a RuleIndex), each report's matches follow it.
+    """
+    bucket = bucket or TokenBucket(CHAT_RATE_PER_SEC)
+    buckets = {chat_id: bucket}
+    for search in searches:
+        reports = sorted(glob.glob(os.path.join(search.report_dir, "*-changes.json")))
+        if not reports:
+            print(f"No reports found for {search.name}, nothing to send")
+            continue
+
+        with open(reports[-1]) as f:
+            report = json.load(f)
+
+        blocks = render_telegram_blocks(
+            report.get("added", []), price_changes_by_id(report), relisted_unchanged(report))
+        key = os.path.basename(reports[-1])
+        if len(searches) > 1:
+            blocks = itertools.chain([f"<b>{html.escape(search.name)}</b>"], blocks)
+            if search.dir != ".":
+                key = f"{search.name}/{key}"
+        # Chunks are rendered while earlier ones are already on their way.
+        chunks = pack_chunks(blocks)
+        print(f"Sending {os.path.relpath(reports[-1])}")
+        sent, skipped = deliver(client, chat_id, chunks, resend=resend, key=key, bucket=bucket)
+        print(f"Sent {sent} chunk(s), {skipped} already sent before")
+        if rules is not None:
+            routed = rules.route(report.get("added", []), price_changes_by_id(report), search.name)
+            send_alerts(client, routed, key, resend, buckets, title=search.name if len(searches) > 1 else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--resend", action="store_true", help="send every chunk, even if sent before")
+    args = parser.parse_args()
+    token = os.environ["TELEGRAM_BOT_TOKEN"]
+    chat_id = os.environ["TELEGRAM_CHAT_ID"]
+
+    client = BotClient(token)
+    try:
+        send_reports(client, chat_id, load_searches(None), resend=args.resend, rules=load_rules())
+    finally:
+        client.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,276 @@
+"""SQLite index over the daily snapshots in data/.
+
+The JSON files in data/ stay the source of truth (they are what the
+workflow commits). This store mirrors them as one row per (date, position)
+with every text field interned in a `strings` table, so the title, location
+and advertiser of an ad that is listed for months are stored once. Day,
+date-range and per-ad queries read only the rows they need.
+
+The store syncs itself from data/ on open, importing only snapshot files it
+hasn't seen or whose content changed (by size, mtime and SHA-1, as
+price_history does for its file), so it can be deleted at any time and
+rebuilt with (files are streamed one ad at a time, see json_stream):
+
+    python snapshot_store.py import
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+from json_stream import iter_array
+
+DATA_DIR = "data"
+STORE_FILE = "snapshots.db"
+
+FIELDS = (
+    "title", "location", "kvadratura", "price", "price_by_surface",
+    "publish_date", "advertiser", "id", "url", "plot",
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS strings (
+    id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS days (
+    date TEXT PRIMARY KEY,
+    ads INTEGER NOT NULL,
+    source_size INTEGER,
+    source_mtime_ns INTEGER,
+    source_sha1 TEXT
+);
+CREATE TABLE IF NOT EXISTS ads (
+    date TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    ad_id TEXT NOT NULL,
+    shape INTEGER NOT NULL,
+    {", ".join(f"{f} INTEGER" for f in FIELDS)},
+    extra TEXT,
+    PRIMARY KEY (date, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ads_by_id ON ads (ad_id, date);
+"""
+
+SOURCE_COLUMNS = {"source_mtime_ns": "INTEGER", "source_sha1": "TEXT"}  # added after source_size
+
+ROW_COLUMNS = "date, pos, ad_id, shape, " + ", ".join(FIELDS) + ", extra"
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def add_missing_columns(db, table, columns):
+    """ALTER an older `table` to have every {name: type} in `columns`."""
+    have = {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+    for name, kind in columns.items():
+        if name not in have:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+
+
+class SnapshotStore:
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        # Everything here can be rebuilt from data/, so trade durability for speed.
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+        add_missing_columns(self.db, "days", SOURCE_COLUMNS)
+        self._ids = None  # value -> id, loaded on first write
+        self._values = {}  # id -> value, filled on demand
+        self._layouts = {}
+
+    def close(self):
+        self.db.close()
+
+    # --- string interning --------------------------------------------------
+
+    def _intern(self, value):
+        if value is None:
+            return None
+        if self._ids is None:
+            self._ids = {v: i for i, v in self.db.execute("SELECT id, value FROM strings")}
+        sid = self._ids.get(value)
+        if sid is None:
+            sid = self.db.execute("INSERT INTO strings (value) VALUES (?)", (value,)).lastrowid
+            self._ids[value] = sid
+            self._values[sid] = value
+        return sid
+
+    def _resolve(self, sids):
+        missing = list({s for s in sids if s is not None and s not in self._values})
+        for i in range(0, len(missing), 900):
+            chunk = missing[i:i + 900]
+            marks = ",".join("?" * len(chunk))
+            self._values.update(self.db.execute(
+                f"SELECT id, value FROM strings WHERE id IN ({marks})", chunk))
+
+    # --- writing ------------------------------------------------------------
+
+    def _encode(self, date, pos, ad):
+        keys = list(ad)
+        extra = {k: ad[k] for k in keys if k not in FIELDS}
+        return (
+            date, pos, str(ad.get("id", "")).strip(), self._intern(",".join(keys)),
+            *(self._intern(ad.get(f)) for f in FIELDS),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    def add_day(self, date, ads, source_size=None, source_sha1=None, source_mtime_ns=None):
+        """Store (or replace) the snapshot for `date`; `ads` may be any iterable.
+
+        The source_* values describe the JSON file the ads came from, for sync.
+        """
+        with self.db:
+            self.db.execute("DELETE FROM ads WHERE date = ?", (date,))
+            count = self.db.executemany(
+                f"INSERT INTO ads ({ROW_COLUMNS}) VALUES ({','.join('?' * (5 + len(FIELDS)))})",
+                (self._encode(date, pos, ad) for pos, ad in enumerate(ads)),
+            ).rowcount
+            self.db.execute(
+                "INSERT OR REPLACE INTO days (date, ads, source_size, source_mtime_ns, source_sha1) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (date, max(count, 0), source_size, source_mtime_ns, source_sha1),
+            )
+
+    def remove_day(self, date):
+        with self.db:
+            self.db.execute("DELETE FROM ads WHERE date = ?", (date,))
+            self.db.execute("DELETE FROM days WHERE date = ?", (date,))
+
+    def sync(self, data_dir=DATA_DIR):
+        """Mirror `data_dir`: import new or changed files, drop deleted ones.
+
+        A file whose size and mtime match the stored ones is skipped unread;
+        otherwise it is hashed, and imported again only if the hash differs.
+        Returns the number of files imported.
+        """
+        files = sorted(os.listdir(data_dir)) if os.path.isdir(data_dir) else []
+        files = [fn for fn in files if fn.endswith(".json")]
+        known = {date: (size, mtime_ns, sha1) for date, size, mtime_ns, sha1 in self.db.execute(
+            "SELECT date, source_size, source_mtime_ns, source_sha1 FROM days")}
+        for date in known.keys() - {fn[:-len(".json")] for fn in files}:
+            self.remove_day(date)
+        imported = 0
+        for fn in files:
+            date = fn[:-len(".json")]
+            path = os.path.join(data_dir, fn)
+            st = os.stat(path)
+            size, mtime_ns, sha1 = known.get(date, (None, None, None))
+            if (size, mtime_ns) == (st.st_size, st.st_mtime_ns) and sha1:
+                continue
+            digest = file_sha1(path)
+            if (size, sha1) == (st.st_size, digest):
+                # Touched (or written by main, or freshly checked out) but unchanged.
+                with self.db:
+                    self.db.execute("UPDATE days SET source_mtime_ns = ? WHERE date = ?",
+                                    (st.st_mtime_ns, date))
+                continue
+            self.add_day(date, iter_array(path), source_size=st.st_size,
+                         source_sha1=digest, source_mtime_ns=st.st_mtime_ns)
+            imported += 1
+        return imported
+
+    # --- reading ------------------------------------------------------------
+
+    def _layout(self, shape):
+        """(key, column) pairs for a shape id; column None means 'in extra'."""
+        layout = self._layouts.get(shape)
+        if layout is None:
+            layout = self._layouts[shape] = [
+                (k, 4 + FIELDS.index(k) if k in FIELDS else None)
+                for k in self._values[shape].split(",")
+            ]
+        return layout
+
+    def _decode(self, rows):
+        rows = rows.fetchall() if not isinstance(rows, list) else rows
+        self._resolve(sid for row in rows for sid in row[3:4 + len(FIELDS)])
+        get = self._values.get
+        out = []
+        for row in rows:
+            layout = self._layout(row[3])
+            if row[-1]:
+                extra = json.loads(row[-1])
+                out.append({k: get(row[c]) if c else extra[k] for k, c in layout})
+            else:
+                out.append({k: get(row[c]) for k, c in layout})
+        return out
+
+    def dates(self):
+        return [d for (d,) in self.db.execute("SELECT date FROM days ORDER BY date")]
+
+    def day(self, date):
+        """The snapshot for `date` as a list of ad dicts ([] if unknown)."""
+        return self._decode(self.db.execute(
+            f"SELECT {ROW_COLUMNS} FROM ads WHERE date = ? ORDER BY pos", (date,)))
+
+    def days(self, start=None, end=None):
+        """Yield (date, ads) for every stored date in [start, end], in order."""
+        for date in self.dates():
+            if (start and date < start) or (end and date > end):
+                continue
+            yield date, self.day(date)
+
+    def ad_history(self, ad_id):
+        """Every (date, ad) row for one ad id, oldest first."""
+        rows = self.db.execute(
+            f"SELECT {ROW_COLUMNS} FROM ads WHERE ad_id = ? ORDER BY date, pos",
+            (str(ad_id).strip(),)).fetchall()
+        return list(zip((r[0] for r in rows), self._decode(rows)))
+
+    def ids_since(self, date):
+        """The set of ad ids listed on `date` or later."""
+        return {ad_id for (ad_id,) in self.db.execute(
+            "SELECT DISTINCT ad_id FROM ads WHERE date >= ?", (date,))}
+
+    def latest_since(self, start, end):
+        """The latest row of every ad listed in [start, end), one per id."""
+        rows = self.db.execute(
+            f"SELECT {ROW_COLUMNS} FROM ads a WHERE date >= ? AND date < ? AND pos = "
+            "(SELECT MIN(pos) FROM ads b WHERE b.date = a.date AND b.ad_id = a.ad_id) AND date = "
+            "(SELECT MAX(date) FROM ads c WHERE c.ad_id = a.ad_id AND c.date >= ? AND c.date < ?) "
+            "ORDER BY a.ad_id", (start, end, start, end)).fetchall()
+        return self._decode(rows)
+
+    def url_map(self):
+        """ad id -> url from the most recent snapshot that lists it."""
+        rows = self.db.execute(
+            "SELECT k.ad_id, (SELECT url FROM ads WHERE ad_id = k.ad_id "
+            "                 ORDER BY date DESC, pos DESC LIMIT 1) "
+            "FROM (SELECT DISTINCT ad_id FROM ads WHERE ad_id != '') k").fetchall()
+        self._resolve(url for _, url in rows)
+        return {ad_id: self._values[url] for ad_id, url in rows if url is not None and self._values[url]}
+
+
+_open_stores = {}
+
+
+def open_store(path=STORE_FILE, data_dir=DATA_DIR):
+    """Return this process's store for `path`, synced from `data_dir` once."""
+    store = _open_stores.get(path)
+    if store is None:
+        store = _open_stores[path] = SnapshotStore(path)
+        store.sync(data_dir)
+    return store
+
+
+def close_stores():
+    """Close every store open_store opened; the next call reopens and resyncs."""
+    while _open_stores:
+        _open_stores.popitem()[1].close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["import"]:
+        sys.exit("usage: python snapshot_store.py import")
+    store = SnapshotStore()
+    n = store.sync()
+    print(f"Imported {n} snapshot(s); store has {len(store.dates())} day(s).")
@@ -0,0 +1,34 @@
+"""Alert rules: loading, and the index giving the same matches as a full scan."""
+import json
+
+import pytest
+
+from alert_rules import Change, Rule, RuleIndex, load_rules
+
+AD = {"id": "1", "title": "Kuća", "location": "Beograd | Opština Zvezdara | Mirijevo",
+      "kvadratura": "100 m2", "price": "145.000\xa0€", "url": "https://example.com/1"}
+
+
+def test_float_prices_are_banded():
+    rule = Rule("cheap", "1", min_price=100000.0, max_price=150000.0)
+    assert rule.bands() == range(10, 16)
+    assert RuleIndex([rule]).route([AD], {}) == {"1": (["cheap"], [AD], {})}
+
+
+def test_index_matches_a_full_scan():
+    rules = [Rule("a", "1", municipality="Zvezdara", max_price=150000.5),
+             Rule("b", "2", min_price=140000, max_price=2e6),
+             Rule("c", "3", municipality=["Voždovac"]),
+             Rule("d", "4", max_price_per_m2=1000)]
+    index = RuleIndex(rules)
+    for price in ("90.000\xa0€", "145.000\xa0€", "150.001\xa0€", None):
+        change = Change("added", dict(AD, price=price))
+        assert sorted(r.name for r in index.candidates(change) if r.matches(change)) == \
+            sorted(r.name for r in rules if r.matches(change))
+
+
+def test_load_rejects_non_numbers(tmp_path):
+    path = tmp_path / "alert-rules.json"
+    path.write_text(json.dumps([{"name": "x", "chat": "1", "max_price": "150000"}]))
+    with pytest.raises(ValueError, match="max_price must be a number"):
+        load_rules(str(path))
@@ -0,0 +1,21 @@
+"""Market district lookups, named the way the other CLIs name them."""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from analytics import DAY_DTYPE, Market  # noqa: E402
+
+
+def market():
+    rows = np.array([(1, 0, 100000.0, 100.0), (2, 1, 50000.0, 80.0)], dtype=DAY_DTYPE)
+    return Market(["2025-01-01"], ["Opština Zvezdara", "Opština Čukarica"], np.zeros(2, dtype=np.int32), rows)
+
+
+@pytest.mark.parametrize("name", ["Opština Zvezdara", "Zvezdara", "opstina zvezdara"])
+def test_district_by_area_key(name):
+    assert market().district_index(name) == 0
+
+
+def test_unknown_district_lists_the_known_ones():
+    with pytest.raises(ValueError, match="Opština Čukarica, Opština Zvezdara"):
+        market().district_index("Nowhere")
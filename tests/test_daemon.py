@@ -0,0 +1,93 @@
+"""Daemon polling against the fixture server, without sending anything."""
+import argparse
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import daemon
+import http_client
+import main
+from benchmarks.fixture_server import LISTING_PATH, FixtureServer
+from benchmarks.fixtures import sample_ads
+from searches import Search
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    monkeypatch.setattr(http_client, "HTTP_CACHE", False)
+    monkeypatch.setattr(http_client, "_thread_local", threading.local())
+    monkeypatch.setattr(main, "DETECT_RELISTINGS", False)
+    ads = sample_ads()
+    monkeypatch.chdir(tmp_path)  # an empty price history: every ad is new
+    server = FixtureServer(ads).start()
+    yield server
+    server.stop()
+
+
+def make_daemon(server, cutoff="13:00"):
+    args = argparse.Namespace(pages=1, interval=300, min_interval=120, max_interval=1800,
+                              cutoff=cutoff, no_send=True, once=True)
+    d = daemon.Daemon.__new__(daemon.Daemon)
+    d.args = args
+    d.searches = [Search("test", server.url + LISTING_PATH + "?cena_d_to=180000&cena_d_unit=4", ".")]
+    d.limiter = None
+    d.rules = None
+    d.last_daily = None
+    d.seed()
+    return d
+
+
+def test_failed_alert_is_found_again(server, monkeypatch):
+    d = make_daemon(server)
+
+    def fail(*args):
+        raise RuntimeError("Telegram is down")
+
+    monkeypatch.setattr(d, "alert", fail)
+    with pytest.raises(RuntimeError):
+        d.poll()
+    assert d.watches[0].seen == {}
+    assert daemon.load_state() == {"seen": {"test": {}}}
+
+    alerted = []
+    monkeypatch.setattr(d, "alert", lambda watch, new, drops: alerted.append(new))
+    assert d.poll()
+    assert alerted and alerted[0]
+    assert set(d.watches[0].seen) >= {ad["id"] for ad in alerted[0]}
+    assert not d.poll()
+
+
+def test_cutoff_is_utc(server):
+    d = make_daemon(server)
+    before = datetime(2099, 2, 3, 12, 59, tzinfo=timezone.utc)
+    after = datetime(2099, 2, 3, 13, 0, tzinfo=timezone.utc)
+    assert not d.daily_due(before)
+    assert d.daily_due(after)
+    d.last_daily = "2099-02-03"
+    assert not d.daily_due(after)
+
+
+def test_daily_run_is_dated_in_utc(server, monkeypatch):
+    monkeypatch.setenv("TZ", "Pacific/Auckland")
+    time.tzset()
+    try:
+        runs = []
+        monkeypatch.setattr(main, "run", lambda: runs.append(main.today_str()))
+        monkeypatch.setattr(daemon, "read_run_log", lambda: [
+            {"date": "2099-02-03", "started": "2099-02-02T13:00:05+00:00"}])
+        d = make_daemon(server)
+        d.client = None
+        d.last_daily = daemon.last_run_date()
+        assert d.last_daily == "2099-02-02"
+
+        due = datetime(2099, 2, 3, 13, 0, 30, tzinfo=timezone.utc)
+        assert d.daily_due(due)
+        d.daily(due)
+        assert runs and d.last_daily == "2099-02-03"
+        assert not d.daily_due(datetime(2099, 2, 3, 23, 0, tzinfo=timezone.utc))
+        assert d.daily_due(datetime(2099, 2, 4, 13, 0, tzinfo=timezone.utc))
+    finally:
+        monkeypatch.undo()
+        time.tzset()
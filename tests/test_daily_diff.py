@@ -0,0 +1,66 @@
+"""Replay the committed snapshots through StateIndex, day by day."""
+import json
+import os
+
+import pytest
+
+from daily_diff import StateIndex, diff_ads, unique_by_id
+from snapshot_store import DATA_DIR, SnapshotStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_DIR = os.path.join(ROOT, "reports")
+
+# Reports that were not written against the snapshot two days back: the
+# first days of the history, and runs that diffed against the day before.
+NOT_TWO_DAYS_BACK = {
+    "2025-06-20", "2025-06-21", "2025-06-22", "2025-06-23", "2025-06-24",
+    "2025-06-25", "2025-07-05", "2025-07-31", "2025-08-01", "2026-03-09",
+    "2026-05-09",
+}
+
+
+@pytest.fixture(scope="module")
+def replay(tmp_path_factory):
+    """[(date, current, StateIndex.diff, diff_ads against two days back)] for every stored day."""
+    store = SnapshotStore(str(tmp_path_factory.mktemp("store") / "snapshots.db"))
+    store.sync(os.path.join(ROOT, DATA_DIR))
+    state = StateIndex(store)
+    dates = store.dates()
+    days = []
+    for i, date in enumerate(dates):
+        current = unique_by_id(store.day(date))
+        base = unique_by_id(store.day(dates[i - 2])) if i >= 2 else {}
+        days.append((date, current, state.diff(date, current), diff_ads(current, base)))
+        state.advance(date, current)
+    store.close()
+    return days
+
+
+def test_state_index_matches_diff_ads(replay):
+    assert len(replay) > 2
+    for date, _, got, expected in replay:
+        assert got == expected, date
+
+
+def removed_pairs(removed):
+    return sorted((str(ad["id"]).strip(), ad["price"]) for ad in removed)
+
+
+def price_triples(price_changed):
+    return sorted((c["id"], c.get("price", c.get("new_price")), c["old_price"]) for c in price_changed)
+
+
+def test_state_index_matches_committed_reports(replay):
+    compared = 0
+    for date, current, (removed, price_changed), _ in replay:
+        path = os.path.join(REPORT_DIR, f"{date}-changes.json")
+        if date in NOT_TWO_DAYS_BACK or not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        # Older reports list ads in the order they were found (ours are by id),
+        # and some kept the last copy of an id listed twice; compare id and price.
+        assert removed_pairs(report["removed"]) == removed_pairs(removed), date
+        assert price_triples(report["price_changed"]) == price_triples(price_changed), date
+        compared += 1
+    assert compared > 300
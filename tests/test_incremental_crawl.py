@@ -0,0 +1,48 @@
+"""main.fetch_current_ads_incremental against the fixture server."""
+import threading
+
+import pytest
+
+import http_client
+import main
+from benchmarks.fixture_server import LISTING_PATH, FixtureServer
+from benchmarks.fixtures import sample_ads
+
+
+@pytest.fixture(autouse=True)
+def no_http_cache(monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_CACHE", False)
+    monkeypatch.setattr(http_client, "_thread_local", threading.local())
+
+
+def crawl(ads, known):
+    server = FixtureServer(ads).start()
+    try:
+        url = server.url + LISTING_PATH + "?" + main.FILTER_URL.split("?", 1)[1]
+        result = main.fetch_current_ads_incremental(known, url)
+    finally:
+        server.stop()
+    return result, server.newest_first
+
+
+def test_changes_below_the_stop_point_are_seen():
+    known = sample_ads()
+    oldest = sorted(known, key=lambda ad: int(ad["id"]))
+    removed, repriced = oldest[0], dict(oldest[1], price="1\xa0€")
+    # An older ad that wasn't listed yesterday keeps the total unchanged.
+    returned = dict(oldest[2], id=str(int(oldest[0]["id"]) - 1))
+    today = [returned if ad is removed else repriced if ad is oldest[1] else ad for ad in known]
+
+    result, newest_first = crawl(today, known)
+    assert result is not None
+    assert [(ad.key, ad.price) for ad in result] == [(ad["id"], ad["price"]) for ad in newest_first]
+    ids = {ad.key for ad in result}
+    assert removed["id"] not in ids and returned["id"] in ids
+    assert next(ad for ad in result if ad.key == repriced["id"]).price == "1\xa0€"
+
+
+def test_short_listing_falls_back_to_full_crawl(monkeypatch):
+    known = sample_ads()
+    monkeypatch.setattr(main, "parse_total_count", lambda html: len(known) + 1)
+    result, _ = crawl(known, known)
+    assert result is None
@@ -0,0 +1,63 @@
+"""Every parsing path against the original full-tree BeautifulSoup parse."""
+import os
+
+import pytest
+
+import listing_parser
+from benchmarks.fixtures import FIXTURE_DIR, LISTING_FIXTURE
+
+FIXTURES = [
+    os.path.join(FIXTURE_DIR, LISTING_FIXTURE),
+    os.path.join(os.path.dirname(__file__), "fixtures", "listing-edge-cases.html"),
+]
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_every_path_matches_full_tree_parse(path):
+    html = read(path)
+    reference = listing_parser.parse_ads_bs4(html, strain=False)
+    assert reference
+    names = set()
+    for name, ads in listing_parser.parity_candidates(html):
+        names.add(name)
+        assert ads == reference, name
+    assert {"bs4", "per-block bs4"} <= names
+
+
+def test_lxml_backend_is_checked():
+    pytest.importorskip("lxml")
+    assert "lxml" in listing_parser.BACKENDS
+
+
+def test_edge_cases():
+    ads = listing_parser.parse_ads_bs4(read(FIXTURES[1]), strain=False)
+    # No title link and a look-alike class are not ads.
+    assert [ad["id"] for ad in ads] == ["5425640000001", "5425640000002", "5425640000005"]
+    assert ads[0]["kvadratura"] == "1234.5 m2"
+    assert ads[0]["location"] == "Beograd | Opština Zvezdara | Mirijevo | "
+    assert ads[1]["price"] is None and ads[1]["kvadratura"] is None
+
+
+def test_check_parity_cli(capsys):
+    assert listing_parser.check_parity(FIXTURES) == 0
+    assert "differs" not in capsys.readouterr().out
+
+
+def test_block_cache_is_keyed_by_base_url(tmp_path, monkeypatch):
+    from http_cache import HttpCache
+
+    html = read(FIXTURES[0])
+    cache = HttpCache(str(tmp_path / "http-cache.db"))
+    assert listing_parser.parse_ads_cached(html, cache) == listing_parser.parse_ads(html)
+    monkeypatch.setattr(listing_parser, "BASE_URL", "http://127.0.0.1:8000")
+    ads = listing_parser.parse_ads_cached(html, cache)
+    assert ads == listing_parser.parse_ads(html)
+    assert all(ad["url"].startswith("http://127.0.0.1:8000/") for ad in ads)
+    assert listing_parser.parse_ads_cached(html, cache) == ads
+    assert cache.stats["block_hits"] == len(ads)
+    cache.close()
@@ -0,0 +1,29 @@
+"""Relisting detection and how relistings reach the report and message."""
+from relistings import Listing, RelistIndex, add_relisted, similarity, split_relisted
+from report_format import generate_telegram_message, price_changes_by_id, relisted_unchanged
+
+AD = {
+    "id": "1", "title": "Kuća sa placem, Mirijevo", "location": "Beograd | Opština Zvezdara | Mirijevo | Matice srpske",
+    "kvadratura": "120 m2", "price": "150.000\xa0€", "url": "https://example.com/1", "plot": "5 ar (~500 m²)",
+}
+
+
+def test_zero_price_never_matches():
+    old = Listing(dict(AD, price="0\xa0€"))
+    assert similarity(Listing(dict(AD, id="2")), old) == 0.0
+
+
+def test_only_ads_no_longer_listed_are_candidates():
+    index = RelistIndex([AD])
+    new = dict(AD, id="2")
+    assert index.match([new]) == {"2": AD}
+    assert index.match([new], active={"1", "2"}) == {}
+
+
+def test_same_price_relisting_is_in_the_message():
+    new = dict(AD, id="2")
+    added, relisted = split_relisted([new], {"2": ("1", AD["price"])})
+    report = add_relisted({"added": added, "removed": [], "price_changed": []}, relisted)
+    assert report["price_changed"] == [] and relisted_unchanged(report) == relisted
+    message = generate_telegram_message(report["added"], price_changes_by_id(report), relisted_unchanged(report))
+    assert "Relisted under a new id" in message and AD["url"] in message
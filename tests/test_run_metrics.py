@@ -0,0 +1,29 @@
+"""Run metrics for listing fetches, with the HTTP cache on."""
+import threading
+
+import http_client
+import main
+from benchmarks.fixture_server import LISTING_PATH, FixtureServer
+from benchmarks.fixtures import sample_ads
+from http_cache import HttpCache
+from run_metrics import metrics
+
+
+def test_cached_bodies_are_not_counted_as_downloaded(monkeypatch, tmp_path):
+    monkeypatch.setattr(http_client, "HTTP_CACHE", True)
+    monkeypatch.setattr(http_client, "_cache", HttpCache(str(tmp_path / "http-cache.db")))
+    monkeypatch.setattr(http_client, "_thread_local", threading.local())
+    server = FixtureServer(sample_ads()).start()
+    url = server.url + LISTING_PATH + "?cena_d_to=180000&cena_d_unit=4"
+    try:
+        metrics.reset()
+        main.fetch_page_html(1, filter_url=url)
+        downloaded = metrics.counters["listing_bytes"]
+        main.fetch_page_html(1, filter_url=url)
+    finally:
+        server.stop()
+        http_client._cache.close()
+    assert server.not_modified == 1
+    assert metrics.counters["listing_requests"] == 2
+    assert metrics.counters["listing_bytes"] == downloaded
+    assert metrics.counters["listing_cached_bytes"] == downloaded
@@ -0,0 +1,93 @@
+"""Delivery against the stand-in Bot API server in benchmarks/."""
+import html
+import re
+import time
+
+import pytest
+
+import send_telegram
+from benchmarks.bench_telegram_delivery import serve
+from send_telegram import BotClient, cut_line, deliver, pack_chunks
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(send_telegram, "RETRY_BACKOFF_SEC", 0.01)
+    server = serve()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def client(server):
+    client = BotClient("TOKEN", api=server.url)
+    yield client
+    client.close()
+
+
+def test_resumes_without_duplicates(server, client, tmp_path):
+    chunks = [f"chunk {i}" for i in range(6)]
+    sent_file = str(tmp_path / "sent.json")
+    server.throttle_every = 3
+    server.fail_text = "chunk 4"
+    with pytest.raises(RuntimeError):
+        deliver(client, "1", chunks, rate=5, sent_file=sent_file)
+    assert [text for _, _, text in server.messages] == chunks[:4]
+
+    server.fail_text = None
+    assert deliver(client, "1", chunks, rate=5, sent_file=sent_file) == (2, 4)
+    assert [text for _, _, text in server.messages] == chunks
+    assert server.requests > len(chunks)  # some were answered with a 429 and retried
+    assert server.connections == 1
+
+
+def test_honours_chat_rate(server, client):
+    deliver(client, "1", [f"chunk {i}" for i in range(4)], rate=5, sent_file=None)
+    times = [t for t, _, _ in server.messages]
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.19
+
+
+def test_resend_ignores_the_record(server, client, tmp_path):
+    sent_file = str(tmp_path / "sent.json")
+    deliver(client, "1", ["a", "b"], rate=0, sent_file=sent_file)
+    assert deliver(client, "1", ["a", "b"], rate=0, sent_file=sent_file) == (0, 2)
+    assert deliver(client, "1", ["a", "b"], rate=0, sent_file=sent_file, resend=True) == (2, 0)
+    assert len(server.messages) == 4
+
+
+def test_first_chunk_goes_out_before_rendering_ends(server, client):
+    rendered = []
+
+    def slow_blocks():
+        for i in range(20):
+            time.sleep(0.01)
+            rendered.append(time.monotonic())
+            yield "x" * 900 + str(i)
+
+    deliver(client, "1", pack_chunks(slow_blocks(), limit=3800), rate=0, sent_file=None)
+    assert len(server.messages) > 1
+    assert server.messages[0][0] < rendered[-1]
+
+
+def text_of(pieces):
+    return html.unescape(re.sub(r"<[^>]*>", "", "".join(pieces)))
+
+
+def test_cut_line_reopens_tags():
+    line = "<b>" + "word " * 30 + "</b> <i>tail &amp; more</i>"
+    pieces = cut_line(line, 40)
+    assert all(len(p) <= 40 for p in pieces)
+    assert all(p.startswith("<b>") and p.endswith("</b>") for p in pieces[:3])
+    assert text_of(pieces) == text_of([line])
+
+
+@pytest.mark.parametrize("line", [
+    '<a href="https://example.com/' + "y" * 80 + '">link text</a> tail',
+    '<b>bold <a href="https://example.com/' + "y" * 80 + '">link</a> more</b>',
+    'abc <a href="https://example.com/' + "y" * 80 + '">' + "long text " * 10 + "</a>",
+])
+def test_cut_line_drops_a_tag_longer_than_the_limit(line):
+    pieces = cut_line(line, 60)
+    assert all(len(p) <= 60 for p in pieces)
+    assert "href" not in "".join(pieces)
+    assert text_of(pieces) == text_of([line])
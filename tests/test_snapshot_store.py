@@ -0,0 +1,53 @@
+"""SnapshotStore.sync against edits to the JSON files in data/."""
+import json
+import os
+import sqlite3
+
+from snapshot_store import SnapshotStore
+
+
+def write_day(data_dir, date, ads):
+    path = os.path.join(data_dir, f"{date}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(ads, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def test_same_size_edit_is_imported_again(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    path = write_day(data_dir, "2024-01-01", [{"id": "1", "price": "100.000 €"}])
+    store = SnapshotStore(str(tmp_path / "snapshots.db"))
+    assert store.sync(str(data_dir)) == 1
+    assert store.sync(str(data_dir)) == 0
+
+    size = os.path.getsize(path)
+    write_day(data_dir, "2024-01-01", [{"id": "1", "price": "900.000 €"}])
+    assert os.path.getsize(path) == size
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert store.sync(str(data_dir)) == 1
+    assert store.day("2024-01-01") == [{"id": "1", "price": "900.000 €"}]
+
+
+def test_touched_file_is_not_imported_again(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    path = write_day(data_dir, "2024-01-01", [{"id": "1"}])
+    store = SnapshotStore(str(tmp_path / "snapshots.db"))
+    store.sync(str(data_dir))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert store.sync(str(data_dir)) == 0
+    assert store.sync(str(data_dir)) == 0
+
+
+def test_store_without_hash_columns_is_migrated(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    path = write_day(data_dir, "2024-01-01", [{"id": "1"}])
+    db_path = str(tmp_path / "snapshots.db")
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE days (date TEXT PRIMARY KEY, ads INTEGER NOT NULL, source_size INTEGER)")
+        db.execute("INSERT INTO days VALUES (?, ?, ?)", ("2024-01-01", 1, os.path.getsize(path)))
+    store = SnapshotStore(db_path)
+    assert store.sync(str(data_dir)) == 1
+    assert store.day("2024-01-01") == [{"id": "1"}]
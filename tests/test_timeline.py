@@ -0,0 +1,41 @@
+"""Timeline events from a run of days, applied the way generate_report does."""
+from daily_diff import diff_ads
+from timeline import Timeline
+
+AD = {"id": "1", "title": "Kuća, Mirijevo", "location": "Beograd | Opština Zvezdara | Mirijevo",
+      "kvadratura": "120 m2", "price": "150.000\xa0€", "url": "https://example.com/1"}
+
+
+def apply_days(timeline, prices):
+    """Apply one day per price of AD, with reports against two days back."""
+    days = []
+    for n, price in enumerate(prices):
+        current = {"1": dict(AD, price=price)}
+        base = days[n - 2] if n >= 2 else {}
+        removed, price_changed = diff_ads(current, base)
+        timeline.apply(f"2025-01-0{n + 1}", current, {"removed": removed, "price_changed": price_changed})
+        days.append(current)
+
+
+def price_events(timeline):
+    return [(e["date"], e["old_price"], e["price"]) for e in timeline.db.execute(
+        "SELECT * FROM events WHERE kind = 'price' ORDER BY date")]
+
+
+def test_old_price_is_the_last_one_seen(tmp_path):
+    timeline = Timeline(str(tmp_path / "timeline.db"))
+    apply_days(timeline, ["150.000\xa0€", "140.000\xa0€", "130.000\xa0€"])
+    assert price_events(timeline) == [
+        ("2025-01-02", "150.000\xa0€", "140.000\xa0€"),
+        ("2025-01-03", "140.000\xa0€", "130.000\xa0€"),
+    ]
+
+
+def test_revert_is_recorded(tmp_path):
+    timeline = Timeline(str(tmp_path / "timeline.db"))
+    apply_days(timeline, ["150.000\xa0€", "140.000\xa0€", "150.000\xa0€", "150.000\xa0€"])
+    assert price_events(timeline) == [
+        ("2025-01-02", "150.000\xa0€", "140.000\xa0€"),
+        ("2025-01-03", "140.000\xa0€", "150.000\xa0€"),
+    ]
+    assert timeline.db.execute("SELECT change_pct FROM events WHERE date = '2025-01-03'").fetchone()[0] > 0
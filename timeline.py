@@ -0,0 +1,319 @@
+"""Per-ad change timelines, queryable without reading snapshots or reports.
+
+    python timeline.py [--search NAME] ad ID
+    python timeline.py [--search NAME] cuts [--municipality NAME] [--days 30] [--min-pct 5]
+    python timeline.py [--search NAME] advertiser NAME [--active]
+    python timeline.py [--search NAME] band MIN MAX [--municipality NAME]
+    python timeline.py [--search NAME] rebuild
+
+timeline.db (one per search, next to snapshots.db) holds one row per ad
+with its latest state and one row per event: listed, price, removed,
+returned (back after a removal) and relisted (a new id for a house seen
+before, see relistings). Secondary indexes cover the usual questions:
+
+- events by ad id, for the timeline of one ad and the ids it was relisted
+  under;
+- events by municipality, kind and date, for "cuts over 5% in Zvezdara in
+  the last 30 days";
+- ads by advertiser, and by municipality and price, for price bands.
+
+generate_report applies each day's report as it is written; a run only
+writes the day's events and the rows of ads that are new, repriced or
+back. Like the other local indexes it is disposable:
+days it hasn't seen (fresh checkout, deleted file, a replay) are applied
+from the snapshot store and reports/ the next time it is opened, and
+`rebuild` starts it over.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from ad import area_key, change_pct, municipality, parse_price
+from daily_diff import ad_key, unique_by_id
+from report_format import REPORT_DIR
+from searches import load_searches
+from snapshot_store import open_store
+
+TIMELINE_DB = "timeline.db"
+PRICE_EVENTS = ("price", "relisted")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ads (
+    ad_id TEXT PRIMARY KEY,
+    area TEXT NOT NULL,
+    advertiser TEXT,
+    title TEXT,
+    location TEXT,
+    price TEXT,
+    price_eur INTEGER,
+    first_seen TEXT NOT NULL,
+    removed_on TEXT,
+    relisted_from TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ads_by_area ON ads (area, price_eur);
+CREATE INDEX IF NOT EXISTS ads_by_price ON ads (price_eur);
+CREATE INDEX IF NOT EXISTS ads_by_advertiser ON ads (advertiser COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ads_by_original ON ads (relisted_from) WHERE relisted_from IS NOT NULL;
+CREATE TABLE IF NOT EXISTS events (
+    ad_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    area TEXT NOT NULL,
+    price TEXT,
+    old_price TEXT,
+    change_pct REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS events_by_ad ON events (ad_id, date, kind);
+CREATE INDEX IF NOT EXISTS events_by_area ON events (area, kind, date);
+CREATE INDEX IF NOT EXISTS events_by_kind ON events (kind, date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+AD_COLUMNS = "ad_id, area, advertiser, title, location, price, price_eur, first_seen, removed_on, relisted_from"
+
+
+class Timeline:
+    def __init__(self, path=TIMELINE_DB):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def last_date(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'last_date'").fetchone()
+        return row[0] if row else None
+
+    def apply(self, date_str, current, report=None):
+        """Record one day: `current` is {id: ad} of its snapshot, `report` its
+        report (without one, relistings and removals aren't recorded).
+
+        Price events compare `current` with the index's own last price, not
+        with the report, whose old prices are from two snapshots back.
+        Applying a day again (a rerun) updates its events.
+        """
+        report = report or {}
+        relisted = {e["id"]: e for e in report.get("relisted", [])}
+        known = {row[0]: row[1:] for row in self.db.execute(
+            "SELECT ad_id, area, price, title, first_seen, removed_on FROM ads")}
+        events = []
+
+        def event(ad_id, kind, area, price=None, old_price=None):
+            pct = change_pct(price, old_price) if old_price is not None else None
+            events.append((ad_id, date_str, kind, area, price, old_price, pct))
+
+        rows = []
+        for ad_id, ad in current.items():
+            area = area_key(municipality(ad.get("location")))
+            known_area, last_price, title, first_seen, removed_on = known.get(
+                ad_id, (None, None, None, date_str, None))
+            if ad_id in relisted:
+                event(ad_id, "relisted", area, ad.get("price"), relisted[ad_id]["old_price"])
+            elif first_seen == date_str:
+                event(ad_id, "listed", area, ad.get("price"))
+            elif removed_on is not None:
+                event(ad_id, "returned", area, ad.get("price"))
+            elif (known_area, last_price, title) == (area, ad.get("price"), ad.get("title")):
+                continue  # most ads: nothing to rewrite
+            elif last_price != ad.get("price"):
+                event(ad_id, "price", area, ad.get("price"), last_price)
+            rows.append((ad_id, area, ad.get("advertiser"), ad.get("title"), ad.get("location"),
+                         ad.get("price"), parse_price(ad.get("price")), date_str,
+                         relisted[ad_id]["relisted_from"] if ad_id in relisted else None))
+        # Reports diff against the snapshot two days back, so a removal shows
+        # up in two reports in a row; the index records it once.
+        removed = []
+        for ad in report.get("removed", []):
+            ad_id = ad_key(ad)
+            if ad_id in current or (ad_id in known and known[ad_id][4] is not None):
+                continue
+            removed.append(ad_id)
+            event(ad_id, "removed", area_key(municipality(ad.get("location"))), ad.get("price"))
+
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO ads (ad_id, area, advertiser, title, location, price, price_eur, "
+                "first_seen, relisted_from) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (ad_id) DO UPDATE SET area = excluded.area, advertiser = excluded.advertiser, "
+                "title = excluded.title, location = excluded.location, price = excluded.price, "
+                "price_eur = excluded.price_eur, first_seen = MIN(first_seen, excluded.first_seen), removed_on = NULL, "
+                "relisted_from = COALESCE(relisted_from, excluded.relisted_from)", rows)
+            self.db.executemany("UPDATE ads SET removed_on = ? WHERE ad_id = ? AND removed_on IS NULL",
+                                ((date_str, ad_id) for ad_id in removed))
+            self.db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", events)
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_date', ?)",
+                            (max(date_str, self.last_date() or date_str),))
+        return len(events)
+
+    def sync(self, store, report_dir=REPORT_DIR, before=None):
+        """Apply the store's days after the last one applied (and before
+        `before`), with their reports; returns how many."""
+        last = self.last_date()
+        days = [d for d in store.dates() if (not last or d > last) and (not before or d < before)]
+        for d in days:
+            report = None
+            path = os.path.join(report_dir, f"{d}-changes.json")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    report = json.load(f)
+            self.apply(d, unique_by_id(store.day(d)), report)
+        return len(days)
+
+    def reset(self):
+        with self.db:
+            for table in ("ads", "events", "meta"):
+                self.db.execute(f"DELETE FROM {table}")
+
+    # --- queries ----------------------------------------------------------------
+
+    def ad(self, ad_id):
+        return self.db.execute(f"SELECT {AD_COLUMNS} FROM ads WHERE ad_id = ?", (ad_id,)).fetchone()
+
+    def events(self, ad_id):
+        return self.db.execute(
+            "SELECT * FROM events WHERE ad_id = ? ORDER BY date, rowid", (ad_id,)).fetchall()
+
+    def timeline(self, ad_id):
+        """[(ad row, its events)] for every id the house was listed under,
+        oldest first; [] if `ad_id` is unknown."""
+        ad = self.ad(str(ad_id).strip())
+        if ad is None:
+            return []
+        seen = {ad["ad_id"]}
+        while ad["relisted_from"] and ad["relisted_from"] not in seen:
+            original = self.ad(ad["relisted_from"])
+            if original is None:
+                break
+            ad = original
+            seen.add(ad["ad_id"])
+        chain = [ad]
+        while True:
+            later = self.db.execute(
+                f"SELECT {AD_COLUMNS} FROM ads WHERE relisted_from = ? ORDER BY first_seen LIMIT 1",
+                (chain[-1]["ad_id"],)).fetchone()
+            if later is None or later["ad_id"] in {a["ad_id"] for a in chain}:
+                break
+            chain.append(later)
+        return [(a, self.events(a["ad_id"])) for a in chain]
+
+    def price_cuts(self, area=None, since=None, min_pct=0):
+        """Price cuts of at least `min_pct` percent (relistings included),
+        newest first."""
+        sql = ("SELECT e.*, a.title, a.location FROM events e JOIN ads a USING (ad_id) "
+               "WHERE e.kind IN (?, ?) AND e.change_pct < 0 AND e.change_pct <= ?")
+        params = [*PRICE_EVENTS, -abs(min_pct)]
+        if area:
+            sql += " AND e.area = ?"
+            params.append(area_key(area))
+        if since:
+            sql += " AND e.date >= ?"
+            params.append(since)
+        return self.db.execute(sql + " ORDER BY e.date DESC, e.change_pct", params).fetchall()
+
+    def by_advertiser(self, advertiser, active=False):
+        sql = f"SELECT {AD_COLUMNS} FROM ads WHERE advertiser = ? COLLATE NOCASE"
+        if active:
+            sql += " AND removed_on IS NULL"
+        return self.db.execute(sql + " ORDER BY first_seen DESC", (advertiser,)).fetchall()
+
+    def in_band(self, low, high, area=None):
+        """Listed ads priced between `low` and `high` euros, cheapest first."""
+        sql = f"SELECT {AD_COLUMNS} FROM ads WHERE price_eur BETWEEN ? AND ? AND removed_on IS NULL"
+        params = [low, high]
+        if area:
+            sql += " AND area = ?"
+            params.append(area_key(area))
+        return self.db.execute(sql + " ORDER BY price_eur", params).fetchall()
+
+
+def open_timeline(search, before=None):
+    """The timeline index of `search`, caught up with its store (up to `before`)."""
+    timeline = Timeline(search.timeline_db)
+    timeline.sync(open_store(search.store_file, data_dir=search.data_dir), search.report_dir, before)
+    return timeline
+
+
+def print_ad(ad):
+    print(f"{ad['ad_id']}  {ad['title']}")
+    status = f"removed {ad['removed_on']}" if ad["removed_on"] else f"listed since {ad['first_seen']}"
+    print(f"  {ad['location']} · {ad['advertiser']} · {ad['price']} · {status}")
+
+
+def print_event(e):
+    line = f"  {e['date']}  {e['kind']:8s}"
+    if e["old_price"]:
+        pct = f" ({e['change_pct']:+.1f}%)" if e["change_pct"] is not None else ""
+        line += f" {e['old_price']} -> {e['price']}{pct}"
+    elif e["price"]:
+        line += f" {e['price']}"
+    print(line)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--search", help="search name from searches.json (default: the first)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ad = commands.add_parser("ad", help="timeline of one ad, across relistings")
+    ad.add_argument("ad_id")
+    cuts = commands.add_parser("cuts", help="price cuts, newest first")
+    cuts.add_argument("--municipality")
+    cuts.add_argument("--days", type=int, default=30, help="look back this many days (0: all)")
+    cuts.add_argument("--min-pct", type=float, default=0, help="smallest cut in percent")
+    advertiser = commands.add_parser("advertiser", help="ads of one advertiser")
+    advertiser.add_argument("name")
+    advertiser.add_argument("--active", action="store_true", help="only ads still listed")
+    band = commands.add_parser("band", help="listed ads in a price band (euros)")
+    band.add_argument("low", type=int)
+    band.add_argument("high", type=int)
+    band.add_argument("--municipality")
+    commands.add_parser("rebuild", help="drop the index and apply every day again")
+    args = parser.parse_args()
+
+    searches = load_searches(None)
+    search = next((s for s in searches if s.name == args.search), None) if args.search else searches[0]
+    if search is None:
+        parser.error(f"unknown search {args.search!r}")
+
+    start = time.perf_counter()
+    if args.command == "rebuild":
+        timeline = Timeline(search.timeline_db)
+        timeline.reset()
+        days = timeline.sync(open_store(search.store_file, data_dir=search.data_dir), search.report_dir)
+        print(f"Applied {days} day(s) in {time.perf_counter() - start:.1f} s.")
+        timeline.close()
+        return
+    timeline = open_timeline(search)
+    start = time.perf_counter()
+    if args.command == "ad":
+        results = timeline.timeline(args.ad_id)
+        for ad, events in results:
+            print_ad(ad)
+            for e in events:
+                print_event(e)
+    elif args.command == "cuts":
+        since = str(date.fromisoformat(timeline.last_date()) - timedelta(days=args.days)) \
+            if args.days and timeline.last_date() else None
+        results = timeline.price_cuts(args.municipality, since, args.min_pct)
+        for e in results:
+            print(f"{e['date']}  {e['change_pct']:+6.1f}%  {e['old_price']} -> {e['price']}  "
+                  f"{e['ad_id']}  {e['title']}")
+    else:
+        if args.command == "advertiser":
+            results = timeline.by_advertiser(args.name, args.active)
+        else:
+            results = timeline.in_band(args.low, args.high, args.municipality)
+        for ad in results:
+            print_ad(ad)
+    print(f"{len(results)} result(s) in {(time.perf_counter() - start) * 1000:.1f} ms")
+    timeline.close()
+
+
+if __name__ == "__main__":
+    main_cli()